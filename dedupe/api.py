@@ -5,13 +5,14 @@ dedupe provides the main user interface for the library the
 Dedupe class
 """
 
+import collections
 import itertools
 import logging
 import pickle
 import multiprocessing
 import warnings
 import os
-import sqlite3
+import random
 import tempfile
 
 import numpy
@@ -34,17 +35,22 @@ from typing import (Mapping,
                     Dict,
                     Union,
                     Generator,
+                    AsyncGenerator,
+                    AsyncIterator,
                     Iterable,
+                    Iterator,
                     Sequence,
                     BinaryIO,
                     cast,
-                    TextIO)
+                    TextIO,
+                    Any)
 from typing_extensions import Literal
 from dedupe._typing import (Data,
                             Clusters,
                             RecordPairs,
                             RecordID,
                             RecordDict,
+                            Record,
                             Blocks,
                             TrainingExample,
                             LookupResults,
@@ -55,20 +61,122 @@ from dedupe._typing import (Data,
 
 logger = logging.getLogger(__name__)
 
+MULTIPROCESSING_ERROR = '''
+                You need to either turn off multiprocessing or protect
+                the calls to the Dedupe methods with a
+                `if __name__ == '__main__'` in your main module, see
+                https://docs.python.org/3/library/multiprocessing.html#the-spawn-and-forkserver-start-methods'''
+
 
 class Matching(object):
     """
     Base Class for Record Matching Classes
     """
 
-    def __init__(self, num_cores: Optional[int], **kwargs) -> None:
+    def __init__(self,
+                 num_cores: Optional[int],
+                 chunk_scheduler: Optional[core.ChunkScheduler] = None,
+                 executor: Optional[core.Executor] = None,
+                 profile: bool = False,
+                 blocking_engine: Optional[blocking.BlockingEngine] = None,
+                 hash_keys: bool = False,
+                 verify_keys: bool = False,
+                 block_limit: Optional[blocking.BlockLimit] = None,
+                 redundancy_free: bool = False,
+                 **kwargs) -> None:
+        """
+        The options every matcher takes as keyword arguments.
+
+        Args:
+            num_cores: the number of cpus to use for parallel
+                       processing. If set to `None`, uses all cpus
+                       available on the machine. If set to 0, then
+                       multiprocessing will be disabled.
+            chunk_scheduler: a :class:`dedupe.core.ChunkScheduler`
+                             that decides how much work to send to
+                             each scoring worker at a time. Defaults
+                             to one that adapts the chunk size to
+                             the speed of scoring. The settings it
+                             chose are in `chunk_scheduler.settings`.
+            executor: a :class:`dedupe.core.Executor` to run
+                      fingerprinting, scoring and clustering on.
+                      Without one, scoring starts `num_cores`
+                      processes for each call, and fingerprinting
+                      runs in this process. Use a
+                      :class:`dedupe.core.ThreadExecutor` or
+                      :class:`dedupe.core.SerialExecutor` where
+                      dedupe can't start processes of its own, or a
+                      :class:`dedupe.core.FuturesExecutor` to share
+                      a :mod:`concurrent.futures` executor.
+            profile: If True, time each field's comparator while
+                     scoring pairs. After :func:`score`, `field_stats`
+                     has, for each field, how many pairs it compared,
+                     how many of them had missing values, and how
+                     long that took, summed over all the scoring
+                     workers.
+            blocking_engine: How to find the pairs of records that
+                             share a block. Defaults to a
+                             :class:`dedupe.blocking.SQLiteStore`;
+                             pass one to choose where its database
+                             goes and how SQLite is tuned. Or a
+                             :class:`dedupe.blocking.SortMerge` to
+                             sort numpy arrays instead of joining in
+                             SQLite. It is usually several times
+                             faster, and spills to disk past a
+                             memory budget. Or a
+                             :class:`dedupe.blocking.SymmetricJoin`
+                             to pair records while they are still
+                             being fingerprinted, so scoring starts
+                             right away, if the blocks fit in memory.
+            hash_keys: If True, the fingerprinter makes 64-bit integer
+                       block keys instead of strings, which makes
+                       the blocking tables several times smaller.
+                       Two different blocks have the same key about
+                       once in 2**64 pairs of keys, which only adds
+                       pairs to score.
+            verify_keys: If True, block keys are hashed as with
+                         `hash_keys`, but the fingerprinter remembers
+                         every key it has hashed, so that keys that
+                         collide get different hashes. This needs
+                         memory for every distinct block key.
+            block_limit: a :class:`dedupe.blocking.BlockLimit` that
+                         splits or drops blocks with too many records
+                         before they are turned into pairs, so that
+                         one common block key can't make blocking
+                         run for hours.
+            redundancy_free: If True, the default SQLite store yields
+                             each pair from the first block, in key
+                             order, that its records share, instead
+                             of deduplicating all the pairs with
+                             SELECT DISTINCT. Pairs start streaming
+                             at once and there is no temporary
+                             B-tree of every pair, but each pair
+                             costs a few more index lookups. The
+                             same as a blocking engine of
+                             `SQLiteStore(redundancy_free=True)`.
+        """
 
         if num_cores is None:
             self.num_cores = multiprocessing.cpu_count()
         else:
             self.num_cores = num_cores
 
+        if chunk_scheduler is None:
+            chunk_scheduler = core.ChunkScheduler()
+        self.chunk_scheduler = chunk_scheduler
+
         self._fingerprinter: Optional[blocking.Fingerprinter] = None
+        self.executor = executor
+        self._pool: Optional[core.ScoringPool] = None
+        self.profile = profile
+        self.field_stats: Dict[str, Dict[str, Any]] = {}
+        if blocking_engine is None:
+            blocking_engine = blocking.SQLiteStore(
+                redundancy_free=redundancy_free)
+        self.blocking_engine: blocking.BlockingEngine = blocking_engine
+        self.hash_keys = hash_keys
+        self.verify_keys = verify_keys
+        self.block_limit = block_limit
         self.data_model: datamodel.DataModel
         self.classifier: Classifier
         self.predicates: List[dedupe.predicates.Predicate]
@@ -82,6 +190,109 @@ class Matching(object):
 
         return self._fingerprinter
 
+    def _init_fingerprinter(self) -> None:
+        self._fingerprinter = blocking.Fingerprinter(
+            self.predicates,
+            hash_keys=self.hash_keys,
+            verify_keys=self.verify_keys)
+
+    def _fingerprint(self,
+                     records: Iterable[Record],
+                     target: bool = False) -> Generator[Tuple[blocking.BlockKey, RecordID], None, None]:
+        '''
+        Fingerprint records on the matcher's executor, or the pool
+        started by :func:`start_pool`, if it has one, and otherwise in
+        this process
+        '''
+        executor = self._executor
+        if executor is not None:
+            yield from self.fingerprinter.parallel(records, executor, target)
+        else:
+            yield from self.fingerprinter(records, target)
+
+    def _engine_pairs(self, pairs: core.IndexPairs) -> core.IndexPairs:
+        '''
+        Yield the pairs of the blocking engine, and reset the indices
+        of the fingerprinter once it doesn't need them. A pipelined
+        engine fingerprints records while its pairs are read, so it
+        needs them until the last pair.
+        '''
+        if not self.blocking_engine.pipelined:
+            self.fingerprinter.reset_indices()
+            yield from pairs
+        else:
+            yield from pairs
+            self.fingerprinter.reset_indices()
+
+    @property
+    def _block_key_type(self) -> str:
+        if self.fingerprinter.hash_keys:
+            return 'integer'
+        else:
+            return 'text'
+
+    @property
+    def _blocking_store(self) -> blocking.BlockingStore:
+        # the store to keep blocking maps in between calls
+        if isinstance(self.blocking_engine, blocking.BlockingStore):
+            return self.blocking_engine
+        return blocking.SQLiteStore()
+
+    @property
+    def _executor(self) -> Optional[core.Executor]:
+        if self._pool is not None:
+            return self._pool
+        return self.executor
+
+    def start_pool(self,
+                   start_method: Optional[str] = None,
+                   preload: Sequence[str] = ('dedupe',)) -> None:
+        """
+        Start a pool of `num_cores` scoring processes that is reused by
+        every call to score, join, partition and search until
+        :func:`close_pool` is called. The data model and classifier
+        are sent to the workers once, when the pool starts, which
+        saves starting new processes for each call.
+
+        The workers keep the data model and classifier they started
+        with, so start the pool after training, and restart it if you
+        train again. While the pool is open, it is used instead of
+        the matcher's `executor`.
+
+        Args:
+            start_method: How to start the workers: 'fork', 'spawn'
+                          or 'forkserver'. Defaults to the platform
+                          default.
+            preload: When the start method is 'forkserver', the
+                     modules to import in the server before it forks
+                     any workers.
+
+        .. code:: python
+
+            > matcher.start_pool(start_method='forkserver')
+            > try:
+            >     for data in batches:
+            >         matcher.search(data)
+            > finally:
+            >     matcher.close_pool()
+
+        """
+        self.close_pool()
+        self._pool = core.ScoringPool(self.data_model,
+                                      self.classifier,
+                                      self.num_cores,
+                                      start_method,
+                                      preload)
+
+    def close_pool(self) -> None:
+        """
+        Shut down the pool started by :func:`start_pool`. Scoring goes
+        back to starting processes for each call.
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
 
 class IntegralMatching(Matching):
     """
@@ -90,7 +301,8 @@ class IntegralMatching(Matching):
     """
 
     def score(self,
-              pairs: RecordPairs) -> numpy.memmap:
+              pairs: RecordPairs,
+              min_score: Optional[float] = None) -> numpy.memmap:
         """
         Scores pairs of records. Returns pairs of tuples of records id and
         associated probabilites that the pair of records are match
@@ -98,21 +310,69 @@ class IntegralMatching(Matching):
         Args:
             pairs: Iterator of pairs of records
 
+            min_score: If set, only pairs that score above
+                       min_score are kept. The pairs are dropped
+                       by the scoring workers, before they are
+                       written out, which can make the results much
+                       smaller. If not set, all pairs are kept.
+
         """
+        profile = self._field_profile()
         try:
             matches = core.scoreDuplicates(pairs,
                                            self.data_model,
                                            self.classifier,
-                                           self.num_cores)
+                                           self.num_cores,
+                                           min_score,
+                                           self.chunk_scheduler,
+                                           self._executor,
+                                           profile)
         except RuntimeError:
-            raise RuntimeError('''
-                You need to either turn off multiprocessing or protect
-                the calls to the Dedupe methods with a
-                `if __name__ == '__main__'` in your main module, see
-                https://docs.python.org/3/library/multiprocessing.html#the-spawn-and-forkserver-start-methods''')
+            raise RuntimeError(MULTIPROCESSING_ERROR)
+
+        self._record_field_stats(profile)
 
         return matches
 
+    def _score_indices(self,
+                       index_pairs: core.IndexPairs,
+                       records: Sequence[Record],
+                       min_score: Optional[float] = None) -> numpy.memmap:
+        """
+        Scores pairs of indices into `records`, a sequence of
+        (record_id, record) tuples. The scoring workers get the
+        records once, so only the indices have to be passed to them.
+
+        The scored pairs are pairs of indices as well, so they need
+        to be mapped back to record ids once we are done with them.
+        """
+        profile = self._field_profile()
+        try:
+            matches = core.scoreIndexedDuplicates(index_pairs,
+                                                  records,
+                                                  self.data_model,
+                                                  self.classifier,
+                                                  self.num_cores,
+                                                  min_score,
+                                                  self.chunk_scheduler,
+                                                  self._executor,
+                                                  profile)
+        except RuntimeError:
+            raise RuntimeError(MULTIPROCESSING_ERROR)
+
+        self._record_field_stats(profile)
+
+        return matches
+
+    def _field_profile(self) -> Optional[core.FieldProfile]:
+        if self.profile:
+            return core.FieldProfile()
+        return None
+
+    def _record_field_stats(self, profile: Optional[core.FieldProfile]) -> None:
+        if profile is not None:
+            self.field_stats = profile.stats
+
 
 class DedupeMatching(IntegralMatching):
     """
@@ -166,10 +426,12 @@ class DedupeMatching(IntegralMatching):
             ((10, 11), (0.899, 0.899))]
 
         """
-        pairs = self.pairs(data)
-        pair_scores = self.score(pairs)
+        records = self._records(data)
+        index_pairs = self._index_pairs(data, records)
+        pair_scores = self._score_indices(index_pairs, records)
         clusters = self.cluster(pair_scores, threshold)
 
+        clusters = self._record_id_clusters(records, clusters)
         clusters = self._add_singletons(data, clusters)
 
         clusters = list(clusters)
@@ -183,6 +445,144 @@ class DedupeMatching(IntegralMatching):
 
         return clusters
 
+    def update_partition(self,
+                         data: Data,
+                         new_data: Data,
+                         clusters: Clusters,
+                         threshold: float = 0.5,
+                         path: Optional[str] = None) -> clustering.ClusterDiff:
+        """
+        Add new records to a partition, without scoring and clustering
+        all the records again.
+
+        Only the pairs of a new record with an old or another new
+        record are scored. The old clusters that a new record matches
+        above the threshold are broken up, and their records are
+        clustered again with the new records. The rest of the
+        partition is kept as it is. The result is close to, but not
+        always the same as, partitioning all the records again, as
+        old clusters that a new record scores only below the
+        threshold with could still have changed.
+
+        Args:
+            data: Dictionary of the records that were partitioned,
+                  where the keys are record_ids and the values are
+                  dictionaries with the keys being field names
+            new_data: Dictionary of new records, in the same form.
+            clusters: The partition of `data`, as :func:`partition`
+                      returns it. Records that aren't in any cluster
+                      are singletons.
+            threshold: Number between 0 and 1 (Default is 0.5), as
+                       for :func:`partition`.
+            path: Where a blocking map of `data` is kept by
+                  :func:`changed_pairs`. If given, only the new
+                  records are fingerprinted, and they are added to
+                  the map. Otherwise, all the records are.
+
+        Returns a :class:`dedupe.clustering.ClusterDiff`, with the
+        whole new partition and how it differs from the old one.
+
+        .. code:: python
+
+           > diff = matcher.update_partition(data, new_data, clusters)
+           > print(diff.merged)
+           [([((1, 2), (0.790, 0.790))],
+             ((1, 2, 8), (0.790, 0.860, 0.790)))]
+
+        """
+        clusters = list(clusters)
+        new_ids = set(new_data)
+        all_data: Data = collections.ChainMap(new_data, data)  # type: ignore
+
+        if path is None:
+            with self._blocking_store.open() as store:
+                # the pairs of just the old records aren't wanted
+                self._update_blocking_map(store, data, set(data), (),
+                                          rebuild=True)
+                pairs = self._update_blocking_map(store, all_data,
+                                                  new_ids, (),
+                                                  rebuild=False)
+                new_scores = self._scores(((a, all_data[a]),
+                                           (b, all_data[b]))
+                                          for a, b in pairs)
+        else:
+            # if the blocking map has to be rebuilt, it makes all pairs
+            new_scores = self._scores(
+                pair for pair in self.changed_pairs(all_data, path,
+                                                    changed=new_ids)
+                if pair[0][0] in new_ids or pair[1][0] in new_ids)
+
+        old_scores = None
+        scores: List[numpy.ndarray] = []
+        try:
+            linked: Set[RecordID] = set()
+            if new_scores is not None:
+                strong = new_scores['pairs'][new_scores['score'] > threshold]
+                linked.update(strong.ravel().tolist())
+                linked -= new_ids
+
+            affected = set()
+            clustered: Set[RecordID] = set()
+            for i, (record_ids, _) in enumerate(clusters):
+                if any(record_id in linked for record_id in record_ids):
+                    affected.add(i)
+                    clustered.update(record_ids)
+            for record_id in linked - clustered:
+                affected.add(len(clusters))
+                clusters.append(((record_id,), (1.0,)))
+
+            old_ids = {record_id
+                       for i in affected
+                       for record_id in clusters[i][0]}
+            members = old_ids | new_ids
+
+            if new_scores is not None:
+                in_members = numpy.array([a in members and b in members
+                                          for a, b
+                                          in new_scores['pairs'].tolist()],
+                                         dtype=bool)
+                scores.append(new_scores[in_members])
+            if len(old_ids) > 1:
+                old_scores = self._scores(self.pairs({record_id: data[record_id]
+                                                      for record_id
+                                                      in old_ids}))
+                if old_scores is not None:
+                    scores.append(old_scores)
+
+            scores = [score for score in scores if len(score)]
+            if scores:
+                member_clusters = self.cluster(numpy.concatenate(scores),
+                                               threshold)
+            else:
+                member_clusters = iter(())
+            member_clusters = list(self._add_singletons(dict.fromkeys(members),
+                                                        member_clusters))
+        finally:
+            mmap_files = [getattr(pair_scores, 'filename', None)
+                          for pair_scores in (new_scores, old_scores)]
+            del new_scores, old_scores, scores
+            for mmap_file in mmap_files:
+                if mmap_file is not None:
+                    os.remove(mmap_file)
+
+        return clustering.clusterDiff(clusters, affected, member_clusters)
+
+    def _scores(self, pairs: RecordPairs) -> Optional[numpy.ndarray]:
+        '''
+        Score pairs of records, or None if there are none
+        '''
+        try:
+            return self.score(pairs)
+        except core.BlockingError:
+            return None
+
+    def _record_id_clusters(self,
+                            records: Sequence[Record],
+                            clusters: Clusters) -> Clusters:
+
+        for indices, scores in clusters:
+            yield tuple(records[i][0] for i in indices), scores  # type: ignore
+
     def _add_singletons(self, data, clusters):
 
         singletons = set(data.keys())
@@ -220,41 +620,204 @@ class DedupeMatching(IntegralMatching):
 
         '''
 
-        self.fingerprinter.index_all(data)
+        records = self._records(data)
 
-        id_type = core.sqlite_id_type(data)
+        for a, b in self._index_pairs(data, records):
+            record_a, record_b = records[a], records[b]
+            # the smaller id goes first, as cluster expects
+            if record_b[0] < record_a[0]:
+                yield record_b, record_a
+            else:
+                yield record_a, record_b
+
+    def changed_pairs(self,
+                      data: Data,
+                      path: str,
+                      changed: Optional[Iterable[RecordID]] = None,
+                      deleted: Iterable[RecordID] = ()) -> RecordPairs:
+        """
+        Like :func:`pairs`, but keeps the blocking map in a database at
+        `path` between calls, and only yields the pairs that involve a
+        changed record. Only the changed records are fingerprinted,
+        so when few records change between runs, this is much faster
+        than blocking all the records again.
+
+        The database is tied to the predicates it was made with. If
+        there isn't one at `path` yet, it was made with different
+        predicates or block keys, or the pairs of a previous call
+        weren't all read, every record counts as changed, and every
+        pair is yielded.
+        The block limit isn't applied.
+
+        Index predicates are indexed with all of `data`, but the
+        block keys of records that didn't change are the ones they
+        had when they were last fingerprinted.
+
+        Args:
+            data: Dictionary of all the records, where the keys are
+                  record_ids and the values are dictionaries with
+                  the keys being field names
+            path: Where to keep the blocking map, for example next
+                  to the settings file
+            changed: The ids of the records in `data` that are new,
+                     or have changed, since the last call. Defaults
+                     to every record.
+            deleted: The ids of the records that have been removed
+                     since the last call.
+
+        .. code:: python
+
+            > pairs = matcher.changed_pairs(data, 'blocks.db',
+            >                               changed=[7], deleted=[3])
+            > print(list(pairs))
+            [((1, {'name' : 'Pat', 'address' : '123 Main'}),
+              (7, {'name' : 'Pat', 'address' : '123 Main'}))
+             ]
+
+        """
+        digest = self.fingerprinter.digest()
+
+        with self._blocking_store.open(path) as store:
+            rebuild = changed is None or store.metadata('predicates') != digest
+            # if this call doesn't finish, the next one starts over
+            store.set_metadata('predicates', '')
+
+            if rebuild:
+                changed_ids = set(data)
+            else:
+                changed_ids = set(changed)  # type: ignore
+
+            pairs = self._update_blocking_map(store, data, changed_ids,
+                                              deleted, rebuild)
+
+            for a, b in pairs:
+                yield (a, data[a]), (b, data[b])
 
-        # Blocking and pair generation are typically the first memory
-        # bottlenecks, so we'll use sqlite3 to avoid doing them in memory
-        with tempfile.TemporaryDirectory() as temp_dir:
-            con = sqlite3.connect(temp_dir + '/blocks.db')
+            # the changes are only done with once all their pairs are
+            store.set_metadata('predicates', digest)
 
-            # Set journal mode to WAL.
-            con.execute('pragma journal_mode=wal')
+    def _update_blocking_map(self,
+                             store: blocking.BlockingStore,
+                             data: Data,
+                             changed_ids: Set[RecordID],
+                             deleted: Iterable[RecordID],
+                             rebuild: bool) -> Iterator[Tuple[RecordID, RecordID]]:
+        '''
+        Fingerprint the changed records into the blocking map of an
+        open store, and return the pairs of record ids, smaller id
+        first, that involve a changed record. If `rebuild`, the map is
+        made from scratch. The map is updated before this returns,
+        and the pairs are only found as they are read.
+        '''
+        key_type = self._block_key_type
+        id_type = core.sqlite_id_type(data)
 
-            con.execute('''CREATE TABLE blocking_map
-                           (block_key text, record_id {id_type})
-                        '''.format(id_type=id_type))
+        changed_records = sorted((record_id, data[record_id])
+                                 for record_id in changed_ids)
 
-            con.executemany("INSERT INTO blocking_map values (?, ?)",
-                            self.fingerprinter(data.items()))
+        if rebuild:
+            store.drop('blocking_map')
+        store.create('blocking_map', key_type, id_type)
+        if not rebuild:
+            store.index('blocking_map', by_record=True)
+            store.delete('blocking_map',
+                         itertools.chain(deleted, changed_ids))
 
+        self.fingerprinter.index_all(data)
+        blocked_ids = self._fingerprint(changed_records)
+        if rebuild:
+            store.insert('blocking_map', blocked_ids)
             self.fingerprinter.reset_indices()
+            store.index('blocking_map', by_record=True)
+            return store.join('blocking_map')
+
+        changed_blocks = list(blocked_ids)
+        self.fingerprinter.reset_indices()
+        store.insert('blocking_map', changed_blocks)
+
+        store.drop('changed_blocking_map')
+        store.create('changed_blocking_map', key_type, id_type,
+                     temporary=True)
+        store.insert('changed_blocking_map', changed_blocks)
+        store.index('changed_blocking_map')
+        return blocking.changedPairs(store.join('changed_blocking_map',
+                                                'blocking_map'),
+                                     changed_ids)
+
+    def blocking_report(self,
+                        data: Data,
+                        sample_size: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Report how many blocks and pairs each predicate would make,
+        and how long it takes to fingerprint with it, without making
+        any pairs. Use it to find a predicate that makes too many pairs
+        before running :func:`pairs` on a large dataset.
 
-            con.execute('''CREATE INDEX block_key_idx
-                           ON blocking_map (block_key)''')
-            pairs = con.execute('''SELECT DISTINCT a.record_id, b.record_id
-                                   FROM blocking_map a
-                                   INNER JOIN blocking_map b
-                                   USING (block_key)
-                                   WHERE a.record_id < b.record_id''')
+        Args:
+            data: Dictionary of records, where the keys are record_ids
+                  and the values are dictionaries with the keys being
+                  field names
+            sample_size: If given, fingerprint only a random sample of
+                         this many records. Pair counts are scaled up
+                         to the whole data, but key counts and block
+                         sizes are those of the sample.
+
+        .. code:: python
+
+            > report = matcher.blocking_report(data)
+            > print(report['predicates'][0])
+            {'predicate': 'SimplePredicate: (wholeFieldPredicate, zip)',
+             'keys': 5126,
+             'block_sizes': {1: 3011, 2: 1460, 4: 602, 8: 53},
+             'largest_blocks': [('60614', 14), ...],
+             'pairs': 21327.0,
+             'distinct_pairs': 20877.5,
+             'seconds': 0.04}
+
+        The report also has the total 'pairs', counted once for each
+        block a pair shares, the estimated number of 'distinct_pairs'
+        that :func:`pairs` would yield, and the total 'seconds'.
+        """
+        records = self._records(data)
+        pair_scale = 1.0
+        if sample_size is not None and sample_size < len(records):
+            n_records = len(records)
+            records = random.sample(records, sample_size)
+            pair_scale = (n_records * (n_records - 1) /
+                          max(sample_size * (sample_size - 1), 1))
+
+        self.fingerprinter.index_all(dict(records))
+        report = blocking.blockingReport(self.fingerprinter,
+                                         records,
+                                         pair_scale=pair_scale)
+        self.fingerprinter.reset_indices()
+
+        return report
+
+    def _records(self, data: Data) -> List[Record]:
+        '''
+        The records in the order of `data`. A record's index in this
+        list is the ordinal it is blocked and scored by.
+        '''
+        return list(data.items())
+
+    def _index_pairs(self,
+                     data: Data,
+                     records: Sequence[Record]) -> core.IndexPairs:
+        '''
+        Yield pairs of indices into `records` for the records that
+        share common fingerprints. The smaller index will be first.
+        '''
+
+        self.fingerprinter.index_all(data)
 
-            for a_record_id, b_record_id in pairs:
-                yield ((a_record_id, data[a_record_id]),
-                       (b_record_id, data[b_record_id]))
+        blocked_ids = self._fingerprint(enumerate(record for _, record
+                                                  in records))
 
-            pairs.close()
-            con.close()
+        pairs = self.blocking_engine.dedupe_pairs(blocked_ids,
+                                                  self.block_limit,
+                                                  records)
+        yield from self._engine_pairs(pairs)
 
     def cluster(self,
                 scores: numpy.ndarray,
@@ -322,7 +885,9 @@ class DedupeMatching(IntegralMatching):
 
         logger.debug("matching done, begin clustering")
 
-        yield from clustering.cluster(scores, threshold)
+        yield from clustering.cluster(scores,
+                                      threshold,
+                                      executor=self._executor)
 
 
 class RecordLinkMatching(IntegralMatching):
@@ -360,52 +925,76 @@ class RecordLinkMatching(IntegralMatching):
             ]
         """
 
-        self.fingerprinter.index_all(data_2)
-
-        id_type_a = core.sqlite_id_type(data_1)
-        id_type_b = core.sqlite_id_type(data_2)
-
-        # Blocking and pair generation are typically the first memory
-        # bottlenecks, so we'll use sqlite3 to avoid doing them in memory
-        with tempfile.TemporaryDirectory() as temp_dir:
-            con = sqlite3.connect(temp_dir + '/blocks.db')
-
-            # Set journal mode to WAL.
-            con.execute('pragma journal_mode=wal')
+        records = self._records(data_1, data_2)
 
-            con.executescript('''CREATE TABLE blocking_map_a
-                                 (block_key text, record_id {id_type_a});
+        for a, b in self._index_pairs(data_1, data_2, records):
+            yield records[a], records[b]
 
-                                 CREATE TABLE blocking_map_b
-                                 (block_key text, record_id {id_type_b});
-                              '''.format(id_type_a=id_type_a,
-                                         id_type_b=id_type_b))
-
-            con.executemany("INSERT INTO blocking_map_a values (?, ?)",
-                            self.fingerprinter(data_1.items()))
+    def blocking_report(self,
+                        data_1: Data,
+                        data_2: Data,
+                        sample_size: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Report how many blocks and pairs each predicate would make,
+        and how long it takes to fingerprint with it, without making
+        any pairs. See :func:`dedupe.Dedupe.blocking_report`.
 
-            con.executemany("INSERT INTO blocking_map_b values (?, ?)",
-                            self.fingerprinter(data_2.items(), target=True))
+        Args:
+            data_1: Dictionary of records from first dataset, where the
+                    keys are record_ids and the values are dictionaries
+                    with the keys being field names
+            data_2: Dictionary of records from second dataset, same
+                    form as data_1
+            sample_size: If given, fingerprint only a random sample of
+                         this many records from each dataset. Pair
+                         counts are scaled up to the whole data.
+        """
+        records_1 = list(data_1.items())
+        records_2 = list(data_2.items())
+        pair_scale = 1.0
+        if sample_size is not None:
+            for records in (records_1, records_2):
+                if sample_size < len(records):
+                    pair_scale *= len(records) / sample_size
+                    records[:] = random.sample(records, sample_size)
+
+        self.fingerprinter.index_all(dict(records_2))
+        report = blocking.blockingReport(self.fingerprinter,
+                                         records_1,
+                                         records_2,
+                                         pair_scale=pair_scale)
+        self.fingerprinter.reset_indices()
 
-            self.fingerprinter.reset_indices()
+        return report
 
-            con.executescript('''CREATE INDEX block_key_a_idx
-                                 ON blocking_map_a (block_key);
+    def _records(self, data_1: Data, data_2: Data) -> List[Record]:
+        return list(itertools.chain(data_1.items(), data_2.items()))
 
-                                 CREATE INDEX block_key_b_idx
-                                 ON blocking_map_b (block_key);''')
+    def _index_pairs(self,
+                     data_1: Data,
+                     data_2: Data,
+                     records: Sequence[Record]) -> core.IndexPairs:
+        '''
+        Yield pairs of indices into `records` for the records that
+        share common fingerprints. The records from data_1 are the
+        first len(data_1) records, and their index will be first.
+        '''
 
-            pairs = con.execute('''SELECT DISTINCT a.record_id, b.record_id
-                                   FROM blocking_map_a a
-                                   INNER JOIN blocking_map_b b
-                                   USING (block_key)''')
+        self.fingerprinter.index_all(data_2)
 
-            for a_record_id, b_record_id in pairs:
-                yield ((a_record_id, data_1[a_record_id]),
-                       (b_record_id, data_2[b_record_id]))
+        offset = len(data_1)
+        records_1 = enumerate(record for _, record
+                              in itertools.islice(records, offset))
+        records_2 = enumerate((record for _, record
+                               in itertools.islice(records, offset, None)),
+                              offset)
 
-            pairs.close()
-            con.close()
+        pairs = self.blocking_engine.link_pairs(
+            self._fingerprint(records_1),
+            self._fingerprint(records_2, target=True),
+            self.block_limit,
+            records)
+        yield from self._engine_pairs(pairs)
 
     def join(self,
              data_1: Data,
@@ -482,8 +1071,12 @@ class RecordLinkMatching(IntegralMatching):
             '%s is an invalid constraint option. Valid options include '
             'one-to-one, many-to-one, or many-to-many' % constraint)
 
-        pairs = self.pairs(data_1, data_2)
-        pair_scores = self.score(pairs)
+        records = self._records(data_1, data_2)
+        index_pairs = self._index_pairs(data_1, data_2, records)
+
+        # every constraint only considers pairs that score above the
+        # threshold, so we can leave the rest out from the start
+        pair_scores = self._score_indices(index_pairs, records, threshold)
 
         if constraint == 'one-to-one':
             links = self.one_to_one(pair_scores, threshold)
@@ -492,7 +1085,8 @@ class RecordLinkMatching(IntegralMatching):
         else:
             links = pair_scores[pair_scores['score'] > threshold]
 
-        links = list(links)
+        links = [((records[a][0], records[b][0]), score)  # type: ignore
+                 for (a, b), score in links]
 
         try:
             mmap_file = pair_scores.filename
@@ -621,7 +1215,12 @@ class GazetteerMatching(Matching):
 
         super().__init__(num_cores, **kwargs)
 
-        self.temp_dir = tempfile.TemporaryDirectory()
+        # the index is kept in a store's database for as long as the
+        # gazetteer, and each call opens a connection to it
+        self.blocking_store = self._blocking_store
+
+        self.temp_dir = tempfile.TemporaryDirectory(
+            dir=self.blocking_store.directory)
 
         self.db = self.temp_dir.name + '/blocks.db'
 
@@ -650,27 +1249,11 @@ class GazetteerMatching(Matching):
 
         id_type = core.sqlite_id_type(data)
 
-        con = sqlite3.connect(self.db)
-
-        # Set journal mode to WAL.
-        con.execute('pragma journal_mode=wal')
-
-        con.execute('''CREATE TABLE IF NOT EXISTS indexed_records
-                       (block_key text,
-                        record_id {id_type},
-                        UNIQUE(block_key, record_id))
-                    '''.format(id_type=id_type))
-
-        con.executemany("REPLACE INTO indexed_records VALUES (?, ?)",
-                        self.fingerprinter(data.items(), target=True))
-
-        con.execute('''CREATE INDEX IF NOT EXISTS
-                       indexed_records_block_key_idx
-                       ON indexed_records
-                       (block_key)''')
-
-        con.commit()
-        con.close()
+        with self.blocking_store.open(self.db) as store:
+            store.create('indexed_records', self._block_key_type, id_type)
+            store.insert('indexed_records',
+                         self._fingerprint(data.items(), target=True))
+            store.index('indexed_records')
 
         self.indexed_data.update(data)
 
@@ -691,13 +1274,8 @@ class GazetteerMatching(Matching):
                                         in data.values()},
                                        field)
 
-        con = sqlite3.connect(self.db)
-        con.executemany('''DELETE FROM indexed_records
-                           WHERE record_id = ?''',
-                        ((k, ) for k in data.keys()))
-
-        con.commit()
-        con.close()
+        with self.blocking_store.open(self.db) as store:
+            store.delete('indexed_records', data.keys())
 
         for k in data:
             del self.indexed_data[k]
@@ -738,38 +1316,32 @@ class GazetteerMatching(Matching):
 
         id_type = core.sqlite_id_type(data)
 
-        con = sqlite3.connect(self.db, check_same_thread=False)
-
-        con.execute('BEGIN')
-
-        con.execute('''CREATE TEMPORARY TABLE blocking_map
-                       (block_key text, record_id {id_type})
-                    '''.format(id_type=id_type))
-        con.executemany("INSERT INTO blocking_map VALUES (?, ?)",
-                        self.fingerprinter(data.items()))
-
-        pairs = con.execute('''SELECT DISTINCT a.record_id, b.record_id
-                               FROM blocking_map a
-                               INNER JOIN indexed_records b
-                               USING (block_key)
-                               ORDER BY a.record_id''')
+        with self.blocking_store.open(self.db) as store:
+            store.create('blocking_map',
+                         self._block_key_type,
+                         id_type,
+                         temporary=True)
+            store.insert('blocking_map',
+                         self._fingerprint(data.items()))
+            store.index('blocking_map')
 
-        pair_blocks = itertools.groupby(pairs,
-                                        lambda x: x[0])
+            pairs = store.join('blocking_map', 'indexed_records',
+                               ordered=True)
 
-        for _, pair_block in pair_blocks:
+            pair_blocks = itertools.groupby(pairs,
+                                            lambda x: x[0])
 
-            yield [((a_record_id, data[a_record_id]),
-                    (b_record_id, self.indexed_data[b_record_id]))
-                   for a_record_id, b_record_id
-                   in pair_block]
+            for _, pair_block in pair_blocks:
 
-        pairs.close()
-        con.execute("ROLLBACK")
-        con.close()
+                yield [((a_record_id, data[a_record_id]),
+                        (b_record_id, self.indexed_data[b_record_id]))
+                       for a_record_id, b_record_id
+                       in pair_block]
 
     def score(self,
-              blocks: Blocks) -> Generator[numpy.ndarray, None, None]:
+              blocks: Blocks,
+              min_score: Optional[float] = None,
+              n_matches: Optional[int] = None) -> Generator[numpy.ndarray, None, None]:
         """
         Scores groups of pairs of records. Yields structured numpy arrays
         representing pairs of records in the group and the associated
@@ -778,15 +1350,66 @@ class GazetteerMatching(Matching):
         Args:
             blocks: Iterator of blocks of records
 
+            min_score: If set, only pairs that score above min_score
+                       are returned.
+
+            n_matches: If set, at most the n_matches highest scoring
+                       pairs of each group are returned.
+
+        Both filters are applied by the scoring workers, so the pairs
+        they drop are never sent back to the main process.
+
         """
 
         matches = core.scoreGazette(blocks,
                                     self.data_model,
                                     self.classifier,
-                                    self.num_cores)
+                                    self.num_cores,
+                                    min_score,
+                                    n_matches,
+                                    self.chunk_scheduler,
+                                    self._executor)
 
         return matches
 
+    async def score_async(self,
+                          blocks: Union[Blocks, AsyncIterator[List]],
+                          min_score: Optional[float] = None,
+                          n_matches: Optional[int] = None) -> AsyncGenerator[numpy.ndarray, None]:
+        """
+        Like :func:`score`, but an asynchronous generator, for use in
+        an asyncio event loop. The blocks are scored on the matcher's
+        pool or executor, if it has one, or else on the event loop's
+        default executor, so the event loop is free while they are
+        scored. Concurrent calls share the same pool.
+
+        Args:
+            blocks: Iterator of blocks of records, or an asynchronous
+                    iterator of them, whose blocks are scored as they
+                    arrive
+
+            min_score: If set, only pairs that score above min_score
+                       are returned.
+
+            n_matches: If set, at most the n_matches highest scoring
+                       pairs of each group are returned.
+
+        .. code:: python
+
+            > async for scored_block in matcher.score_async(blocks):
+            >     print(scored_block)
+
+        """
+
+        async for scored_pairs in core.scoreGazetteAsync(blocks,
+                                                         self.data_model,
+                                                         self.classifier,
+                                                         self._executor,
+                                                         min_score,
+                                                         n_matches,
+                                                         self.chunk_scheduler):
+            yield scored_pairs
+
     def many_to_n(self,
                   score_blocks: Iterable[numpy.ndarray],
                   threshold: float = 0.0,
@@ -873,7 +1496,7 @@ class GazetteerMatching(Matching):
 
         """
         blocks = self.blocks(data)
-        pair_scores = self.score(blocks)
+        pair_scores = self.score(blocks, threshold, n_matches)
         search_results = self.many_to_n(pair_scores, threshold, n_matches)
 
         results = self._format_search_results(data, search_results)
@@ -883,6 +1506,60 @@ class GazetteerMatching(Matching):
         else:
             return list(results)
 
+    async def search_async(self,
+                           data: Data,
+                           threshold: float = 0.0,
+                           n_matches: int = 1) -> AsyncGenerator[Tuple[RecordID, Tuple[Tuple[RecordID, float], ...]], None]:
+        """
+        Like :func:`search` with `generator=True`, but an asynchronous
+        generator, for use in an asyncio event loop. The blocks of
+        `data` are looked up on the event loop's default executor, a
+        few at a time, and scored like :func:`score_async` as soon as
+        they are found, so the event loop is never blocked. Matches are yielded as soon as they are
+        scored, and the records in `data` without any matches come
+        last.
+
+        Args:
+            data: a dictionary of records from a messy
+                  dataset, where the keys are record_ids and
+                  the values are dictionaries with the keys
+                  being field names.
+
+            threshold: a number between 0 and 1. We will only return
+                       matches with a predicted probability of being
+                       a duplicate above the threshold.
+
+            n_matches: the maximum number of possible matches from
+                       canonical_data to return for each record in
+                       data. If set to `None` all possible
+                       matches above the threshold will be
+                       returned. Defaults to 1
+
+        .. code:: python
+
+            > async for record_id, matches in gazetteer.search_async(data):
+            >     print(record_id, matches)
+            1 ((6, 0.72), (8, 0.6))
+
+        """
+        blocks = core.readBlocksAsync(self.blocks(data),
+                                      self.chunk_scheduler)
+
+        seen: Set[RecordID] = set()
+
+        async for scored_block in self.score_async(blocks,
+                                                   threshold,
+                                                   n_matches):
+            for result in self.many_to_n([scored_block],
+                                         threshold,
+                                         n_matches):
+                a, matches = self._format_search_result(result)
+                yield a, matches
+                seen.add(a)
+
+        for k in (data.keys() - seen):
+            yield k, ()
+
     def _format_search_results(self,
                                search_d: Data,
                                results: Links) -> LookupResults:
@@ -890,21 +1567,25 @@ class GazetteerMatching(Matching):
         seen: Set[RecordID] = set()
 
         for result in results:
-            a: Optional[RecordID] = None
-            b: RecordID
-            score: float
-            prepared_result: List[Tuple[RecordID, float]] = []
-            for (a, b), score in result:  # type: ignore
-                prepared_result.append((b, score))
-
-            assert a is not None
-
-            yield a, tuple(prepared_result)
+            a, matches = self._format_search_result(result)
+            yield a, matches
             seen.add(a)
 
         for k in (search_d.keys() - seen):
             yield k, ()
 
+    def _format_search_result(self, result) -> Tuple[RecordID, Tuple[Tuple[RecordID, float], ...]]:
+        a: Optional[RecordID] = None
+        b: RecordID
+        score: float
+        prepared_result: List[Tuple[RecordID, float]] = []
+        for (a, b), score in result:
+            prepared_result.append((b, score))
+
+        assert a is not None
+
+        return a, tuple(prepared_result)
+
 
 class StaticMatching(Matching):
     """
@@ -925,6 +1606,10 @@ class StaticMatching(Matching):
                        available on the machine. If set to 0, then
                        multiprocessing will be disabled.
 
+        Any other keyword arguments, like `executor` or
+        `blocking_engine`, set how the matcher blocks and scores, and
+        are documented in :class:`dedupe.api.Matching`.
+
         .. warning::
 
             If using multiprocessing on Windows or Mac OS X, then
@@ -953,7 +1638,7 @@ class StaticMatching(Matching):
         for predicate in self.predicates:
             logger.info(predicate)
 
-        self._fingerprinter = blocking.Fingerprinter(self.predicates)
+        self._init_fingerprinter()
 
 
 class ActiveMatching(Matching):
@@ -977,6 +1662,10 @@ class ActiveMatching(Matching):
                        available on the machine. If set to 0, then
                        multiprocessing will be disabled.
 
+        Any other keyword arguments, like `executor` or
+        `blocking_engine`, set how the matcher blocks and scores, and
+        are documented in :class:`dedupe.api.Matching`.
+
         .. warning::
 
             If using multiprocessing on Windows or Mac OS X, then
@@ -1057,7 +1746,7 @@ class ActiveMatching(Matching):
 
         self.predicates = self.active_learner.learn_predicates(
             recall, index_predicates)
-        self._fingerprinter = blocking.Fingerprinter(self.predicates)
+        self._init_fingerprinter()
         self.fingerprinter.reset_indices()
 
     def write_training(self, file_obj: TextIO) -> None:  # pragma: no cover
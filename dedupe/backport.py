@@ -8,5 +8,8 @@ if platform.system() == 'Darwin':
     Process = ctx.Process  # type: ignore
     Pool = ctx.Pool
     SimpleQueue = ctx.SimpleQueue
+    Lock = ctx.Lock
+    Value = ctx.Value
+    Array = ctx.Array
 else:
-    from multiprocessing import Process, Pool, Queue, SimpleQueue  # type: ignore # noqa 
+    from multiprocessing import Process, Pool, Queue, SimpleQueue, Lock, Value, Array  # type: ignore # noqa 
@@ -1,18 +1,37 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
-from collections import defaultdict
+from collections import defaultdict, Counter
+import array
+import collections.abc
+import copy
+import functools
+import hashlib
+import itertools
 import logging
+import os
+import random
+import sqlite3
+import tempfile
 import time
 
-from typing import Generator, Tuple, Iterable, Dict, List, Union
-from dedupe._typing import Record, RecordID, Data
+from typing import (Generator, Tuple, Iterable, Iterator, Dict, List, Union,
+                    Optional, Callable, Sequence, Set, Any)
+from dedupe._typing import Record, RecordDict, RecordID, Data
+
+import numpy
 
 import dedupe.predicates
+from dedupe import core
 
 logger = logging.getLogger(__name__)
 
 Docs = Union[Iterable[str], Iterable[Iterable[str]]]
+BlockKey = Union[str, int]
+
+# how many records to send to a worker at a time when fingerprinting
+# in parallel
+CHUNK_SIZE = 10000
 
 
 def index_list():
@@ -22,10 +41,31 @@ def index_list():
 class Fingerprinter(object):
     '''Takes in a record and returns all blocks that record belongs to'''
 
-    def __init__(self, predicates: List[dedupe.predicates.Predicate]) -> None:
+    def __init__(self,
+                 predicates: List[dedupe.predicates.Predicate],
+                 hash_keys: bool = False,
+                 verify_keys: bool = False) -> None:
 
         self.predicates = predicates
 
+        self.hash_keys = hash_keys or verify_keys
+        '''
+        If True, block keys are 64-bit integers hashed from the
+        predicate and the key it returned, instead of strings
+        '''
+
+        self.verify_keys = verify_keys
+        '''
+        If True, the fingerprinter remembers which key each hash came
+        from, and gives a key that collides with an earlier one a
+        different hash. This keeps distinct blocks apart, at the cost
+        of holding every distinct key in memory.
+        '''
+
+        self.key_hashes: Dict[Tuple[int, str], int] = {}
+        self.hashed_keys: Dict[int, Tuple[int, str]] = {}
+        self.collisions = 0
+
         self.index_fields: Dict[str,
                                 Dict[str,
                                      List[dedupe.predicates.IndexPredicate]]]
@@ -47,10 +87,11 @@ class Fingerprinter(object):
 
     def __call__(self,
                  records: Iterable[Record],
-                 target: bool = False) -> Generator[Tuple[str, RecordID], None, None]:
+                 target: bool = False) -> Generator[Tuple[BlockKey, RecordID], None, None]:
         '''
         Generate the predicates for records. Yields tuples of (predicate,
-        record_id).
+        record_id). The predicates are strings, or integers if
+        `hash_keys` is set.
 
         Args:
             records: A sequence of tuples of (record_id,
@@ -85,6 +126,10 @@ class Fingerprinter(object):
 
         '''
 
+        if self.hash_keys:
+            yield from self._hashed(records, target)
+            return
+
         start_time = time.perf_counter()
         predicates = [(':' + str(i), predicate)
                       for i, predicate
@@ -103,6 +148,131 @@ class Fingerprinter(object):
                             {'iteration': i,
                              'elapsed': time.perf_counter() - start_time})
 
+    def _hashed(self,
+                records: Iterable[Record],
+                target: bool) -> Generator[Tuple[int, RecordID], None, None]:
+
+        start_time = time.perf_counter()
+        predicates = [(predicateSalt(i), predicate)
+                      for i, predicate
+                      in enumerate(self.predicates)]
+
+        for i, record in enumerate(records):
+            record_id, instance = record
+
+            for salt, predicate in predicates:
+                block_keys = predicate(instance, target=target)
+                if self.verify_keys:
+                    for block_key in block_keys:
+                        yield self._verifiedHash(salt, block_key), record_id
+                else:
+                    for block_key in block_keys:
+                        yield blockHash(salt, block_key), record_id
+
+            if i and i % 10000 == 0:
+                logger.info('%(iteration)d, %(elapsed)f2 seconds',
+                            {'iteration': i,
+                             'elapsed': time.perf_counter() - start_time})
+
+    def _verifiedHash(self, salt: bytes, block_key: str) -> int:
+        '''
+        The hash of a block key, probing for another hash if a
+        different key already has it
+        '''
+        key = (int.from_bytes(salt, 'little'), block_key)
+        try:
+            return self.key_hashes[key]
+        except KeyError:
+            pass
+
+        key_hash = blockHash(salt, block_key)
+        probe = 0
+        while key_hash in self.hashed_keys:
+            probe += 1
+            self.collisions += 1
+            logger.warning('Block key %r collided with %r',
+                           key, self.hashed_keys[key_hash])
+            key_hash = blockHash(salt, block_key, probe)
+
+        self.key_hashes[key] = key_hash
+        self.hashed_keys[key_hash] = key
+
+        return key_hash
+
+    def parallel(self,
+                 records: Iterable[Record],
+                 executor: core.Executor,
+                 target: bool = False,
+                 chunk_size: int = CHUNK_SIZE) -> Generator[Tuple[BlockKey, RecordID], None, None]:
+        '''
+        Like calling the fingerprinter, but the records are
+        fingerprinted on `executor`, `chunk_size` records at a time,
+        and the blocks are yielded in the same order.
+
+        Index predicates can't be used by the workers, since they
+        need the index, and canopies depend on the order records are
+        seen in. So the index predicates of every record are found
+        first, in this process, and the workers get the answers with
+        the predicates. That needs a second pass over `records`, so
+        it is turned into a list if it isn't a collection already.
+
+        Args:
+            records: A sequence of tuples of (record_id,
+                     record_dict)
+            executor: a :class:`dedupe.core.Executor` to fingerprint
+                      chunks of records on
+            target: see :meth:`__call__`
+            chunk_size: how many records to send to a worker at a time
+        '''
+
+        if self.index_predicates:
+            if not isinstance(records, collections.abc.Collection):
+                records = list(records)
+
+            for predicate in self.index_predicates:
+                predicate.resolve((record for _, record in records),
+                                  target=target)
+
+        # the workers can't share the hashes of verified keys, so
+        # they make string keys and the keys are hashed here
+        worker = copy.copy(self)
+        worker.hash_keys = self.hash_keys and not self.verify_keys
+        worker.verify_keys = False
+        worker.key_hashes = {}
+        worker.hashed_keys = {}
+
+        fingerprint = functools.partial(_fingerprintChunk,
+                                        FingerprinterState(worker),
+                                        target)
+
+        start_time = time.perf_counter()
+        n_records = 0
+
+        chunk_keys = executor.imap(fingerprint,
+                                   core.chunks(records,
+                                               itertools.repeat(chunk_size),
+                                               list))
+
+        for keys, record_ids, counts in chunk_keys:
+            blocked_ids = zip(keys,
+                              itertools.chain.from_iterable(
+                                  itertools.repeat(record_id, count)
+                                  for record_id, count
+                                  in zip(record_ids, counts)))
+
+            if self.verify_keys:
+                for block_key, record_id in blocked_ids:
+                    key, pred_id = block_key.rsplit(':', 1)
+                    yield (self._verifiedHash(predicateSalt(int(pred_id)), key),
+                           record_id)
+            else:
+                yield from blocked_ids
+
+            n_records += len(record_ids)
+            logger.info('%(iteration)d, %(elapsed)f2 seconds',
+                        {'iteration': n_records,
+                         'elapsed': time.perf_counter() - start_time})
+
     def reset_indices(self) -> None:
         '''
         Fingeprinter indicdes can take up a lot of memory. If you are
@@ -112,6 +282,14 @@ class Fingerprinter(object):
         for predicate in self.index_predicates:
             predicate.reset()
 
+    def digest(self) -> str:
+        '''
+        A digest of the predicates and of how block keys are made,
+        which changes whenever a record's block keys could.
+        '''
+        settings = repr((self.predicates, self.hash_keys))
+        return hashlib.sha1(settings.encode()).hexdigest()
+
     def index(self,
               docs: Docs,
               field: str) -> None:
@@ -188,6 +366,70 @@ class Fingerprinter(object):
             self.index(unique_fields, field)
 
 
+class FingerprinterState(core.WorkerState):
+    '''
+    A fingerprinter, packaged like a WorkerState so that a worker
+    process unpickles it once for all the chunks it fingerprints
+    '''
+    def __init__(self, fingerprinter: Fingerprinter):
+        super().__init__(fingerprinter, None)
+
+    @property
+    def fingerprinter(self) -> Fingerprinter:
+        return self.data_model
+
+
+ChunkKeys = Tuple[Union[List[str], array.array], List[RecordID], List[int]]
+
+
+def _fingerprintChunk(state: FingerprinterState,
+                      target: bool,
+                      records: List[Record]) -> ChunkKeys:
+    '''
+    The block keys of a chunk of records, with the ids of the records
+    that have keys and how many keys each has. Sending each record id
+    once, instead of with every one of its keys, and hashed keys as
+    an array, makes the keys much cheaper to send back.
+    '''
+    fingerprinter = state.fingerprinter
+
+    keys: Union[List[str], array.array]
+    if fingerprinter.hash_keys:
+        keys = array.array('q')
+    else:
+        keys = []
+
+    record_ids: List[RecordID] = []
+    counts: List[int] = []
+
+    for block_key, record_id in fingerprinter(records, target=target):
+        keys.append(block_key)  # type: ignore
+        if record_ids and record_ids[-1] == record_id:
+            counts[-1] += 1
+        else:
+            record_ids.append(record_id)
+            counts.append(1)
+
+    return keys, record_ids, counts
+
+
+def predicateSalt(i: int) -> bytes:
+    return i.to_bytes(hashlib.blake2b.SALT_SIZE, 'little')
+
+
+def blockHash(salt: bytes, block_key: str, probe: int = 0) -> int:
+    '''
+    A signed 64-bit hash of a block key, salted with its predicate.
+    Unlike hash(), it is the same in every process, so keys can be
+    hashed by workers and stored between runs.
+    '''
+    key_hash = hashlib.blake2b(block_key.encode('utf-8'),
+                               digest_size=8,
+                               salt=salt,
+                               person=probe.to_bytes(8, 'little'))
+    return int.from_bytes(key_hash.digest(), 'little', signed=True)
+
+
 def extractIndices(index_fields):
 
     indices = []
@@ -200,3 +442,1298 @@ def extractIndices(index_fields):
         indices.append((index_type, index, preprocess))
 
     return indices
+
+
+def blockingReport(fingerprinter: Fingerprinter,
+                   records_1: Sequence[Record],
+                   records_2: Optional[Sequence[Record]] = None,
+                   pair_scale: float = 1.0,
+                   n_probes: int = 1000) -> Dict[str, Any]:
+    '''
+    How many blocks and pairs each predicate of a fingerprinter makes,
+    and how long it takes, without making any pairs.
+
+    With only `records_1`, the records are blocked to be deduplicated,
+    and with `records_2` as well, to link the two. The predicates'
+    indices need to have been built already.
+
+    Pairs are counted from block sizes, so a pair that shares more
+    than one block is counted once for each. To estimate how many
+    distinct pairs there are, up to `n_probes` records of `records_1`
+    are chosen at random and fingerprinted first, and then every
+    other record that shares a block with each of them is counted.
+    Pair counts are multiplied by `pair_scale`, so that the counts of
+    a sample can be scaled to the whole data.
+    '''
+    predicates = fingerprinter.predicates
+    sides = [records_1] if records_2 is None else [records_1, records_2]
+
+    # the blocks of the probe records, so we can find who else is in
+    # them as the records go by
+    probes = random.sample(range(len(records_1)),
+                           min(n_probes, len(records_1)))
+    owners: Dict[Tuple[int, BlockKey], List[int]] = defaultdict(list)
+    for probe in probes:
+        _, record = records_1[probe]
+        for i, predicate in enumerate(predicates):
+            for block_key in set(predicate(record)):
+                owners[i, block_key].append(probe)
+
+    block_sizes: List[List[Counter]] = [[Counter() for _ in predicates]
+                                        for _ in sides]
+    seconds = [0.0] * len(predicates)
+    degrees: List[Counter] = [Counter() for _ in predicates]
+    degree: Counter = Counter()
+
+    for side, records in enumerate(sides):
+        target = side == 1
+        # when linking, probes only count records of the other side
+        match_probes = records_2 is None or target
+
+        for ordinal, (_, record) in enumerate(records):
+            neighbors: set = set()
+            for i, predicate in enumerate(predicates):
+                start_time = time.perf_counter()
+                block_keys = set(predicate(record, target=target))
+                seconds[i] += time.perf_counter() - start_time
+
+                block_sizes[side][i].update(block_keys)
+
+                if match_probes:
+                    predicate_neighbors: set = set()
+                    for block_key in block_keys:
+                        predicate_neighbors.update(owners.get((i, block_key), ()))
+                    if records_2 is None:
+                        predicate_neighbors.discard(ordinal)
+                    degrees[i].update(predicate_neighbors)
+                    neighbors |= predicate_neighbors
+
+            degree.update(neighbors)
+
+    def distinctPairs(probe_degree: Counter) -> float:
+        if not probes:
+            return 0.0
+        mean_degree = sum(probe_degree.values()) / len(probes)
+        if records_2 is None:
+            return pair_scale * len(records_1) * mean_degree / 2
+        return pair_scale * len(records_1) * mean_degree
+
+    predicate_reports = []
+    for i, predicate in enumerate(predicates):
+        sizes: Counter = Counter()
+        for side_sizes in block_sizes:
+            sizes.update(side_sizes[i])
+
+        if records_2 is None:
+            n_pairs = sum(size * (size - 1) // 2 for size in sizes.values())
+        else:
+            sizes_1, sizes_2 = block_sizes[0][i], block_sizes[1][i]
+            n_pairs = sum(size * sizes_2[block_key]
+                          for block_key, size in sizes_1.items())
+
+        predicate_reports.append(
+            {'predicate': str(predicate),
+             'keys': len(sizes),
+             'block_sizes': sizeHistogram(sizes.values()),
+             'largest_blocks': sizes.most_common(5),
+             'pairs': pair_scale * n_pairs,
+             'distinct_pairs': distinctPairs(degrees[i]),
+             'seconds': seconds[i]})
+
+    return {'records': [len(records) for records in sides],
+            'predicates': predicate_reports,
+            'pairs': sum(report['pairs'] for report in predicate_reports),
+            'distinct_pairs': distinctPairs(degree),
+            'seconds': sum(seconds)}
+
+
+def sizeHistogram(sizes: Iterable[int]) -> Dict[int, int]:
+    '''
+    How many blocks there are of each size, in powers of two, so 4
+    counts the blocks with 4 to 7 records
+    '''
+    histogram: Counter = Counter(1 << (size.bit_length() - 1)
+                                 for size in sizes)
+    return dict(sorted(histogram.items()))
+
+
+BlockedIds = Iterable[Tuple[BlockKey, RecordID]]
+IndexPairs = Iterator[Tuple[int, int]]
+
+# the dtype of a row of the blocking map, a hashed block key and the
+# ordinal of a record that has it. The side says which dataset the
+# record is from, when linking two datasets
+KEY_ROW = numpy.dtype([('key', 'i8'), ('side', 'u1'), ('id', 'i8')])
+
+# the ordinals of the records in a block, each with the side of the
+# link it's from
+BlockMembers = List[Tuple[int, int]]
+
+
+class BlockLimit(object):
+    '''
+    Keeps a block that is too big, like the block of every record
+    whose first token is "the", from turning into more pairs than can
+    be scored.
+
+    A block with more than `max_size` records is split into sub-blocks,
+    one for each key that one of the `sub_predicates` gives its
+    records, so two records stay together only if they also agree on
+    a sub-predicate. Sub-blocks that are still too big, and every
+    oversized block if there are no sub-predicates, are dropped.
+    Every oversized block is logged, and recorded in `actions`.
+
+    Args:
+        max_size: the most records a block can have
+        sub_predicates: predicates to split oversized blocks with,
+                        for example some of the predicates the
+                        learner didn't choose. They can't be index
+                        predicates.
+    '''
+
+    def __init__(self,
+                 max_size: int,
+                 sub_predicates: Sequence[dedupe.predicates.Predicate] = ()):
+        for full_predicate in sub_predicates:
+            for predicate in full_predicate:
+                if hasattr(predicate, 'index'):
+                    raise ValueError('Oversized blocks are split after the '
+                                     'indices are reset, so sub-predicates '
+                                     'cannot be index predicates')
+
+        self.max_size = max_size
+        self.sub_predicates = list(sub_predicates)
+        self.actions: List[Dict[str, Any]] = []
+
+    def split(self,
+              block_key: BlockKey,
+              members: BlockMembers,
+              records: Sequence[Record]) -> Dict[BlockKey, BlockMembers]:
+        '''
+        The sub-blocks of an oversized block that are small enough to
+        keep, by their block keys. Records from the second side of a
+        link are fingerprinted as targets.
+        '''
+        sub_blocks: Dict[BlockKey, BlockMembers] = defaultdict(list)
+        for ordinal, side in members:
+            _, record = records[ordinal]
+            for key in self.sub_keys(block_key, record, side):
+                sub_blocks[key].append((ordinal, side))
+
+        kept = {key: sub_block for key, sub_block in sub_blocks.items()
+                if 1 < len(sub_block) <= self.max_size}
+        dropped = sum(len(sub_block) > self.max_size
+                      for sub_block in sub_blocks.values())
+
+        action = {'block_key': block_key,
+                  'size': len(members),
+                  'sub_blocks': len(kept),
+                  'dropped_sub_blocks': dropped}
+        self.actions.append(action)
+
+        if self.sub_predicates:
+            logger.info('Block %(block_key)r has %(size)d records, split '
+                        'it into %(sub_blocks)d sub-blocks and dropped '
+                        '%(dropped_sub_blocks)d sub-blocks that were '
+                        'still too big', action)
+        else:
+            logger.info('Block %(block_key)r has %(size)d records, '
+                        'dropped it', action)
+
+        return kept
+
+    def sub_keys(self,
+                 block_key: BlockKey,
+                 record: RecordDict,
+                 side: int = 0) -> List[BlockKey]:
+        '''
+        The keys of the sub-blocks of `block_key` that `record` is in.
+        '''
+        keys: List[BlockKey] = []
+        for i, predicate in enumerate(self.sub_predicates):
+            for sub_key in predicate(record, target=bool(side)):
+                if isinstance(block_key, int):
+                    keys.append(blockHash(predicateSalt(i),
+                                          '%d|%s' % (block_key, sub_key)))
+                else:
+                    keys.append('%s|%s:%d' % (block_key, sub_key, i))
+
+        return keys
+
+    def limit_rows(self,
+                   rows: numpy.ndarray,
+                   records: Sequence[Record]) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        '''
+        Split the oversized blocks in KEY_ROW rows sorted by key.
+        Returns the rows of the blocks that were small enough, and
+        the sorted rows of the sub-blocks of the ones that weren't.
+        '''
+        starts, sizes = blockStarts(rows['key'])
+        oversized = sizes > self.max_size
+        if not oversized.any():
+            return rows, rows[:0]
+
+        sub_rows: List[Tuple[BlockKey, int, int]] = []
+        for start, size in zip(starts[oversized].tolist(),
+                               sizes[oversized].tolist()):
+            block = rows[start:start + size]
+            members = list(zip(block['id'].tolist(), block['side'].tolist()))
+            sub_blocks = self.split(int(block['key'][0]), members, records)
+            sub_rows.extend((key, side, ordinal)
+                            for key, sub_block in sub_blocks.items()
+                            for ordinal, side in sub_block)
+
+        sub_array = numpy.array(sub_rows, KEY_ROW)
+        sub_array = sub_array[numpy.argsort(sub_array['key'], kind='stable')]
+
+        return rows[~numpy.repeat(oversized, sizes)], sub_array
+
+
+class SortMerge(object):
+    '''
+    Turns blocked record ordinals into pairs of records that share a
+    block, by sorting instead of with a SQLite self-join.
+
+    The block keys are hashed to 64-bit integers, if the fingerprinter
+    hasn't already hashed them, and collected with the record ordinals
+    into numpy arrays. Sorting them by key puts the records of each
+    block next to each other, so the pairs can be made a block at a
+    time. A pair can share more than one block, so the pairs are
+    packed into 64-bit integers and sorted as well, to drop the
+    repeats.
+
+    When the rows don't fit in `memory_budget` bytes, sorted runs of
+    them are written to `temp_dir`, and merged a range of keys at a
+    time.
+
+    Distinct block keys only collide in their hashes once in about
+    2**64 pairs of keys. When they do, the records of the two blocks
+    are paired with each other, which adds pairs to score but never
+    loses one.
+
+    Args:
+        memory_budget: About how many bytes of rows and pairs to hold
+                       in memory at once.
+        temp_dir: Where to write sorted runs that don't fit in memory.
+                  Defaults to the system's temporary directory.
+    '''
+
+    pipelined = False
+
+    def __init__(self,
+                 memory_budget: int = 256 * 1024 * 1024,
+                 temp_dir: Optional[str] = None):
+        self.memory_budget = memory_budget
+        self.temp_dir = temp_dir
+
+    @property
+    def _max_rows(self) -> int:
+        # sorting needs room for the indices and a sorted copy too
+        return max(self.memory_budget // (3 * KEY_ROW.itemsize), 2 ** 16)
+
+    @property
+    def _max_pairs(self) -> int:
+        return max(self.memory_budget // (3 * 8), 2 ** 16)
+
+    def dedupe_pairs(self,
+                     blocked_ids: BlockedIds,
+                     block_limit: Optional[BlockLimit] = None,
+                     records: Sequence[Record] = ()) -> IndexPairs:
+        '''
+        Pairs of the ordinals of records that share a block, smaller
+        ordinal first, each pair once. The blocked ids are all read
+        before this returns, so anything the fingerprinter needed can
+        be freed as soon as it does.
+
+        If there is a `block_limit`, oversized blocks are split or
+        dropped. Splitting them needs the `records` the ordinals are
+        positions in.
+        '''
+        temp_dir = tempfile.TemporaryDirectory(dir=self.temp_dir)
+
+        rows = SortedRuns(self._max_rows, temp_dir.name, 'rows')
+        for chunk in keyRows(blocked_ids, 0, self._max_rows):
+            rows.add(chunk)
+        rows.finish()
+
+        return self._pairs(temp_dir, rows, dedupeBlockPairs,
+                           block_limit, records)
+
+    def link_pairs(self,
+                   blocked_ids_1: BlockedIds,
+                   blocked_ids_2: BlockedIds,
+                   block_limit: Optional[BlockLimit] = None,
+                   records: Sequence[Record] = ()) -> IndexPairs:
+        '''
+        Pairs of the ordinals of a record from the first dataset and a
+        record from the second dataset that share a block, each pair
+        once. A `block_limit` works as for :meth:`dedupe_pairs`, and
+        counts the records of both datasets.
+        '''
+        temp_dir = tempfile.TemporaryDirectory(dir=self.temp_dir)
+
+        rows = SortedRuns(self._max_rows, temp_dir.name, 'rows')
+        for side, blocked_ids in enumerate((blocked_ids_1, blocked_ids_2)):
+            for chunk in keyRows(blocked_ids, side, self._max_rows):
+                rows.add(chunk)
+        rows.finish()
+
+        return self._pairs(temp_dir, rows, linkBlockPairs,
+                           block_limit, records)
+
+    def _pairs(self,
+               temp_dir: tempfile.TemporaryDirectory,
+               rows: 'SortedRuns',
+               block_pairs: Callable[[numpy.ndarray, int], Iterator[numpy.ndarray]],
+               block_limit: Optional[BlockLimit],
+               records: Sequence[Record]) -> IndexPairs:
+        with temp_dir:
+            pairs = SortedRuns(self._max_pairs, temp_dir.name, 'pairs')
+            for key_range in rows.ranges():
+                if block_limit is not None:
+                    key_range, sub_rows = block_limit.limit_rows(key_range,
+                                                                 records)
+                    for codes in block_pairs(sub_rows, self._max_pairs):
+                        pairs.add(codes)
+
+                for codes in block_pairs(key_range, self._max_pairs):
+                    pairs.add(codes)
+            rows.close()
+            pairs.finish()
+
+            for codes in pairs.ranges():
+                codes = distinctSorted(codes)
+                yield from zip((codes >> 32).tolist(),
+                               (codes & 0xffffffff).tolist())
+            pairs.close()
+
+
+class SymmetricJoin(object):
+    '''
+    Turns blocked record ordinals into pairs of records that share a
+    block while the records are still being fingerprinted, so scoring
+    can start as soon as the first pair is found.
+
+    The records seen so far are kept in a dictionary from block key
+    to the ordinals in that block. Each record's keys are looked up
+    in it before the record is added, and the record is paired with
+    every record it finds. A pair is made when the later of its two
+    records arrives, so each pair is made once, without a DISTINCT.
+    When linking, the two datasets are fingerprinted in turns, and
+    each record is looked up in the other dataset's dictionary.
+
+    The dictionaries hold every block key, in memory, until the last
+    pair is made. For data whose blocks don't fit in memory, use
+    :class:`SortMerge` or the SQLite default.
+
+    A `block_limit` can't know how big a block will be until all of
+    its records have arrived, so instead a block stops growing once
+    it has `max_size` records. The records already in it have been
+    paired with each other, and are moved to its sub-blocks. Records
+    that arrive afterwards are only paired with records in the same
+    sub-block. Sub-blocks that fill up stop growing, and so do full
+    blocks if there are no sub-predicates.
+    '''
+
+    pipelined = True
+
+    def dedupe_pairs(self,
+                     blocked_ids: BlockedIds,
+                     block_limit: Optional[BlockLimit] = None,
+                     records: Sequence[Record] = ()) -> IndexPairs:
+        '''
+        Pairs of the ordinals of records that share a block, smaller
+        ordinal first, each pair once. The blocked ids have to be in
+        order of ordinal, as the fingerprinter makes them, and are
+        read as the pairs are.
+
+        If there is a `block_limit`, splitting full blocks needs the
+        `records` the ordinals are positions in.
+        '''
+        blocks: Dict[BlockKey, List[int]] = {}
+        join = _JoinState(block_limit, records)
+        for ordinal, keys in recordKeys(blocked_ids):
+            neighbors = join.add(ordinal, keys, blocks, blocks)
+            yield from ((neighbor, ordinal) for neighbor in sorted(neighbors))
+
+    def link_pairs(self,
+                   blocked_ids_1: BlockedIds,
+                   blocked_ids_2: BlockedIds,
+                   block_limit: Optional[BlockLimit] = None,
+                   records: Sequence[Record] = ()) -> IndexPairs:
+        '''
+        Pairs of the ordinals of a record from the first dataset and a
+        record from the second dataset that share a block, each pair
+        once. The two blocked ids are read a record at a time, in
+        turns, so they have to come from independent iterators. A
+        `block_limit` works as for :meth:`dedupe_pairs`, and counts
+        the records of both datasets.
+        '''
+        blocks: Tuple[Dict[BlockKey, List[int]], ...] = ({}, {})
+        join = _JoinState(block_limit, records)
+        sides = itertools.zip_longest(recordKeys(blocked_ids_1),
+                                      recordKeys(blocked_ids_2))
+        for record_1, record_2 in sides:
+            if record_1 is not None:
+                ordinal, keys = record_1
+                neighbors = join.add(ordinal, keys, blocks[0], blocks[1])
+                yield from ((ordinal, neighbor)
+                            for neighbor in sorted(neighbors))
+            if record_2 is not None:
+                ordinal, keys = record_2
+                neighbors = join.add(ordinal, keys, blocks[1], blocks[0],
+                                     side=1)
+                yield from ((neighbor, ordinal)
+                            for neighbor in sorted(neighbors))
+
+
+class _JoinState(object):
+    '''
+    The full blocks of a :class:`SymmetricJoin`, and the block limit
+    and records to split them with.
+    '''
+
+    def __init__(self,
+                 block_limit: Optional[BlockLimit],
+                 records: Sequence[Record]):
+        self.block_limit = block_limit
+        self.records = records
+        # full block keys, and whether their records are moved to
+        # sub-blocks instead of being dropped
+        self.full: Dict[BlockKey, bool] = {}
+        self.sub_keys: Set[BlockKey] = set()
+
+    def add(self,
+            ordinal: int,
+            keys: Iterable[BlockKey],
+            own: Dict[BlockKey, List[int]],
+            other: Dict[BlockKey, List[int]],
+            side: int = 0) -> Set[int]:
+        '''
+        Add a record to the blocks of its side, and return the
+        ordinals of the records of the other side that it shares a
+        block with. When deduping, both sides are the same blocks.
+        '''
+        keys = set(keys)
+        if self.block_limit is not None:
+            keys = self._limit(keys, ordinal, own, other, side)
+
+        neighbors: Set[int] = set()
+        for key in keys:
+            members = other.get(key)
+            if members:
+                neighbors.update(members)
+
+        for key in keys:
+            own.setdefault(key, []).append(ordinal)
+
+        return neighbors
+
+    def _limit(self,
+               keys: Set[BlockKey],
+               ordinal: int,
+               own: Dict[BlockKey, List[int]],
+               other: Dict[BlockKey, List[int]],
+               side: int) -> Set[BlockKey]:
+        assert self.block_limit is not None
+
+        limited: Set[BlockKey] = set()
+        pending = list(keys)
+        while pending:
+            key = pending.pop()
+            if key not in self.full:
+                size = len(own.get(key, ()))
+                if other is not own:
+                    size += len(other.get(key, ()))
+                if size >= self.block_limit.max_size:
+                    self._fill(key, own, other, side)
+
+            split = self.full.get(key)
+            if split is None:
+                limited.add(key)
+            elif split:
+                _, record = self.records[ordinal]
+                pending.extend(self.block_limit.sub_keys(key, record, side))
+
+        return limited
+
+    def _fill(self,
+              key: BlockKey,
+              own: Dict[BlockKey, List[int]],
+              other: Dict[BlockKey, List[int]],
+              side: int) -> None:
+        assert self.block_limit is not None
+
+        split = bool(self.block_limit.sub_predicates and
+                     key not in self.sub_keys)
+        self.full[key] = split
+
+        sides = [(own.pop(key, []), own, side)]
+        if other is not own:
+            sides.append((other.pop(key, []), other, 1 - side))
+
+        sub_blocks = 0
+        if split:
+            new_keys: Set[BlockKey] = set()
+            for members, blocks, members_side in sides:
+                for member in members:
+                    _, record = self.records[member]
+                    for sub_key in self.block_limit.sub_keys(key,
+                                                             record,
+                                                             members_side):
+                        blocks.setdefault(sub_key, []).append(member)
+                        new_keys.add(sub_key)
+            self.sub_keys.update(new_keys)
+            sub_blocks = len(new_keys)
+
+        action = {'block_key': key,
+                  'size': sum(len(members) for members, _, _ in sides),
+                  'sub_blocks': sub_blocks,
+                  'dropped_sub_blocks': 0}
+        self.block_limit.actions.append(action)
+
+        if split:
+            logger.info('Block %(block_key)r is full at %(size)d records, '
+                        'split later records into its %(sub_blocks)d '
+                        'sub-blocks', action)
+        else:
+            logger.info('Block %(block_key)r is full at %(size)d records, '
+                        'later records are not added to it', action)
+
+
+def recordKeys(blocked_ids: BlockedIds) -> Iterator[Tuple[int, List[BlockKey]]]:
+    '''
+    Group blocked ids, which come a record at a time, into each
+    record's ordinal and block keys.
+    '''
+    for ordinal, group in itertools.groupby(blocked_ids, key=lambda x: x[1]):
+        yield ordinal, [key for key, _ in group]
+
+
+class BlockingStore(object):
+    '''
+    Where the blocking map, the table of the block keys of each
+    record, is kept while the pairs of records that share a block are
+    found. Records' blocked ids are inserted into a table, the table
+    is indexed, and joined with itself, or with the table of the other
+    dataset, to find the pairs.
+
+    A store as constructed only holds its settings. :meth:`open` gives
+    an open copy of it, with tables of its own, so one store can be
+    shared by many matchers and calls. :meth:`dedupe_pairs` and
+    :meth:`link_pairs` make any store usable as a blocking engine;
+    subclasses implement the table operations.
+    '''
+
+    pipelined = False
+    directory: Optional[str] = None
+
+    def open(self, path: Optional[str] = None) -> 'BlockingStore':
+        '''
+        An open copy of the store. Its tables are kept at `path`, if
+        given, and otherwise in a temporary place in `directory`
+        that is removed when the copy is closed.
+        '''
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> 'BlockingStore':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def create(self,
+               table: str,
+               key_type: str = 'text',
+               id_type: str = 'integer',
+               temporary: bool = False) -> None:
+        '''
+        Create a table of (block_key, record_id) rows, each row at
+        most once, if there isn't one already.
+        '''
+        raise NotImplementedError
+
+    def insert(self,
+               table: str,
+               blocked_ids: BlockedIds) -> None:
+        '''
+        Insert blocked ids into a table. Rows it already has are
+        skipped.
+        '''
+        raise NotImplementedError
+
+    def index(self, table: str, by_record: bool = False) -> None:
+        '''
+        Make whatever indices :meth:`join` needs, once the rows are
+        inserted. If `by_record`, also make sure that deleting a
+        record's rows doesn't read the whole table.
+        '''
+        raise NotImplementedError
+
+    def drop(self, table: str) -> None:
+        '''
+        Drop a table, if there is one.
+        '''
+        raise NotImplementedError
+
+    def metadata(self, key: str) -> Optional[str]:
+        '''
+        A value saved with :meth:`set_metadata`, if there is one.
+        '''
+        raise NotImplementedError
+
+    def set_metadata(self, key: str, value: str) -> None:
+        '''
+        Save a value with the tables, like the settings they were
+        made with.
+        '''
+        raise NotImplementedError
+
+    def delete(self, table: str, record_ids: Iterable[RecordID]) -> None:
+        '''
+        Delete every row of some records from a table.
+        '''
+        raise NotImplementedError
+
+    def join(self,
+             table_a: str,
+             table_b: Optional[str] = None,
+             ordered: bool = False) -> Iterator[Tuple[RecordID, RecordID]]:
+        '''
+        The pairs of the ids of records that share a block, each pair
+        once. Without a `table_b`, the table is joined with itself,
+        and the smaller id is first. If `ordered`, the pairs come in
+        order of their first id.
+        '''
+        raise NotImplementedError
+
+    def oversized(self, tables: Sequence[str], max_size: int) -> List[BlockKey]:
+        '''
+        The keys of the blocks with more than `max_size` rows, summed
+        over `tables`.
+        '''
+        raise NotImplementedError
+
+    def pop_block(self, table: str, block_key: BlockKey) -> List[RecordID]:
+        '''
+        Delete the rows of a block from a table, and return their
+        record ids.
+        '''
+        raise NotImplementedError
+
+    def limit_blocks(self,
+                     tables: Sequence[str],
+                     block_limit: BlockLimit,
+                     records: Sequence[Record]) -> None:
+        '''
+        Split or drop the blocks in `tables`, one for each side of a
+        link, that have more records than `block_limit` allows.
+        '''
+        for block_key in self.oversized(tables, block_limit.max_size):
+            members: BlockMembers = []
+            for side, table in enumerate(tables):
+                members.extend((int(record_id), side) for record_id
+                               in self.pop_block(table, block_key))
+
+            sub_blocks = block_limit.split(block_key, members, records)
+            for side, table in enumerate(tables):
+                self.insert(table,
+                            ((sub_key, record_id)
+                             for sub_key, sub_block in sub_blocks.items()
+                             for record_id, member_side in sub_block
+                             if member_side == side))
+
+    def dedupe_pairs(self,
+                     blocked_ids: BlockedIds,
+                     block_limit: Optional[BlockLimit] = None,
+                     records: Sequence[Record] = ()) -> IndexPairs:
+        '''
+        Pairs of the ordinals of records that share a block, smaller
+        ordinal first, each pair once. The blocked ids are all read
+        before this returns. A `block_limit` works as for
+        :meth:`SortMerge.dedupe_pairs`.
+        '''
+        return self._pairs([blocked_ids], block_limit, records)
+
+    def link_pairs(self,
+                   blocked_ids_1: BlockedIds,
+                   blocked_ids_2: BlockedIds,
+                   block_limit: Optional[BlockLimit] = None,
+                   records: Sequence[Record] = ()) -> IndexPairs:
+        '''
+        Pairs of the ordinals of a record from the first dataset and a
+        record from the second dataset that share a block, each pair
+        once.
+        '''
+        return self._pairs([blocked_ids_1, blocked_ids_2],
+                           block_limit,
+                           records)
+
+    def _pairs(self,
+               sides: List[BlockedIds],
+               block_limit: Optional[BlockLimit],
+               records: Sequence[Record]) -> IndexPairs:
+        tables = ['blocking_map_' + 'ab'[side] for side in range(len(sides))]
+
+        store = self.open()
+        try:
+            for table, blocked_ids in zip(tables, sides):
+                first, blocked_ids = core.peek(blocked_ids)  # type: ignore
+                store.create(table, keyType(first))
+                store.insert(table, blocked_ids)
+                store.index(table)
+
+            if block_limit is not None:
+                store.limit_blocks(tables, block_limit, records)
+        except BaseException:
+            store.close()
+            raise
+
+        if len(tables) == 1:
+            pairs = store.join(tables[0])
+        else:
+            pairs = store.join(tables[0], tables[1])
+
+        return store._closing(pairs)
+
+    def _closing(self, pairs: Iterator) -> Iterator:
+        with self:
+            yield from pairs
+
+
+class SQLiteStore(BlockingStore):
+    '''
+    Keeps the blocking map in a SQLite database. This is the default
+    blocking engine.
+
+    Each table is a WITHOUT ROWID table whose primary key is the block
+    key and then the record id, so a block's records are stored
+    together and the join reads them straight from the table, and a
+    record can only be in a block once. Blocked ids are appended to a
+    temporary table first, and copied into the table in key order,
+    so the table isn't built by inserting rows into the middle of it.
+
+    Args:
+        directory: Where to keep the database. Defaults to the
+                   system's temporary directory. A fast disk, or a
+                   tmpfs if the blocking map fits in memory, makes
+                   blocking faster. SQLite's temporary tables and
+                   files, like the ones for loading blocked ids and
+                   for SELECT DISTINCT, go where `temp_store` says.
+        redundancy_free: If True, each pair is made from the first
+                         block, in key order, that its records share,
+                         instead of deduplicating all the pairs with
+                         SELECT DISTINCT. Pairs start streaming at
+                         once and there is no temporary B-tree of
+                         every pair, but each pair costs a few more
+                         index lookups.
+        cache_size: How many bytes of the database SQLite can cache
+                    in memory.
+        mmap_size: How many bytes of the database SQLite can map
+                   into memory.
+        synchronous: SQLite's `synchronous` pragma. Defaults to 'OFF',
+                     which doesn't wait for writes to reach the disk,
+                     for temporary databases, and 'NORMAL', which
+                     keeps a database in WAL mode from being corrupted
+                     by a crash, for databases at a path.
+        journal_mode: SQLite's `journal_mode` pragma. Defaults to
+                      'OFF' for temporary databases, which are thrown
+                      away if anything goes wrong, and 'WAL' for
+                      databases at a path.
+        temp_store: SQLite's `temp_store` pragma, 'FILE' or 'MEMORY'.
+                    Defaults to SQLite's default.
+    '''
+
+    def __init__(self,
+                 directory: Optional[str] = None,
+                 redundancy_free: bool = False,
+                 cache_size: int = 256 * 1024 * 1024,
+                 mmap_size: int = 256 * 1024 * 1024,
+                 synchronous: Optional[str] = None,
+                 journal_mode: Optional[str] = None,
+                 temp_store: Optional[str] = None):
+        self.directory = directory
+        self.redundancy_free = redundancy_free
+        self.cache_size = cache_size
+        self.mmap_size = mmap_size
+        self.synchronous = synchronous
+        self.journal_mode = journal_mode
+        self.temp_store = temp_store
+
+        self.con: Optional[sqlite3.Connection] = None
+        self._temp_dir: Optional[tempfile.TemporaryDirectory] = None
+
+    def open(self, path: Optional[str] = None) -> 'SQLiteStore':
+        store = copy.copy(self)
+
+        journal_mode = self.journal_mode
+        synchronous = self.synchronous
+        if path is None:
+            store._temp_dir = tempfile.TemporaryDirectory(dir=self.directory)
+            path = os.path.join(store._temp_dir.name, 'blocks.db')
+            if journal_mode is None:
+                journal_mode = 'OFF'
+            if synchronous is None:
+                synchronous = 'OFF'
+        else:
+            if journal_mode is None:
+                journal_mode = 'WAL'
+            if synchronous is None:
+                synchronous = 'NORMAL'
+
+        # the connection can be handed to the thread that reads the pairs
+        con = sqlite3.connect(path, check_same_thread=False)
+        con.execute('PRAGMA journal_mode = ' + journal_mode)
+        con.execute('PRAGMA synchronous = ' + synchronous)
+        # a negative cache size is in KiB instead of pages
+        con.execute('PRAGMA cache_size = %d' % -(self.cache_size // 1024))
+        con.execute('PRAGMA mmap_size = %d' % self.mmap_size)
+        if self.temp_store is not None:
+            con.execute('PRAGMA temp_store = ' + self.temp_store)
+
+        store.con = con
+        return store
+
+    def close(self) -> None:
+        if self.con is not None:
+            self.con.close()
+            self.con = None
+        if self._temp_dir is not None:
+            self._temp_dir.cleanup()
+            self._temp_dir = None
+
+    @property
+    def _con(self) -> sqlite3.Connection:
+        if self.con is None:
+            raise ValueError('the store is not open, use the store '
+                             'that open() returns')
+        return self.con
+
+    def create(self,
+               table: str,
+               key_type: str = 'text',
+               id_type: str = 'integer',
+               temporary: bool = False) -> None:
+        self._con.execute('''CREATE {temporary} TABLE IF NOT EXISTS {table}
+                             (block_key {key_type}, record_id {id_type},
+                              PRIMARY KEY (block_key, record_id))
+                             WITHOUT ROWID
+                          '''.format(temporary='TEMPORARY' if temporary else '',
+                                     table=table,
+                                     key_type=key_type,
+                                     id_type=id_type))
+
+    def insert(self,
+               table: str,
+               blocked_ids: BlockedIds) -> None:
+        con = self._con
+        # appending to a staging table and then copying it over in key
+        # order is faster than inserting rows all over the table
+        con.execute('''CREATE TEMPORARY TABLE staged_blocking_map
+                       (block_key, record_id)''')
+        try:
+            con.executemany('INSERT INTO staged_blocking_map VALUES (?, ?)',
+                            blocked_ids)
+            con.execute('''INSERT OR IGNORE INTO {table}
+                           SELECT block_key, record_id
+                           FROM staged_blocking_map
+                           ORDER BY block_key, record_id
+                        '''.format(table=table))
+        except BaseException:
+            # if fingerprinting fails, none of its blocks are kept
+            con.rollback()
+            raise
+        finally:
+            # so that the next insert can stage its blocks
+            con.execute('DROP TABLE IF EXISTS staged_blocking_map')
+        con.commit()
+
+    def index(self, table: str, by_record: bool = False) -> None:
+        if self.redundancy_free or by_record:
+            # to look up the blocks a record is in
+            self._con.execute('''CREATE INDEX IF NOT EXISTS {table}_record_id_idx
+                                 ON {table} (record_id, block_key)
+                              '''.format(table=table))
+
+    def drop(self, table: str) -> None:
+        con = self._con
+        con.execute('DROP TABLE IF EXISTS ' + table)
+        con.commit()
+
+    def metadata(self, key: str) -> Optional[str]:
+        con = self._con
+        con.execute('''CREATE TABLE IF NOT EXISTS metadata
+                       (key text PRIMARY KEY, value text)''')
+        row = con.execute('SELECT value FROM metadata WHERE key = ?',
+                          (key,)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def set_metadata(self, key: str, value: str) -> None:
+        con = self._con
+        con.execute('''CREATE TABLE IF NOT EXISTS metadata
+                       (key text PRIMARY KEY, value text)''')
+        con.execute('REPLACE INTO metadata VALUES (?, ?)', (key, value))
+        con.commit()
+
+    def delete(self, table: str, record_ids: Iterable[RecordID]) -> None:
+        con = self._con
+        con.executemany('DELETE FROM ' + table + ' WHERE record_id = ?',
+                        ((record_id,) for record_id in record_ids))
+        con.commit()
+
+    def join(self,
+             table_a: str,
+             table_b: Optional[str] = None,
+             ordered: bool = False) -> Iterator[Tuple[RecordID, RecordID]]:
+        if table_b is None:
+            table_b = table_a
+            self_join = 'a.record_id < b.record_id'
+        else:
+            self_join = '1'
+
+        if self.redundancy_free:
+            # emit a pair only from the first block, in key order,
+            # that its records share
+            query = '''SELECT a.record_id, b.record_id
+                       FROM {table_a} a
+                       INNER JOIN {table_b} b
+                       USING (block_key)
+                       WHERE {self_join}
+                       AND NOT EXISTS
+                       (SELECT 1
+                        FROM {table_a} c
+                        INNER JOIN {table_b} d
+                        USING (block_key)
+                        WHERE c.record_id = a.record_id
+                        AND d.record_id = b.record_id
+                        AND c.block_key < a.block_key)'''
+        else:
+            query = '''SELECT DISTINCT a.record_id, b.record_id
+                       FROM {table_a} a
+                       INNER JOIN {table_b} b
+                       USING (block_key)
+                       WHERE {self_join}'''
+
+        if ordered:
+            query += ' ORDER BY a.record_id'
+
+        pairs = self._con.execute(query.format(table_a=table_a,
+                                               table_b=table_b,
+                                               self_join=self_join))
+        # not yield from, which would close the cursor if the pairs are
+        # abandoned, and that fails once the store has been closed
+        for pair in pairs:
+            yield pair
+        pairs.close()
+
+    def oversized(self, tables: Sequence[str], max_size: int) -> List[BlockKey]:
+        all_rows = ' UNION ALL '.join('SELECT block_key FROM ' + table
+                                      for table in tables)
+        return [block_key for block_key, in
+                self._con.execute('''SELECT block_key
+                                     FROM ({all_rows})
+                                     GROUP BY block_key
+                                     HAVING count(*) > ?
+                                  '''.format(all_rows=all_rows),
+                                  (max_size,))]
+
+    def pop_block(self, table: str, block_key: BlockKey) -> List[RecordID]:
+        con = self._con
+        record_ids = [record_id for record_id, in
+                      con.execute('SELECT record_id FROM ' + table +
+                                  ' WHERE block_key = ?', (block_key,))]
+        con.execute('DELETE FROM ' + table + ' WHERE block_key = ?',
+                    (block_key,))
+        return record_ids
+
+
+def keyType(blocked_id: Optional[Tuple[BlockKey, RecordID]]) -> str:
+    '''
+    The SQL type of the block keys of a blocked id
+    '''
+    if blocked_id is not None and isinstance(blocked_id[0], int):
+        return 'integer'
+    else:
+        return 'text'
+
+
+def changedPairs(pairs: Iterable[Tuple[RecordID, RecordID]],
+                 changed: Set[RecordID]) -> Iterator[Tuple[RecordID, RecordID]]:
+    '''
+    The pairs of a changed record and any other record, smaller id
+    first, from a join of the changed records with all the records.
+    A pair of two changed records comes out of that join both ways
+    round, and so does a record paired with itself.
+    '''
+    for a, b in pairs:
+        if a == b:
+            continue
+        elif b < a:  # type: ignore
+            if b not in changed:
+                yield b, a
+        else:
+            yield a, b
+
+
+BlockingEngine = Union[SortMerge, SymmetricJoin, BlockingStore]
+
+
+class SortedRuns(object):
+    '''
+    An external sort. Arrays are added to a buffer, which is sorted
+    into a run whenever it holds `max_rows` rows. If there is more
+    than one run, the runs are written to `temp_dir` and read back as
+    memory maps. :meth:`ranges` then yields the rows in order, a range
+    of keys at a time, with about `max_rows` rows in each range and
+    all the rows with the same key in the same range.
+
+    Structured arrays are sorted by their 'key' field, and plain
+    arrays by their values.
+    '''
+
+    def __init__(self, max_rows: int, temp_dir: str, name: str):
+        self.max_rows = max_rows
+        self.temp_dir = temp_dir
+        self.name = name
+        self.runs: List[numpy.ndarray] = []
+        self.paths: List[str] = []
+        self.buffer: List[numpy.ndarray] = []
+        self.buffered = 0
+
+    def add(self, rows: numpy.ndarray) -> None:
+        self.buffer.append(rows)
+        self.buffered += len(rows)
+        if self.buffered >= self.max_rows:
+            self._sortBuffer()
+
+    def finish(self) -> None:
+        if self.buffer:
+            self._sortBuffer()
+
+    def _sortBuffer(self) -> None:
+        rows = numpy.concatenate(self.buffer)
+        self.buffer = []
+        self.buffered = 0
+
+        rows = rows[numpy.argsort(sortKey(rows), kind='stable')]
+
+        if self.runs and not self.paths:
+            # the first run is only written out once we know there
+            # will be more than one
+            self.runs[0] = self._spill(self.runs[0])
+        if self.runs:
+            rows = self._spill(rows)
+
+        self.runs.append(rows)
+
+    def _spill(self, rows: numpy.ndarray) -> numpy.ndarray:
+        path = os.path.join(self.temp_dir,
+                            '%s_%d.npy' % (self.name, len(self.paths)))
+        numpy.save(path, rows)
+        self.paths.append(path)
+        return numpy.load(path, mmap_mode='r')
+
+    def ranges(self) -> Iterator[numpy.ndarray]:
+        if not self.runs:
+            return
+        if len(self.runs) == 1:
+            yield self.runs[0]
+            return
+
+        keys = [sortKey(run) for run in self.runs]
+        for start, end in self._boundaries(keys):
+            parts = []
+            for run, run_keys in zip(self.runs, keys):
+                lower = 0 if start is None else run_keys.searchsorted(start)
+                upper = len(run) if end is None else run_keys.searchsorted(end)
+                parts.append(run[lower:upper])
+
+            merged = numpy.concatenate(parts)
+            yield merged[numpy.argsort(sortKey(merged), kind='stable')]
+
+    def _boundaries(self, keys: List[numpy.ndarray]) -> Iterator[Tuple]:
+        '''
+        Split the keys into ranges of about max_rows rows each, using
+        a sample of the keys of every run to guess where to split
+        '''
+        total = sum(len(run_keys) for run_keys in keys)
+        n_ranges = -(-total // self.max_rows)
+
+        sample = numpy.sort(numpy.concatenate(
+            [run_keys[::max(len(run_keys) // 1000, 1)] for run_keys in keys]))
+        quantiles = numpy.linspace(0, len(sample), n_ranges + 1)[1:-1]
+        splits = numpy.unique(sample[quantiles.astype(int)]).tolist()
+
+        bounds = [None] + splits + [None]
+        return zip(bounds[:-1], bounds[1:])
+
+    def close(self) -> None:
+        self.runs = []
+        for path in self.paths:
+            os.remove(path)
+        self.paths = []
+
+
+def sortKey(rows: numpy.ndarray) -> numpy.ndarray:
+    if rows.dtype.names:
+        return rows['key']
+    return rows
+
+
+def keyRows(blocked_ids: BlockedIds,
+            side: int,
+            chunk_size: int) -> Iterator[numpy.ndarray]:
+    '''
+    Chunks of the blocking map as arrays of KEY_ROW rows, with the
+    string block keys hashed
+    '''
+    keys = array.array('q')
+    ids = array.array('q')
+
+    # string keys already end with their predicate, so they all get
+    # the same salt
+    salt = predicateSalt(0)
+
+    for block_key, record_id in blocked_ids:
+        if isinstance(block_key, int):
+            keys.append(block_key)
+        else:
+            keys.append(blockHash(salt, block_key))
+        ids.append(record_id)  # type: ignore
+
+        if len(keys) == chunk_size:
+            yield _keyRows(keys, ids, side)
+            keys = array.array('q')
+            ids = array.array('q')
+
+    if keys:
+        yield _keyRows(keys, ids, side)
+
+
+def _keyRows(keys: array.array, ids: array.array, side: int) -> numpy.ndarray:
+    rows = numpy.empty(len(keys), KEY_ROW)
+    rows['key'] = numpy.frombuffer(keys, 'i8')
+    rows['side'] = side
+    rows['id'] = numpy.frombuffer(ids, 'i8')
+
+    if rows['id'].max() >= 2 ** 32:
+        raise ValueError('SortMerge can only pair up to 2**32 records')
+
+    return rows
+
+
+def blockStarts(keys: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    '''
+    Where each run of equal keys starts, and how long it is
+    '''
+    starts = numpy.flatnonzero(numpy.r_[True, keys[1:] != keys[:-1]])
+    sizes = numpy.diff(numpy.r_[starts, len(keys)])
+    return starts, sizes
+
+
+def packPairs(ids_1: numpy.ndarray, ids_2: numpy.ndarray) -> numpy.ndarray:
+    '''
+    Pack pairs of record ordinals, which have to be less than 2**32,
+    into single unsigned 64-bit integers
+    '''
+    return ((ids_1.astype('u8') << numpy.uint64(32)) |
+            ids_2.astype('u8'))
+
+
+def dedupeBlockPairs(rows: numpy.ndarray, max_pairs: int) -> Iterator[numpy.ndarray]:
+    '''
+    The packed pairs of record ordinals within each block of rows
+    sorted by key, smaller ordinal first
+    '''
+    ids = rows['id']
+    starts, sizes = blockStarts(rows['key'])
+
+    for size in numpy.unique(sizes[sizes > 1]).tolist():
+        block_starts = starts[sizes == size]
+        first, second = numpy.triu_indices(size, 1)
+
+        if len(first) > max_pairs:
+            # too big to pair up all at once, so pair up each record
+            # with the records after it in the block
+            for block_start in block_starts.tolist():
+                block = ids[block_start:block_start + size]
+                for i in range(size - 1):
+                    others = block[i + 1:]
+                    this = numpy.full(len(others), block[i])
+                    yield orderedPairs(this, others)
+            continue
+
+        per_chunk = max(max_pairs // len(first), 1)
+        for i in range(0, len(block_starts), per_chunk):
+            chunk_starts = block_starts[i:i + per_chunk, None]
+            yield orderedPairs(ids[chunk_starts + first].ravel(),
+                               ids[chunk_starts + second].ravel())
+
+
+def orderedPairs(ids_1: numpy.ndarray, ids_2: numpy.ndarray) -> numpy.ndarray:
+    '''
+    Packed pairs with the smaller ordinal first, leaving out any
+    record paired with itself, which happens if a record has the
+    same block key twice
+    '''
+    distinct = ids_1 != ids_2
+    ids_1, ids_2 = ids_1[distinct], ids_2[distinct]
+    return packPairs(numpy.minimum(ids_1, ids_2),
+                     numpy.maximum(ids_1, ids_2))
+
+
+def linkBlockPairs(rows: numpy.ndarray, max_pairs: int) -> Iterator[numpy.ndarray]:
+    '''
+    The packed pairs of a record ordinal from the first side and one
+    from the second side within each block of rows sorted by key
+    '''
+    # within each block, put the rows of the first side first
+    rows = rows[numpy.lexsort((rows['side'], rows['key']))]
+    ids = rows['id']
+    starts, sizes = blockStarts(rows['key'])
+    if len(rows):
+        firsts = numpy.add.reduceat((rows['side'] == 0).astype(numpy.intp),
+                                    starts)
+    else:
+        firsts = starts
+
+    seconds = sizes - firsts
+    linked = (firsts > 0) & (seconds > 0)
+
+    shapes = numpy.unique(numpy.column_stack((firsts[linked],
+                                              seconds[linked])),
+                          axis=0)
+
+    for n_first, n_second in shapes.tolist():
+        block_starts = starts[linked &
+                              (firsts == n_first) &
+                              (seconds == n_second)]
+        n_pairs = n_first * n_second
+
+        if n_pairs > max_pairs:
+            for block_start in block_starts.tolist():
+                others = ids[block_start + n_first:block_start + n_first + n_second]
+                for i in range(n_first):
+                    yield packPairs(numpy.full(n_second, ids[block_start + i]),
+                                    others)
+            continue
+
+        first = numpy.repeat(numpy.arange(n_first), n_second)
+        second = n_first + numpy.tile(numpy.arange(n_second), n_first)
+
+        per_chunk = max(max_pairs // n_pairs, 1)
+        for i in range(0, len(block_starts), per_chunk):
+            chunk_starts = block_starts[i:i + per_chunk, None]
+            yield packPairs(ids[chunk_starts + first].ravel(),
+                            ids[chunk_starts + second].ravel())
+
+
+def distinctSorted(values: numpy.ndarray) -> numpy.ndarray:
+    if not len(values):
+        return values
+    return values[numpy.r_[True, values[1:] != values[:-1]]]
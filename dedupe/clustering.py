@@ -6,6 +6,7 @@ from collections import defaultdict
 import array
 import logging
 import tempfile
+import functools
 
 import numpy
 import fastcluster
@@ -13,13 +14,17 @@ import hcluster
 
 from typing import (Iterable,
                     Dict,
+                    Any,
+                    Optional,
                     cast,
                     List,
                     Set,
                     Generator,
+                    NamedTuple,
                     Sequence,
                     Tuple)
-from dedupe._typing import Clusters, RecordID, Links
+from dedupe._typing import Cluster, Clusters, RecordID, Links
+from dedupe.core import Executor
 
 logger = logging.getLogger(__name__)
 
@@ -194,7 +199,8 @@ def condensedDistance(dupes: numpy.ndarray) -> Tuple[Dict[int, RecordID],
 
 def cluster(dupes: numpy.ndarray,
             threshold: float = .5,
-            max_components: int = 30000) -> Clusters:
+            max_components: int = 30000,
+            executor: Optional[Executor] = None) -> Clusters:
     '''
     Takes in a list of duplicate pairs and clusters them in to a
     list records that all refer to the same entity based on a given
@@ -204,37 +210,157 @@ def cluster(dupes: numpy.ndarray,
     threshold -- number betweent 0 and 1 (default is .5). lowering the
                  number will increase precision, raising it will increase
                  recall
+    executor -- if given, connected components are clustered in
+                parallel on this :class:`dedupe.core.Executor`
     '''
-    distance_threshold = 1 - threshold
     dupe_sub_graphs = connected_components(dupes, max_components)
 
-    for sub_graph in dupe_sub_graphs:
-        if len(sub_graph) > 1:
+    if executor is None:
+        for sub_graph in dupe_sub_graphs:
+            yield from clusterComponent(sub_graph, threshold)
+
+    else:
+        cluster_components = functools.partial(_clusterComponents,
+                                               threshold=threshold)
+        for clusters in executor.imap(cluster_components,
+                                      _componentBatches(dupe_sub_graphs)):
+            yield from clusters
 
-            i_to_id, condensed_distances, N = condensedDistance(sub_graph)
 
-            linkage = fastcluster.linkage(condensed_distances,
-                                          method='centroid',
-                                          preserve_input=True)
+def clusterComponent(sub_graph: numpy.ndarray,
+                     threshold: float) -> List[Tuple[Tuple[RecordID, ...], Any]]:
+    '''
+    Cluster the records of one connected component
+    '''
+    distance_threshold = 1 - threshold
+    component_clusters: List[Tuple[Tuple[RecordID, ...], Any]] = []
 
-            partition = hcluster.fcluster(linkage,
-                                          distance_threshold,
-                                          criterion='distance')
+    if len(sub_graph) > 1:
 
-            clusters: Dict[int, List[int]] = defaultdict(list)
+        i_to_id, condensed_distances, N = condensedDistance(sub_graph)
 
-            for i, cluster_id in enumerate(partition):
-                clusters[cluster_id].append(i)
+        linkage = fastcluster.linkage(condensed_distances,
+                                      method='centroid',
+                                      preserve_input=True)
 
-            for cluster in clusters.values():
-                if len(cluster) > 1:
-                    scores = confidences(cluster, condensed_distances, N)
-                    yield tuple(i_to_id[i] for i in cluster), scores
+        partition = hcluster.fcluster(linkage,
+                                      distance_threshold,
+                                      criterion='distance')
 
-        else:
-            (ids, score), = sub_graph
-            if score > threshold:
-                yield tuple(ids), (score,) * 2
+        clusters: Dict[int, List[int]] = defaultdict(list)
+
+        for i, cluster_id in enumerate(partition):
+            clusters[cluster_id].append(i)
+
+        for cluster in clusters.values():
+            if len(cluster) > 1:
+                scores = confidences(cluster, condensed_distances, N)
+                component_clusters.append((tuple(i_to_id[i] for i in cluster),
+                                           scores))
+
+    else:
+        (ids, score), = sub_graph
+        if score > threshold:
+            component_clusters.append((tuple(ids), (score,) * 2))
+
+    return component_clusters
+
+
+def _clusterComponents(sub_graphs: List[numpy.ndarray],
+                       threshold: float) -> List[Tuple[Tuple[RecordID, ...], Any]]:
+    return [cluster
+            for sub_graph in sub_graphs
+            for cluster in clusterComponent(sub_graph, threshold)]
+
+
+def _componentBatches(sub_graphs: Iterable[numpy.ndarray],
+                      batch_edges: int = 10000) -> Generator[List[numpy.ndarray], None, None]:
+    '''
+    Group connected components into batches of about `batch_edges`
+    edges, so that most tasks are big enough to be worth sending to a
+    worker, however small the components are.
+    '''
+    batch: List[numpy.ndarray] = []
+    n_edges = 0
+    for sub_graph in sub_graphs:
+        # copy the component out of the memmapped edgelist, which is
+        # closed once all the components have been read
+        batch.append(numpy.array(sub_graph))
+        n_edges += len(sub_graph)
+        if n_edges >= batch_edges:
+            yield batch
+            batch = []
+            n_edges = 0
+
+    if batch:
+        yield batch
+
+
+class ClusterDiff(NamedTuple):
+    '''
+    How a partition changed when new records were added to it.
+
+    Attributes:
+        clusters: the whole new partition
+        unchanged: the old clusters that are still clusters, as they
+                   were
+        merged: each cluster that has new records, or the records of
+                more than one old cluster, with the old clusters its
+                records came from
+        split: each old cluster whose records are now in more than
+               one cluster, with those clusters
+        new: the clusters of only new records, singletons included
+    '''
+    clusters: List[Cluster]
+    unchanged: List[Cluster]
+    merged: List[Tuple[List[Cluster], Cluster]]
+    split: List[Tuple[Cluster, List[Cluster]]]
+    new: List[Cluster]
+
+
+def clusterDiff(old_clusters: Sequence[Cluster],
+                affected: Set[int],
+                new_clusters: Sequence[Cluster]) -> ClusterDiff:
+    '''
+    Compare the clusters of some records, singletons included, with
+    the `affected` old clusters those records were in. The records
+    that weren't in an old cluster are new.
+    '''
+    old_cluster_of = {record_id: i
+                      for i in affected
+                      for record_id in old_clusters[i][0]}
+
+    unchanged = [cluster for i, cluster in enumerate(old_clusters)
+                 if i not in affected]
+    clusters = unchanged + list(new_clusters)
+
+    merged: List[Tuple[List[Cluster], Cluster]] = []
+    new: List[Cluster] = []
+    pieces: Dict[int, List[Cluster]] = defaultdict(list)
+
+    for cluster in new_clusters:
+        record_ids, _ = cluster
+        sources = sorted({old_cluster_of[record_id]
+                          for record_id in record_ids
+                          if record_id in old_cluster_of})
+        has_new = any(record_id not in old_cluster_of
+                      for record_id in record_ids)
+
+        for i in sources:
+            pieces[i].append(cluster)
+
+        if not sources:
+            new.append(cluster)
+        elif has_new or len(sources) > 1:
+            merged.append(([old_clusters[i] for i in sources], cluster))
+        elif len(record_ids) == len(old_clusters[sources[0]][0]):
+            unchanged.append(old_clusters[sources[0]])
+
+    split = [(old_clusters[i], pieces[i])
+             for i in sorted(pieces)
+             if len(pieces[i]) > 1]
+
+    return ClusterDiff(clusters, unchanged, merged, split, new)
 
 
 def confidences(cluster: Sequence[int],
@@ -8,6 +8,12 @@ import random
 import collections
 import warnings
 import functools
+import time
+import platform
+import pickle
+import uuid
+import concurrent.futures
+import asyncio
 
 from typing import (Iterator,
                     Tuple,
@@ -18,9 +24,16 @@ from typing import (Iterator,
                     Optional,
                     Any,
                     Type,
+                    Callable,
+                    Sized,
+                    Dict,
+                    List,
+                    AsyncGenerator,
+                    AsyncIterator,
                     Iterable, cast)
 from dedupe._typing import (RecordPairs,
                             RecordID,
+                            Record,
                             RecordDict,
                             Blocks,
                             Data,
@@ -42,6 +55,7 @@ class BlockingError(Exception):
 _Queue = Union[multiprocessing.dummy.Queue, multiprocessing.Queue]
 _SimpleQueue = Union[multiprocessing.dummy.Queue, multiprocessing.SimpleQueue]
 IndicesIterator = Iterator[Tuple[int, int]]
+IndexPairs = Iterable[Tuple[int, int]]
 
 
 def randomPairs(n_records: int, sample_size: int) -> IndicesIterator:
@@ -109,117 +123,522 @@ def randomPairsWithReplacement(n_records: int, sample_size: int) -> IndicesItera
     return ((p.item(), q.item()) for p, q in random_indices)
 
 
+class WorkTimer(object):
+    '''
+    A running tally, shared by the scoring workers, of how many pairs
+    they have scored and how many seconds that took them.
+    '''
+    def __init__(self, lock, tally):
+        self.lock = lock
+        self.tally = tally
+
+    def record(self, n_pairs: int, seconds: float) -> None:
+        with self.lock:
+            self.tally[0] += n_pairs
+            self.tally[1] += seconds
+
+    def read(self) -> Tuple[float, float]:
+        with self.lock:
+            return self.tally[0], self.tally[1]
+
+
+class FieldProfile(object):
+    '''
+    Tallies, for each field comparator, how many times it compared a
+    chunk of pairs, how many pairs that was, how many of those pairs
+    had a missing value, and how many seconds it took.
+
+    The time is only measured once per chunk, not for each pair, so
+    the percentiles are of the seconds per pair of each chunk.
+    Profiles from different scoring workers can be added together
+    with :meth:`merge`.
+    '''
+    percentiles = (50, 90, 99)
+
+    def __init__(self) -> None:
+        self.fields: Dict[str, Dict[str, Any]] = {}
+
+    def record(self,
+               name: str,
+               n_pairs: int,
+               n_missing: int,
+               seconds: float) -> None:
+        field = self.fields.setdefault(name, {'calls': 0,
+                                              'pairs': 0,
+                                              'missing': 0,
+                                              'seconds': 0.0,
+                                              'per_pair': []})
+        field['calls'] += 1
+        field['pairs'] += n_pairs
+        field['missing'] += n_missing
+        field['seconds'] += seconds
+        if n_pairs:
+            field['per_pair'].append(seconds / n_pairs)
+
+    def merge(self, other: 'FieldProfile') -> None:
+        for name, other_field in other.fields.items():
+            field = self.fields.setdefault(name, {'calls': 0,
+                                                  'pairs': 0,
+                                                  'missing': 0,
+                                                  'seconds': 0.0,
+                                                  'per_pair': []})
+            for key in ('calls', 'pairs', 'missing', 'seconds'):
+                field[key] += other_field[key]
+            field['per_pair'].extend(other_field['per_pair'])
+
+    @property
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        '''
+        For each field, its call and pair counts, the share of pairs
+        with a missing value, the total seconds, and percentiles of
+        the seconds per pair, slowest fields first.
+        '''
+        stats: Dict[str, Dict[str, Any]] = {}
+        for name, field in sorted(self.fields.items(),
+                                  key=lambda item: -item[1]['seconds']):
+            if field['per_pair']:
+                percentiles = numpy.percentile(field['per_pair'],
+                                               self.percentiles)
+            else:
+                percentiles = [0.0] * len(self.percentiles)
+
+            stats[name] = {'calls': field['calls'],
+                           'pairs': field['pairs'],
+                           'missing_rate': (field['missing'] / field['pairs']
+                                            if field['pairs'] else 0.0),
+                           'seconds': field['seconds'],
+                           'seconds_per_pair': dict(zip(self.percentiles,
+                                                        (float(p) for p in
+                                                         percentiles)))}
+        return stats
+
+
+class ChunkScheduler(object):
+    '''
+    Decides how many pairs to hand a scoring worker at a time, and
+    how many of those chunks can wait in the queue for a worker.
+
+    Chunks have to be big enough that the cost of passing them to a
+    worker is small compared to scoring them, but small enough that
+    the work is spread evenly over the workers. How many pairs that
+    is depends a lot on the data model, so while scoring, the
+    scheduler watches how long the workers take per pair and resizes
+    the chunks so each one takes about `target_duration` seconds.
+
+    What the scheduler chose, and what it measured, is in
+    :attr:`settings`.
+
+    Args:
+        chunk_size: Number of pairs in a chunk, until we have
+                    measured how long pairs take to score.
+        queue_size: Maximum number of chunks waiting for a worker.
+        target_duration: How many seconds a chunk should take to score.
+        min_chunk_size: Smallest chunk size the scheduler will pick.
+        max_chunk_size: Largest chunk size the scheduler will pick.
+        adaptive: If False, always use chunk_size.
+    '''
+
+    # weight of the newest measurement in the running estimates
+    smoothing = 0.3
+
+    def __init__(self,
+                 chunk_size: int = 20000,
+                 queue_size: int = 2,
+                 target_duration: float = 1.0,
+                 min_chunk_size: int = 100,
+                 max_chunk_size: int = 200000,
+                 adaptive: bool = True):
+        self.chunk_size = chunk_size
+        self.queue_size = queue_size
+        self.target_duration = target_duration
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.adaptive = adaptive
+
+        self.seconds_per_pair: Optional[float] = None
+        self.pairs_per_block: Optional[float] = None
+        self.queue_depth: Optional[float] = None
+        self.starved = 0
+
+    @property
+    def settings(self) -> Dict[str, Any]:
+        return {'chunk_size': self.chunk_size,
+                'blocks_per_task': self.blocks_per_task,
+                'queue_size': self.queue_size,
+                'target_duration': self.target_duration,
+                'seconds_per_pair': self.seconds_per_pair,
+                'pairs_per_block': self.pairs_per_block,
+                'queue_depth': self.queue_depth,
+                'starved': self.starved}
+
+    @property
+    def blocks_per_task(self) -> int:
+        '''
+        Number of gazetteer blocks to send to a worker at a time
+        '''
+        if self.pairs_per_block:
+            return max(1, round(self.chunk_size / self.pairs_per_block))
+        else:
+            return self.chunk_size
+
+    def _smooth(self, estimate: Optional[float], measurement: float) -> float:
+        if estimate is None:
+            return measurement
+        return (1 - self.smoothing) * estimate + self.smoothing * measurement
+
+    def observe(self, n_pairs: float, seconds: float) -> None:
+        '''
+        Record that workers took `seconds` to score `n_pairs` pairs
+        '''
+        if n_pairs <= 0:
+            return
+
+        self.seconds_per_pair = self._smooth(self.seconds_per_pair,
+                                             seconds / n_pairs)
+
+        if self.adaptive and self.seconds_per_pair > 0:
+            chunk_size = self.target_duration / self.seconds_per_pair
+            self.chunk_size = int(min(max(chunk_size, self.min_chunk_size),
+                                      self.max_chunk_size))
+
+    def observe_blocks(self,
+                       n_blocks: int,
+                       n_pairs: float,
+                       seconds: float) -> None:
+        if n_blocks <= 0:
+            return
+
+        self.pairs_per_block = self._smooth(self.pairs_per_block,
+                                            n_pairs / n_blocks)
+        self.observe(n_pairs, seconds)
+
+    def observe_queue(self, queue: _Queue) -> None:
+        try:
+            depth = queue.qsize()
+        except NotImplementedError:  # pragma: no cover
+            # qsize is not available on Mac OS X
+            return
+
+        if depth == 0:
+            self.starved += 1
+
+        self.queue_depth = self._smooth(self.queue_depth, depth)
+
+    def chunk_sizes(self,
+                    queue: _Queue,
+                    timer: WorkTimer) -> Iterator[int]:
+        '''
+        Yield the size of the next chunk to put in the queue, taking
+        into account what the workers have reported since the last
+        chunk.
+        '''
+        scored, seconds = 0.0, 0.0
+        while True:
+            total_scored, total_seconds = timer.read()
+            self.observe(total_scored - scored, total_seconds - seconds)
+            scored, seconds = total_scored, total_seconds
+
+            self.observe_queue(queue)
+
+            yield self.chunk_size
+
+
+class ScoreSink(object):
+    '''
+    A file that scoring workers write their scored pairs into
+    directly. Each worker reserves a slice of the file by atomically
+    advancing a shared end offset and then writes its chunk there, so
+    every scored pair is written exactly once and no single process
+    has to gather all the results.
+    '''
+    def __init__(self, lock, end):
+        self.lock = lock
+        self.end = end
+
+        score_file, self.file_path = tempfile.mkstemp()
+        os.close(score_file)
+
+    def reserve(self, size: int) -> int:
+        with self.lock:
+            start = self.end.value
+            self.end.value += size
+
+        return start
+
+    def write(self, scored_pairs: numpy.ndarray) -> None:
+        start = self.reserve(len(scored_pairs))
+
+        # writing past the end of the file grows it, so the file never
+        # needs to be preallocated
+        with open(self.file_path, 'r+b') as f:
+            f.seek(start * scored_pairs.dtype.itemsize)
+            scored_pairs.tofile(f)
+
+    def scored_pairs(self, dtype: numpy.dtype) -> numpy.memmap:
+        return numpy.memmap(self.file_path,
+                            dtype=dtype,
+                            shape=(self.end.value,))
+
+    def remove(self) -> None:
+        os.remove(self.file_path)
+
+
 class ScoreDupes(object):
     def __init__(self,
                  data_model,
                  classifier,
                  records_queue: _Queue,
-                 score_queue: _SimpleQueue):
+                 score_queue: _SimpleQueue,
+                 score_sink: ScoreSink,
+                 timer: WorkTimer,
+                 min_score: Optional[float] = None,
+                 profile: bool = False):
         self.data_model = data_model
         self.classifier = classifier
         self.records_queue = records_queue
         self.score_queue = score_queue
+        self.score_sink = score_sink
+        self.timer = timer
+        self.min_score = min_score
+        self.profile = profile
 
     def __call__(self) -> None:
 
+        dtype = None
+        self.field_profile = FieldProfile() if self.profile else None
+
         while True:
             record_pairs: Optional[RecordPairs] = self.records_queue.get()
             if record_pairs is None:
                 break
 
             try:
-                filtered_pairs: Optional[Tuple] = self.fieldDistance(record_pairs)
+                start_time = time.perf_counter()
+                filtered_pairs: Optional[numpy.ndarray] = self.fieldDistance(record_pairs)
+                self.timer.record(len(record_pairs),  # type: ignore
+                                  time.perf_counter() - start_time)
                 if filtered_pairs is not None:
-                    self.score_queue.put(filtered_pairs)
+                    self.score_sink.write(filtered_pairs)
+                    dtype = filtered_pairs.dtype
             except Exception as e:
                 self.score_queue.put(e)
                 raise
 
-        self.score_queue.put(None)
+        # tell the main process we are done, what we wrote, and how
+        # long each field took
+        self.score_queue.put(('done', dtype, self.field_profile))
 
-    def fieldDistance(self, record_pairs: RecordPairs) -> Optional[Tuple]:
+    def fieldDistance(self, record_pairs: RecordPairs) -> Optional[numpy.ndarray]:
 
-        record_ids, records = zip(*(zip(*record_pair) for record_pair in record_pairs))  # type: ignore
-        record_ids = cast(Tuple[Tuple[RecordID, RecordID], ...], record_ids)
-        records = cast(Tuple[Tuple[RecordDict, RecordDict], ...], records)
+        return scoreRecordPairs(record_pairs,
+                                self.data_model,
+                                self.classifier,
+                                self.min_score,
+                                self.field_profile)
 
-        if records:
 
-            distances = self.data_model.distances(records)
-            scores = self.classifier.predict_proba(distances)[:, -1]
+def scoreRecordPairs(record_pairs: RecordPairs,
+                     data_model,
+                     classifier,
+                     min_score: Optional[float] = None,
+                     profile: Optional[FieldProfile] = None) -> Optional[numpy.ndarray]:
+    '''
+    Score a chunk of pairs of (record_id, record) tuples, returning
+    the scored pairs above min_score, or None if there are none. If a
+    FieldProfile is given, the time each field takes is recorded in it.
+    '''
+
+    record_ids, records = zip(*(zip(*record_pair) for record_pair in record_pairs))  # type: ignore
+    record_ids = cast(Tuple[Tuple[RecordID, RecordID], ...], record_ids)
+    records = cast(Tuple[Tuple[RecordDict, RecordDict], ...], records)
+
+    if records:
+        id_type = sniff_id_type(record_ids)
+        ids = numpy.array(record_ids, dtype=object)
+
+        return _scoredPairs(ids, records, id_type,
+                            data_model, classifier, min_score, profile)
+
+    return None
+
+
+def scoreIndexPairs(index_pairs: numpy.ndarray,
+                    records: Sequence[Record],
+                    index_type: numpy.dtype,
+                    data_model,
+                    classifier,
+                    min_score: Optional[float] = None,
+                    profile: Optional[FieldProfile] = None) -> Optional[numpy.ndarray]:
+    '''
+    Score a chunk of pairs of indices into `records`, returning the
+    scored pairs of indices above min_score, or None if there are none.
+    '''
+
+    record_pairs = [(records[i][1], records[j][1])
+                    for i, j in index_pairs.tolist()]
+
+    return _scoredPairs(index_pairs, record_pairs, index_type,
+                        data_model, classifier, min_score, profile)
+
+
+def _scoredPairs(ids: numpy.ndarray,
+                 records: Sequence[Tuple[RecordDict, RecordDict]],
+                 id_type,
+                 data_model,
+                 classifier,
+                 min_score: Optional[float],
+                 profile: Optional[FieldProfile] = None) -> Optional[numpy.ndarray]:
+
+    bound = cascadeBound(classifier, min_score)
+    if bound is not None:
+        distances, kept = data_model.cascadeDistances(records, bound, profile)
+        ids = ids[kept]
+    else:
+        distances = data_model.distances(records, profile)
+
+    scores = classifier.predict_proba(distances)[:, -1]
 
-            if scores.any():
-                id_type = sniff_id_type(record_ids)
-                ids = numpy.array(record_ids, dtype=id_type)
+    if min_score is not None:
+        keep = scores > min_score
+        ids = ids[keep]
+        scores = scores[keep]
 
-                dtype = numpy.dtype([('pairs', id_type, 2),
-                                     ('score', 'f4')])
+    if scores.any():
+        dtype = numpy.dtype([('pairs', id_type, 2),
+                             ('score', 'f4')])
+
+        scored_pairs = numpy.empty(shape=len(scores),
+                                   dtype=dtype)
 
-                temp_file, file_path = tempfile.mkstemp()
-                os.close(temp_file)
+        scored_pairs['pairs'] = ids
+        scored_pairs['score'] = scores
 
-                scored_pairs = numpy.memmap(file_path,
-                                            shape=len(scores),
-                                            dtype=dtype)
+        return scored_pairs
 
-                scored_pairs['pairs'] = ids
-                scored_pairs['score'] = scores
+    return None
 
-                return file_path, dtype
 
+def cascadeBound(classifier, min_score: Optional[float]):
+    '''
+    For cascade scoring, a function that takes the least and greatest
+    distances each pair could have and returns which pairs could score
+    above min_score. The bound on a pair's score comes from the weights
+    of the classifier, so there is no function if the classifier is not
+    a logistic regression with `weights` and a `bias`, or if there is
+    no min_score.
+    '''
+    if min_score is None:
         return None
 
+    try:
+        weights = numpy.asarray(classifier.weights, 'f8')
+        bias = float(classifier.bias)
+    except (AttributeError, TypeError):
+        return None
 
-def mergeScores(score_queue: _SimpleQueue,
-                result_queue: _SimpleQueue,
-                stop_signals: int):
-    scored_pairs_file, file_path = tempfile.mkstemp()
-    os.close(scored_pairs_file)
+    def keep(lower: numpy.ndarray, upper: numpy.ndarray) -> numpy.ndarray:
+        with numpy.errstate(invalid='ignore'):
+            contributions = numpy.where(weights > 0,
+                                        weights * upper,
+                                        weights * lower)
+        contributions[:, weights == 0] = 0
 
-    seen_signals = 0
-    end = 0
+        # a little slack, so rounding can't prune a pair that scores
+        # just above min_score
+        best = contributions.sum(axis=1) + bias + 1e-6
+        with numpy.errstate(over='ignore'):
+            best_scores = 1 / (1 + numpy.exp(-best))
 
-    while seen_signals < stop_signals:
+        return best_scores > min_score
 
-        score_chunk = score_queue.get()
+    return keep
 
-        if isinstance(score_chunk, Exception):
-            result_queue.put(score_chunk)
-            raise
-        elif score_chunk is None:
-            seen_signals += 1
-        else:
-            score_file, dtype = score_chunk
-            score_chunk = numpy.memmap(score_file, mode='r', dtype=dtype)
 
-            chunk_size = len(score_chunk)
+class ScoreIndexedDupes(ScoreDupes):
+    '''
+    Scores chunks of pairs of indices into a sequence of records.
 
-            fp = numpy.memmap(file_path, dtype=dtype,
-                              offset=(end * dtype.itemsize),
-                              shape=(chunk_size, ))
+    The records are an attribute of the scorer, so when the scoring
+    processes are forked they inherit the records, and when they are
+    spawned the records are pickled once per process. Either way, the
+    queue only has to carry compact arrays of integer indices instead
+    of a copy of each record for every pair it appears in.
 
-            fp[:chunk_size] = score_chunk
+    The scored pairs are also pairs of indices, not record ids, so
+    they stay small and cheap to sort no matter what the ids look like.
+    '''
+    def __init__(self,
+                 records: Sequence[Record],
+                 data_model,
+                 classifier,
+                 records_queue: _Queue,
+                 score_queue: _SimpleQueue,
+                 score_sink: ScoreSink,
+                 timer: WorkTimer,
+                 min_score: Optional[float] = None,
+                 profile: bool = False):
+        super().__init__(data_model,
+                         classifier,
+                         records_queue,
+                         score_queue,
+                         score_sink,
+                         timer,
+                         min_score,
+                         profile)
+        if data_model.has_features:
+            records = PreparedRecords(records, data_model)
+        self.records = records
+        self.index_type = indexType(len(records))
+
+    def fieldDistance(self, index_pairs: numpy.ndarray) -> Optional[numpy.ndarray]:  # type: ignore[override]
+
+        return scoreIndexPairs(index_pairs,
+                               self.records,
+                               self.index_type,
+                               self.data_model,
+                               self.classifier,
+                               self.min_score,
+                               self.field_profile)
+
+
+class PreparedRecords(Sequence[Record]):
+    '''
+    A sequence of (record_id, record) tuples, whose records are
+    prepared by the data model the first time they are asked for, so
+    that a record's comparator features are computed once however
+    many pairs the record is in.
+    '''
+    def __init__(self, records: Sequence[Record], data_model):
+        self.records = records
+        self.data_model = data_model
+        self._prepared: Dict[int, Record] = {}
 
-            end += chunk_size
+    def __len__(self) -> int:
+        return len(self.records)
 
-            del score_chunk
-            os.remove(score_file)
+    def __getitem__(self, i: int) -> Record:  # type: ignore
+        try:
+            return self._prepared[i]
+        except KeyError:
+            record_id, record = self.records[i]
+            prepared = (record_id, self.data_model.prepare(record))
+            self._prepared[i] = prepared
+            return prepared
 
-    if end:
-        result_queue.put((file_path, dtype, end))
-    else:
-        result_queue.put(None)
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state['_prepared'] = {}
+        return state
 
 
 def scoreDuplicates(record_pairs: RecordPairs,
                     data_model,
                     classifier,
-                    num_cores: int = 1):
-    if num_cores < 2:
-        from multiprocessing.dummy import Process, Queue
-        SimpleQueue = Queue
-    else:
-        from .backport import Process, SimpleQueue, Queue  # type: ignore
+                    num_cores: int = 1,
+                    min_score: Optional[float] = None,
+                    scheduler: Optional[ChunkScheduler] = None,
+                    executor: Optional['Executor'] = None,
+                    profile: Optional[FieldProfile] = None):
 
     first, record_pairs = peek(record_pairs)
     if first is None:
@@ -227,75 +646,633 @@ def scoreDuplicates(record_pairs: RecordPairs,
                             "Is the data you are trying to match like "
                             "the data you trained on?")
 
-    record_pairs_queue: _Queue = Queue(2)
+    if executor is not None:
+        return _executorScoreDuplicates(executor,
+                                        functools.partial(_scoreRecordChunk,
+                                                          executor.state(data_model,
+                                                                         classifier),
+                                                          min_score=min_score,
+                                                          profile=profile is not None),
+                                        record_pairs,
+                                        tuple,
+                                        scheduler,
+                                        profile)
+
+    return _scoreDuplicates(ScoreDupes,
+                            (data_model, classifier),
+                            record_pairs,
+                            tuple,
+                            num_cores,
+                            min_score,
+                            scheduler,
+                            profile)
+
+
+def scoreIndexedDuplicates(index_pairs: IndexPairs,
+                           records: Sequence[Record],
+                           data_model,
+                           classifier,
+                           num_cores: int = 1,
+                           min_score: Optional[float] = None,
+                           scheduler: Optional[ChunkScheduler] = None,
+                           executor: Optional['Executor'] = None,
+                           profile: Optional[FieldProfile] = None):
+    '''
+    Like scoreDuplicates, but instead of pairs of records, takes
+    pairs of integer indices into `records`, a sequence of
+    (record_id, record) tuples.
+
+    The 'pairs' of the returned scored pairs are pairs of indices into
+    `records`, not record ids.
+    '''
+
+    first, index_pairs = peek(index_pairs)  # type: ignore
+    if first is None:
+        raise BlockingError("No records have been blocked together. "
+                            "Is the data you are trying to match like "
+                            "the data you trained on?")
+
+    if executor is not None:
+        # the workers of an executor outlive any one set of records,
+        # so each chunk carries the records it refers to
+        return _executorScoreDuplicates(executor,
+                                        functools.partial(_scoreIndexChunk,
+                                                          executor.state(data_model,
+                                                                         classifier),
+                                                          index_type=indexType(len(records)),
+                                                          min_score=min_score,
+                                                          profile=profile is not None),
+                                        index_pairs,
+                                        functools.partial(indexTask, records),
+                                        scheduler,
+                                        profile)
+
+    return _scoreDuplicates(ScoreIndexedDupes,
+                            (records, data_model, classifier),
+                            index_pairs,
+                            indexChunk,
+                            num_cores,
+                            min_score,
+                            scheduler,
+                            profile)
+
+
+def _scoreDuplicates(scorer_class: Callable[..., ScoreDupes],
+                     scorer_args: tuple,
+                     pairs: Iterable,
+                     pack: Callable[[Iterator], Sized],
+                     num_cores: int,
+                     min_score: Optional[float],
+                     scheduler: Optional[ChunkScheduler],
+                     profile: Optional[FieldProfile] = None):
+    if num_cores < 2:
+        from multiprocessing.dummy import Process, Queue, Lock, Value, Array
+        SimpleQueue = Queue
+    else:
+        from .backport import Process, SimpleQueue, Queue, Lock, Value, Array  # type: ignore
+
+    if scheduler is None:
+        scheduler = ChunkScheduler()
+
+    record_pairs_queue: _Queue = Queue(scheduler.queue_size)
     score_queue: _SimpleQueue = SimpleQueue()
-    result_queue: _SimpleQueue = SimpleQueue()
+    score_sink = ScoreSink(Lock(), Value('q', 0, lock=False))
+    timer = WorkTimer(Lock(), Array('d', [0.0, 0.0], lock=False))
 
     n_map_processes = max(num_cores, 1)
-    score_records = ScoreDupes(data_model,
-                               classifier,
-                               record_pairs_queue,
-                               score_queue)
+    score_records = scorer_class(*scorer_args,
+                                 record_pairs_queue,
+                                 score_queue,
+                                 score_sink,
+                                 timer,
+                                 min_score,
+                                 profile is not None)
     map_processes = [Process(target=score_records)
                      for _ in range(n_map_processes)]
 
     for process in map_processes:
         process.start()
 
-    reduce_process = Process(target=mergeScores,
-                             args=(score_queue,
-                                   result_queue,
-                                   n_map_processes))
-    reduce_process.start()
+    fillQueue(record_pairs_queue,
+              pairs,
+              n_map_processes,
+              scheduler.chunk_sizes(record_pairs_queue, timer),
+              pack)
+
+    dtype = None
+    seen_signals = 0
+    while seen_signals < n_map_processes:
+        signal = score_queue.get()
+        if isinstance(signal, Exception):
+            score_sink.remove()
+            raise ChildProcessError
+
+        _, worker_dtype, worker_profile = signal
+        if worker_dtype is not None:
+            dtype = worker_dtype
+        if profile is not None and worker_profile is not None:
+            profile.merge(worker_profile)
+
+        seen_signals += 1
+
+    for process in map_processes:
+        process.join()
+
+    return _sinkScores(score_sink, dtype)
+
+
+def _executorScoreDuplicates(executor: 'Executor',
+                             score_chunk: Callable,
+                             pairs: Iterable,
+                             pack: Callable[[Iterator], Sized],
+                             scheduler: Optional[ChunkScheduler],
+                             profile: Optional[FieldProfile] = None):
+
+    if scheduler is None:
+        scheduler = ChunkScheduler()
 
-    fillQueue(record_pairs_queue, record_pairs, n_map_processes)
+    # only this process writes to the sink, so it needs no real lock
+    score_sink = ScoreSink(multiprocessing.dummy.Lock(),
+                           multiprocessing.dummy.Value('q', 0))
 
-    result = result_queue.get()
-    if isinstance(result, Exception):
-        raise ChildProcessError
+    # the chunk size is read as each chunk is cut, so it follows the
+    # timings of the chunks that have come back so far
+    chunk_sizes = iter(lambda: scheduler.chunk_size, None)  # type: ignore
 
-    if result:
-        scored_pairs_file, dtype, size = result
-        scored_pairs = numpy.memmap(scored_pairs_file,
-                                    dtype=dtype,
-                                    shape=(size,))
+    dtype = None
+    try:
+        results = executor.imap(score_chunk,
+                                chunks(pairs, chunk_sizes, pack),
+                                scheduler.queue_size)
+        for scored_pairs, n_pairs, seconds, chunk_profile in results:
+            scheduler.observe(n_pairs, seconds)
+            if profile is not None and chunk_profile is not None:
+                profile.merge(chunk_profile)
+            if scored_pairs is not None:
+                score_sink.write(scored_pairs)
+                dtype = scored_pairs.dtype
+    except Exception:
+        score_sink.remove()
+        raise
+
+    return _sinkScores(score_sink, dtype)
+
+
+def _sinkScores(score_sink: ScoreSink, dtype: Optional[numpy.dtype]):
+    if dtype is not None:
+        scored_pairs = score_sink.scored_pairs(dtype)
     else:
+        score_sink.remove()
         dtype = numpy.dtype([('pairs', object, 2),
                              ('score', 'f4', 1)])
         scored_pairs = numpy.array([], dtype=dtype)
 
-    reduce_process.join()
+    return scored_pairs
 
-    for process in map_processes:
-        process.join()
 
-    return scored_pairs
+def chunks(iterable: Iterable,
+           chunk_sizes: Iterable[int],
+           pack: Callable[[Iterator], Sized] = tuple) -> Iterator:
+    '''
+    Cut an iterable into chunks, each as long as the next chunk size
+    '''
+    iterable = iter(iterable)
+
+    for chunk_size in chunk_sizes:
+        chunk = pack(itertools.islice(iterable, chunk_size))
+        if len(chunk):
+            yield chunk
+        else:
+            break
 
 
 def fillQueue(queue: _Queue,
-              iterable: RecordPairs,
+              iterable: Iterable,
               stop_signals: int,
-              chunk_size: int = 20000) -> None:
-    iterable = iter(iterable)
+              chunk_sizes: Iterable[int] = itertools.repeat(20000),
+              pack: Callable[[Iterator], Sized] = tuple) -> None:
+
+    for chunk in chunks(iterable, chunk_sizes, pack):
+        queue.put(chunk)
+        del chunk
+
+    # put poison pills in queue to tell scorers that they are
+    # done
+    for _ in range(stop_signals):
+        queue.put(None)
+
+
+def indexChunk(index_pairs: Iterator[Tuple[int, int]]) -> numpy.ndarray:
+    '''
+    Pack pairs of indices into an (n, 2) integer array, which is much
+    cheaper to send to another process than a tuple of tuples.
+    '''
+    flat = numpy.fromiter(itertools.chain.from_iterable(index_pairs),
+                          dtype=numpy.int64)
+    return flat.reshape(-1, 2)
+
+
+class IndexTask(tuple):
+    '''
+    A chunk of index pairs, renumbered to index into just the records
+    the chunk refers to, together with those records and the original
+    index of each of them.
+    '''
+    def __len__(self) -> int:
+        return len(self[1])
+
+
+def indexTask(records: Sequence[Record],
+              index_pairs: Iterator[Tuple[int, int]]) -> IndexTask:
+    chunk = indexChunk(index_pairs)
+    original_indices, local_pairs = numpy.unique(chunk, return_inverse=True)
+
+    return IndexTask((original_indices,
+                      local_pairs.reshape(-1, 2),
+                      [records[i] for i in original_indices.tolist()]))
+
+
+ChunkResult = Tuple[Optional[numpy.ndarray], int, float, Optional[FieldProfile]]
+
+
+def _scoreRecordChunk(state: 'WorkerState',
+                      record_pairs: RecordPairs,
+                      min_score: Optional[float] = None,
+                      profile: bool = False) -> ChunkResult:
+    start_time = time.perf_counter()
+    field_profile = FieldProfile() if profile else None
+    scored_pairs = scoreRecordPairs(record_pairs,
+                                    state.data_model,
+                                    state.classifier,
+                                    min_score,
+                                    field_profile)
+    return (scored_pairs,
+            len(record_pairs),  # type: ignore
+            time.perf_counter() - start_time,
+            field_profile)
+
+
+def _scoreIndexChunk(state: 'WorkerState',
+                     task: IndexTask,
+                     index_type: numpy.dtype,
+                     min_score: Optional[float] = None,
+                     profile: bool = False) -> ChunkResult:
+    start_time = time.perf_counter()
+    field_profile = FieldProfile() if profile else None
+    original_indices, local_pairs, records = task
+    scored_pairs = scoreIndexPairs(local_pairs,
+                                   records,
+                                   index_type,
+                                   state.data_model,
+                                   state.classifier,
+                                   min_score,
+                                   field_profile)
+    if scored_pairs is not None:
+        scored_pairs['pairs'] = original_indices[scored_pairs['pairs']]
+
+    return (scored_pairs,
+            len(local_pairs),
+            time.perf_counter() - start_time,
+            field_profile)
+
+
+def _scoreBlocks(state: 'WorkerState',
+                 blocks: List,
+                 min_score: Optional[float] = None,
+                 n_matches: Optional[int] = None) -> List[Tuple[numpy.ndarray, int, float]]:
+    score_records = ScoreGazette(state.data_model,
+                                 state.classifier,
+                                 min_score,
+                                 n_matches)
+    return [timed(score_records, block) for block in blocks]
+
+
+# Data models and classifiers that a worker process has unpickled,
+# by the token of their WorkerState. A worker only unpickles each
+# one once, however many tasks it gets for it. The ones a worker was
+# started with are kept apart, so they are never evicted.
+_worker_states: Dict[str, Tuple[Any, Any]] = {}
+_preloaded_states: Dict[str, Tuple[Any, Any]] = {}
+_MAX_WORKER_STATES = 8
+
+
+class WorkerState(object):
+    '''
+    The data model and classifier a scoring task needs, packaged so
+    that they are cheap to send to a worker process again and again.
+
+    They are pickled once, the first time the state is sent anywhere,
+    and a worker process unpickles them once and then reuses them for
+    every task that carries the same state. Threads use the objects
+    directly and never pickle them at all.
+    '''
+    def __init__(self, data_model, classifier, preloaded: bool = False):
+        self.data_model = data_model
+        self.classifier = classifier
+        self.token = uuid.uuid4().hex
+        self.preloaded = preloaded
+        self._payload: Optional[bytes] = None
+
+    def __getstate__(self) -> Tuple[str, Optional[bytes]]:
+        if self.preloaded:
+            # every worker already has it, so only send the token
+            return self.token, None
+
+        if self._payload is None:
+            self._payload = pickle.dumps((self.data_model, self.classifier),
+                                         protocol=pickle.HIGHEST_PROTOCOL)
+        return self.token, self._payload
+
+    def __setstate__(self, state: Tuple[str, Optional[bytes]]) -> None:
+        self.token, payload = state
+        self.preloaded = payload is None
+        self._payload = None
+
+        if payload is None:
+            self.data_model, self.classifier = _preloaded_states[self.token]
+            return
+
+        if self.token not in _worker_states:
+            while len(_worker_states) >= _MAX_WORKER_STATES:
+                del _worker_states[next(iter(_worker_states))]
+            _worker_states[self.token] = pickle.loads(payload)
+
+        self.data_model, self.classifier = _worker_states[self.token]
+
+    @property
+    def initargs(self) -> Tuple[str, Any, Any]:
+        '''
+        The arguments for :func:`preloadWorkerState`, to start workers
+        that already have this state
+        '''
+        return self.token, self.data_model, self.classifier
+
+
+class Executor(object):
+    '''
+    Where dedupe runs work that can be done in parallel, like scoring
+    chunks of pairs or clustering connected components.
+
+    Subclasses need to implement :meth:`submit`, which starts a call
+    and returns a :class:`concurrent.futures.Future` for its result,
+    which can also be awaited with :func:`asyncio.wrap_future`. Calls
+    that are submitted to an executor that uses processes must be
+    picklable.
+    '''
+
+    # how many calls can run at the same time
+    workers = 1
+
+    # the state every worker was started with, if there is one
+    _preloaded: Optional[WorkerState] = None
+
+    def submit(self, func: Callable, *args) -> Any:
+        raise NotImplementedError
+
+    def state(self, data_model, classifier) -> WorkerState:
+        '''
+        Package a data model and classifier to send along with tasks
+        '''
+        preloaded = self._preloaded
+        if (preloaded is not None and
+                data_model is preloaded.data_model and
+                classifier is preloaded.classifier):
+            return preloaded
+
+        return WorkerState(data_model, classifier)
+
+    def imap(self,
+             func: Callable,
+             iterable: Iterable,
+             queue_size: int = 2) -> Iterator:
+        '''
+        Call `func(item)` for each item, yielding the results in
+        order. Only enough items to keep every worker busy, plus
+        `queue_size` more, are submitted ahead of the results that
+        have been yielded.
+        '''
+        window = self.workers + queue_size
+        pending: collections.deque = collections.deque()
 
-    while True:
-        chunk = tuple(itertools.islice(iterable, chunk_size))
-        if chunk:
-            queue.put(chunk)
-            del chunk
+        try:
+            for item in iterable:
+                pending.append(self.submit(func, item))
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # if we stop early, don't leave work running for nobody
+            for future in pending:
+                future.cancel()
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> 'Executor':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class SerialExecutor(Executor):
+    '''
+    Runs every call in the calling thread, as soon as it's submitted
+    '''
+    def submit(self, func: Callable, *args) -> concurrent.futures.Future:
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        try:
+            future.set_result(func(*args))
+        except Exception as e:
+            future.set_exception(e)
+
+        return future
+
+
+class FuturesExecutor(Executor):
+    '''
+    Runs calls on a :mod:`concurrent.futures` executor, like a
+    ThreadPoolExecutor or ProcessPoolExecutor, or anything else with
+    the same `submit` method. The executor belongs to you, so closing
+    this does not shut it down.
+
+    Otherwise, the data model and classifier are sent along with every
+    call. To send them once, start the workers with them, and pass
+    the same state here:
+
+    .. code:: python
+
+        > state = dedupe.core.WorkerState(deduper.data_model,
+        >                                 deduper.classifier)
+        > pool = ProcessPoolExecutor(4,
+        >                            initializer=dedupe.core.preloadWorkerState,
+        >                            initargs=state.initargs)
+        > deduper.executor = dedupe.core.FuturesExecutor(pool, state=state)
+
+    Args:
+        executor: the executor to submit calls to
+        workers: how many calls the executor can run at the same
+                 time. Defaults to the executor's number of workers,
+                 if it has one.
+        state: the state the executor's workers were started with
+    '''
+    def __init__(self,
+                 executor: concurrent.futures.Executor,
+                 workers: Optional[int] = None,
+                 state: Optional[WorkerState] = None):
+        self.executor = executor
+        if workers is None:
+            workers = getattr(executor, '_max_workers', 1)
+        self.workers = workers
+
+        if state is not None:
+            state.preloaded = True
+        self._preloaded = state
+
+    def submit(self, func: Callable, *args) -> concurrent.futures.Future:
+        return self.executor.submit(func, *args)
+
+
+class ThreadExecutor(FuturesExecutor):
+    '''
+    Runs calls on a pool of threads. Scoring only runs in parallel on
+    threads if the comparators release the GIL, or on a Python build
+    without a GIL, but threads don't need to be started as new
+    processes, so they work anywhere, including inside worker
+    processes that are not allowed to have children.
+
+    Args:
+        workers: number of threads
+    '''
+    def __init__(self, workers: int):
+        super().__init__(concurrent.futures.ThreadPoolExecutor(max(workers, 1)))
+
+    def close(self) -> None:
+        self.executor.shutdown()
+
+
+class ProcessExecutor(Executor):
+    '''
+    Runs calls on a multiprocessing pool that lives until it is closed.
+
+    Args:
+        processes: number of worker processes
+        start_method: how to start the workers, 'fork', 'spawn' or
+                      'forkserver'. Defaults to 'spawn' on Mac OS X
+                      and the platform default elsewhere.
+        preload: with 'forkserver', modules the server imports once
+                 so that workers forked from it don't have to
+    '''
+    def __init__(self,
+                 processes: int,
+                 start_method: Optional[str] = None,
+                 preload: Sequence[str] = ('dedupe',),
+                 initializer: Optional[Callable] = None,
+                 initargs: tuple = ()):
+
+        if start_method is None and platform.system() == 'Darwin':
+            start_method = 'spawn'
+
+        ctx = multiprocessing.get_context(start_method)
+        if ctx.get_start_method() == 'forkserver' and preload:
+            ctx.set_forkserver_preload(list(preload))  # type: ignore
+
+        self.workers = max(processes, 1)
+        self._pool = ctx.Pool(self.workers,  # type: ignore
+                              initializer=initializer,
+                              initargs=initargs)
+
+    def submit(self, func: Callable, *args) -> concurrent.futures.Future:
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        self._pool.apply_async(func,
+                               args,
+                               callback=functools.partial(_setResult, future),
+                               error_callback=functools.partial(_setException,
+                                                                future))
+        return future
+
+    def close(self) -> None:
+        self._pool.close()
+        self._pool.join()
+
+
+def _setResult(future: concurrent.futures.Future, result: Any) -> None:
+    # The pool calls this from its result handler thread, which dies if
+    # a callback raises, and a future that was cancelled while its call
+    # was running raises if we try to set it. So only set futures that
+    # nobody has cancelled, and claim them first so nobody can.
+    if future.set_running_or_notify_cancel():
+        future.set_result(result)
+
+
+def _setException(future: concurrent.futures.Future,
+                  exception: BaseException) -> None:
+    if future.set_running_or_notify_cancel():
+        future.set_exception(exception)
+
+
+def preloadWorkerState(token: str, data_model, classifier) -> None:
+    '''
+    Start a worker with a data model and classifier, so that tasks
+    only need to send the token of their :class:`WorkerState`
+    '''
+    _preloaded_states[token] = (data_model, classifier)
+
+
+class ScoringPool(ProcessExecutor):
+    '''
+    A pool of scoring processes that lives as long as you need it to.
+
+    Without a pool, every call to scoreDuplicates starts new
+    processes, and every call to scoreGazette starts a new
+    multiprocessing Pool, and each time the data model and classifier
+    are pickled and sent to every worker. When scoring is called many
+    times, for example for each search of a gazetteer, that startup
+    cost can be more than the cost of scoring. A ScoringPool sends the
+    data model and classifier to its workers once, when they start,
+    and keeps them until the pool is closed.
+
+    Args:
+        data_model: the data model the workers score with
+        classifier: the classifier the workers score with
+        processes: number of worker processes
+        start_method: how to start the workers, 'fork', 'spawn' or
+                      'forkserver'. Defaults to 'spawn' on Mac OS X
+                      and the platform default elsewhere.
+        preload: with 'forkserver', modules the server imports once
+                 so that workers forked from it don't have to
+    '''
+    def __init__(self,
+                 data_model,
+                 classifier,
+                 processes: int,
+                 start_method: Optional[str] = None,
+                 preload: Sequence[str] = ('dedupe',)):
 
-        else:
-            # put poison pills in queue to tell scorers that they are
-            # done
-            for _ in range(stop_signals):
-                queue.put(None)
-            break
+        state = WorkerState(data_model, classifier)
+
+        super().__init__(processes,
+                         start_method,
+                         preload,
+                         initializer=preloadWorkerState,
+                         initargs=state.initargs)
+
+        state.preloaded = True
+        self._preloaded = state
 
 
 class ScoreGazette(object):
-    def __init__(self, data_model, classifier):
+    def __init__(self,
+                 data_model,
+                 classifier,
+                 min_score: Optional[float] = None,
+                 n_matches: Optional[int] = None):
         self.data_model = data_model
         self.classifier = classifier
+        self.min_score = min_score
+        self.n_matches = n_matches
 
     def __call__(self, block: RecordPairs) -> numpy.ndarray:
 
@@ -303,12 +1280,18 @@ class ScoreGazette(object):
         record_ids = cast(Tuple[Tuple[RecordID, RecordID], ...], record_ids)
         records = cast(Tuple[Tuple[RecordDict, RecordDict], ...], records)
 
-        distances = self.data_model.distances(records)
-        scores = self.classifier.predict_proba(distances)[:, -1]
-
         id_type = sniff_id_type(record_ids)
         ids = numpy.array(record_ids, dtype=id_type)
 
+        bound = cascadeBound(self.classifier, self.min_score)
+        if bound is not None:
+            distances, kept = self.data_model.cascadeDistances(records, bound)
+            ids = ids[kept]
+        else:
+            distances = self.data_model.distances(records)
+
+        scores = self.classifier.predict_proba(distances)[:, -1]
+
         dtype = numpy.dtype([('pairs', id_type, 2),
                              ('score', 'f4')])
 
@@ -318,33 +1301,217 @@ class ScoreGazette(object):
         scored_pairs['pairs'] = ids
         scored_pairs['score'] = scores
 
+        if self.min_score is not None:
+            scored_pairs = scored_pairs[scores > self.min_score]
+
+        if self.n_matches and len(scored_pairs) > self.n_matches:
+            top = numpy.argsort(-scored_pairs['score'],
+                                kind='stable')[:self.n_matches]
+            scored_pairs = scored_pairs[top]
+
         return scored_pairs
 
 
 def scoreGazette(record_pairs: Blocks,
                  data_model,
                  classifier,
-                 num_cores: int = 1) -> Generator[numpy.ndarray, None, None]:
+                 num_cores: int = 1,
+                 min_score: Optional[float] = None,
+                 n_matches: Optional[int] = None,
+                 scheduler: Optional[ChunkScheduler] = None,
+                 executor: Optional[Executor] = None) -> Generator[numpy.ndarray, None, None]:
 
     first, record_pairs = peek(record_pairs)
     if first is None:
         return  # terminate iteration
 
-    imap, pool = appropriate_imap(num_cores)
+    if scheduler is None:
+        scheduler = ChunkScheduler()
+
+    if executor is not None:
+        yield from _executorScoreGazette(executor,
+                                         executor.state(data_model, classifier),
+                                         record_pairs,
+                                         min_score,
+                                         n_matches,
+                                         scheduler)
+        return
+
+    imap, map_pool = appropriate_imap(num_cores, scheduler.blocks_per_task)
+
+    score_records = functools.partial(timed,
+                                      ScoreGazette(data_model,
+                                                   classifier,
+                                                   min_score,
+                                                   n_matches))
+
+    n_blocks, n_pairs, seconds = 0, 0, 0.0
+    for scored_pairs, block_size, block_seconds in imap(score_records,
+                                                        record_pairs):
+        n_blocks += 1
+        n_pairs += block_size
+        seconds += block_seconds
 
-    score_records = ScoreGazette(data_model, classifier)
-
-    for scored_pairs in imap(score_records, record_pairs):
         yield scored_pairs
 
+    scheduler.observe_blocks(n_blocks, n_pairs, seconds)
+
     # The underlying processes in the pool should terminate when the
     # pool is garbage collected, but sometimes it takes a while
     # before GC, so do it explicitly here
-    pool.close()
-    pool.join()
+    map_pool.close()
+    map_pool.join()
+
+
+def _executorScoreGazette(executor: Executor,
+                          state: WorkerState,
+                          record_pairs: Blocks,
+                          min_score: Optional[float],
+                          n_matches: Optional[int],
+                          scheduler: ChunkScheduler) -> Generator[numpy.ndarray, None, None]:
+
+    blocks_per_task = iter(lambda: scheduler.blocks_per_task, None)  # type: ignore
+    score_blocks = functools.partial(_scoreBlocks,
+                                     state,
+                                     min_score=min_score,
+                                     n_matches=n_matches)
+
+    for scored_blocks in executor.imap(score_blocks,
+                                       chunks(record_pairs, blocks_per_task, list),
+                                       scheduler.queue_size):
+        yield from _observeBlocks(scored_blocks, scheduler)
+
+
+async def scoreGazetteAsync(record_pairs: Union[Blocks, AsyncIterator[List]],
+                            data_model,
+                            classifier,
+                            executor: Optional[Executor] = None,
+                            min_score: Optional[float] = None,
+                            n_matches: Optional[int] = None,
+                            scheduler: Optional[ChunkScheduler] = None) -> AsyncGenerator[numpy.ndarray, None]:
+    '''
+    Like scoreGazette, but an asynchronous generator that waits for
+    the scored blocks without blocking the event loop. Blocks are
+    scored on `executor`, or, if there isn't one, on the event loop's
+    default executor. Any number of these can share one executor.
+    The blocks can also be an asynchronous iterator, like
+    :func:`readBlocksAsync`, and are scored as they arrive.
+    '''
+
+    if scheduler is None:
+        scheduler = ChunkScheduler()
+
+    loop = asyncio.get_running_loop()
+
+    if executor is None:
+        state = WorkerState(data_model, classifier)
+        workers = 1
+
+        def submit(func, item):
+            return loop.run_in_executor(None, func, item)
+    else:
+        state = executor.state(data_model, classifier)
+        workers = executor.workers
+
+        def submit(func, item):
+            return asyncio.wrap_future(executor.submit(func, item))  # type: ignore
+
+    blocks_per_task = iter(lambda: scheduler.blocks_per_task, None)  # type: ignore
+    score_blocks = functools.partial(_scoreBlocks,
+                                     state,
+                                     min_score=min_score,
+                                     n_matches=n_matches)
 
+    window = workers + scheduler.queue_size
+    pending: collections.deque = collections.deque()
 
-def appropriate_imap(num_cores):
+    try:
+        async for blocks in _chunksAsync(record_pairs, blocks_per_task):
+            pending.append(submit(score_blocks, blocks))
+            if len(pending) >= window:
+                for scored_pairs in _observeBlocks(await pending.popleft(),
+                                                   scheduler):
+                    yield scored_pairs
+
+        while pending:
+            for scored_pairs in _observeBlocks(await pending.popleft(),
+                                               scheduler):
+                yield scored_pairs
+    finally:
+        # if we stop early, don't leave work running for nobody
+        for future in pending:
+            future.cancel()
+
+
+async def _chunksAsync(iterable: Union[Iterable, AsyncIterator],
+                       chunk_sizes: Iterable[int]) -> AsyncIterator[List]:
+    '''
+    Like chunks, for an iterable or an asynchronous iterator
+    '''
+    if not hasattr(iterable, '__aiter__'):
+        for chunk in chunks(iterable, chunk_sizes, list):  # type: ignore
+            yield chunk
+        return
+
+    iterator = iterable.__aiter__()  # type: ignore
+    for chunk_size in chunk_sizes:
+        chunk = []
+        try:
+            while len(chunk) < chunk_size:
+                chunk.append(await iterator.__anext__())
+        except StopAsyncIteration:
+            if chunk:
+                yield chunk
+            return
+        yield chunk
+
+
+async def readBlocksAsync(blocks: Blocks,
+                          scheduler: ChunkScheduler) -> AsyncIterator[List]:
+    '''
+    Read blocks on the event loop's default executor, as many at a
+    time as the scheduler sends to a worker, so that making them,
+    like looking up a gazetteer's blocks, doesn't block the event
+    loop, and only a few are held in memory at once.
+    '''
+    loop = asyncio.get_running_loop()
+    blocks = iter(blocks)
+
+    while True:
+        batch = await loop.run_in_executor(
+            None,
+            list,
+            itertools.islice(blocks, scheduler.blocks_per_task))
+        if not batch:
+            return
+        for block in batch:
+            yield block
+
+
+def _observeBlocks(scored_blocks: List[Tuple[numpy.ndarray, int, float]],
+                   scheduler: ChunkScheduler) -> Iterator[numpy.ndarray]:
+    n_pairs, seconds = 0, 0.0
+    for scored_pairs, block_size, block_seconds in scored_blocks:
+        n_pairs += block_size
+        seconds += block_seconds
+
+        yield scored_pairs
+
+    scheduler.observe_blocks(len(scored_blocks), n_pairs, seconds)
+
+
+def timed(score_records: Callable[[Any], numpy.ndarray],
+          block: List) -> Tuple[numpy.ndarray, int, float]:
+    '''
+    Score a block, and also return the size of the block and how
+    long it took to score
+    '''
+    start_time = time.perf_counter()
+    scored_pairs = score_records(block)
+    return scored_pairs, len(block), time.perf_counter() - start_time
+
+
+def appropriate_imap(num_cores, chunksize=20000):
     if num_cores < 2:
         imap = map
 
@@ -360,7 +1527,7 @@ def appropriate_imap(num_cores):
     else:
         from .backport import Pool
         pool = Pool(processes=num_cores)
-        imap = functools.partial(pool.imap_unordered, chunksize=20000)
+        imap = functools.partial(pool.imap_unordered, chunksize=chunksize)
 
     return imap, pool
 
@@ -417,6 +1584,16 @@ class FullEnumerator(object):
         return x * self.width + y
 
 
+def indexType(n_records: int) -> numpy.dtype:
+    '''
+    The smallest integer type that can index n_records records
+    '''
+    if n_records <= numpy.iinfo(numpy.int32).max:
+        return numpy.dtype(numpy.int32)
+    else:
+        return numpy.dtype(numpy.int64)
+
+
 def sniff_id_type(ids: Sequence[Tuple[RecordID, RecordID]]) -> Union[Type[int], Tuple[Type[str], int]]:
     example = ids[0][0]
     python_type = type(example)
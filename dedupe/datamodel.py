@@ -1,8 +1,15 @@
 import pkgutil
+import collections
+import itertools
+import sys
+import threading
+import time
+import warnings
 
 import numpy
 import copyreg
 import types
+from typing import Callable, NamedTuple, Optional, Dict, Tuple
 
 import dedupe.variables
 import dedupe.variables.base as base
@@ -25,6 +32,14 @@ class DataModel(object):
             raise ValueError('The field definitions cannot be empty')
         primary_fields, variables = typifyFields(fields)
         self.primary_fields = primary_fields
+
+        for field in primary_fields:
+            batch = (getattr(field, 'batch_comparator', None) is not None or
+                     isBatch(field))
+            if getattr(field, 'cache_budget', None) and batch:
+                warnings.warn("%s compares whole columns of values at a "
+                              "time, so its comparisons can't be cached, "
+                              "and 'cache' is ignored" % field.name)
         self._derived_start = len(variables)
 
         variables += interactions(fields, primary_fields)
@@ -41,19 +56,68 @@ class DataModel(object):
     # Changing this from a property to just a normal attribute causes
     # pickling problems, because we are removing static methods from
     # their class context. This could be fixed by defining comparators
-    # outside of classes in fieldclasses
+    # outside of classes in fieldclasses. For the same reason, the
+    # comparators are only built once per process, and not pickled
     @property
     def _field_comparators(self):
+        comparators = self.__dict__.get('_comparators')
+        if comparators is not None:
+            return comparators
+
         start = 0
         stop = 0
         comparators = []
         for field in self.primary_fields:
             stop = start + len(field)
-            comparators.append((field.field, field.comparator, start, stop))
+            batch_comparator = getattr(field, 'batch_comparator', None)
+            if batch_comparator is not None:
+                compare, batch = batch_comparator, True
+            else:
+                compare, batch = field.comparator, isBatch(field)
+            comparators.append(FieldComparator(field.field,
+                                               compare,
+                                               start,
+                                               stop,
+                                               batch,
+                                               field.name,
+                                               getattr(field, 'cache_budget', None),
+                                               getattr(field, 'symmetric', False),
+                                               getattr(field, 'prepare', None),
+                                               getattr(field, 'feature_comparator', None),
+                                               getattr(field, 'cascade', False),
+                                               getattr(field, 'distance_bounds',
+                                                       (-numpy.inf, numpy.inf))))
             start = stop
 
+        self._comparators = comparators
         return comparators
 
+    @property
+    def has_features(self) -> bool:
+        return any(comparator.prepare is not None
+                   for comparator in self._field_comparators)
+
+    def prepare(self, record):
+        '''
+        Return a copy of the record with the comparator features of
+        its fields added, for the fields whose types compare features.
+        Then those features don't have to be computed again for each
+        pair the record is in. If no field types compare features,
+        the record is returned as is.
+        '''
+        prepared = record
+        for comparator in self._field_comparators:
+            if comparator.prepare is not None:
+                if prepared is record:
+                    prepared = dict(record)
+
+                value = record[comparator.field]
+                if value is not None:
+                    value = comparator.prepare(value)
+                prepared[featureKey(comparator.name)] = value
+
+        return prepared
+
     def predicates(self, index_predicates=True, canopies=True):
         predicates = set()
         for definition in self.primary_fields:
@@ -71,29 +135,255 @@ class DataModel(object):
 
         return predicates
 
-    def distances(self, record_pairs):
+    def distances(self, record_pairs, profile=None):
+        '''
+        The distances of each pair of records. If a FieldProfile is
+        given, how long each field took is recorded in it.
+        '''
         num_records = len(record_pairs)
 
         distances = numpy.empty((num_records, len(self)), 'f4')
-        field_comparators = self._field_comparators
 
-        for i, (record_1, record_2) in enumerate(record_pairs):
+        if num_records:
+            records_1, records_2 = zip(*record_pairs)
 
-            for field, compare, start, stop in field_comparators:
-                if record_1[field] is not None and record_2[field] is not None:
-                    distances[i, start:stop] = compare(record_1[field],
-                                                       record_2[field])
-                elif hasattr(compare, 'missing'):
-                    distances[i, start:stop] = compare(record_1[field],
-                                                       record_2[field])
-                else:
-                    distances[i, start:stop] = numpy.nan
+            self._compareFields(distances,
+                                records_1,
+                                records_2,
+                                self._field_comparators,
+                                profile)
 
-        distances = self._derivedDistances(distances)
+        distances = self._derivedDistances(distances, profile)
 
         return distances
 
-    def _derivedDistances(self, primary_distances):
+    def cascadeDistances(self, record_pairs, keep, profile=None):
+        '''
+        Like distances, but the fields marked 'cascade' are only
+        compared for the pairs that could still matter.
+
+        The other fields are compared first. `keep` is then called
+        with arrays of the least and greatest each distance could be,
+        given what the cascaded fields' comparators can return, and
+        returns a boolean array of the pairs to finish comparing.
+        Returns the distances of the kept pairs, and that array.
+        '''
+        comparators = self._field_comparators
+        cascaded = [comparator for comparator in comparators
+                    if comparator.cascade]
+
+        if not cascaded or not record_pairs:
+            return (self.distances(record_pairs, profile),
+                    numpy.ones(len(record_pairs), bool))
+
+        # zeros, not empty, because the bounds are made from a copy of
+        # the columns before the cascaded fields are compared
+        distances = numpy.zeros((len(record_pairs), len(self)), 'f4')
+
+        records_1, records_2 = zip(*record_pairs)
+        self._compareFields(distances,
+                            records_1,
+                            records_2,
+                            [comparator for comparator in comparators
+                             if not comparator.cascade],
+                            profile)
+
+        lower, upper = self._distanceBounds(distances,
+                                            records_1,
+                                            records_2,
+                                            cascaded)
+        kept = numpy.asarray(keep(lower, upper), bool)
+
+        stats = self.__dict__.setdefault('_cascade_stats',
+                                         {'pairs': 0, 'pruned': 0})
+        stats['pairs'] += len(kept)
+        stats['pruned'] += len(kept) - int(kept.sum())
+
+        distances = distances[kept]
+        if len(distances):
+            self._compareFields(distances,
+                                list(itertools.compress(records_1, kept)),
+                                list(itertools.compress(records_2, kept)),
+                                cascaded,
+                                profile)
+
+        return self._derivedDistances(distances, profile), kept
+
+    @property
+    def cascade_stats(self):
+        '''
+        How many pairs went through cascade scoring, and how many of
+        them were pruned, without comparing their cascaded fields,
+        because they could not score above the minimum score. Like the
+        comparator caches, these only count the pairs scored in this
+        process.
+        '''
+        return dict(self.__dict__.get('_cascade_stats',
+                                      {'pairs': 0, 'pruned': 0}))
+
+    def _compareFields(self,
+                       distances,
+                       records_1,
+                       records_2,
+                       comparators,
+                       profile=None):
+        for comparator in comparators:
+            if profile is not None:
+                start_time = time.perf_counter()
+
+            self._compareField(distances, records_1, records_2, comparator)
+
+            if profile is not None:
+                column = distances[:, comparator.start]
+                profile.record(comparator.name,
+                               len(distances),
+                               int(numpy.isnan(column).sum()),
+                               time.perf_counter() - start_time)
+
+    def _compareField(self, distances, records_1, records_2, comparator):
+        field, compare, start, stop, batch = comparator[:5]
+
+        if comparator.prepare is not None:
+            features: Dict = {}
+            distances[:, start:stop] = fieldDistances(
+                comparator.feature_comparator,
+                fieldFeatures(records_1, comparator, features),
+                fieldFeatures(records_2, comparator, features),
+                stop - start)
+            return
+
+        if comparator.cache_budget and not batch:
+            compare = self._comparatorCache(comparator)
+
+        # compare a whole column of field values at a time
+        # instead of a whole record pair at a time
+        values_1 = [record[field] for record in records_1]
+        values_2 = [record[field] for record in records_2]
+
+        distances[:, start:stop] = uniqueFieldDistances(compare,
+                                                        values_1,
+                                                        values_2,
+                                                        stop - start,
+                                                        batch)
+
+    def _distanceBounds(self, distances, records_1, records_2, cascaded):
+        '''
+        The least and greatest values each column of distances could
+        have, once the cascaded fields are compared and the derived
+        distances are computed.
+        '''
+        primary_end = self._derived_start
+
+        lower = numpy.zeros(distances.shape)
+        lower[:, :primary_end] = distances[:, :primary_end]
+        upper = lower.copy()
+
+        # cells we can't know yet. A comparator can return NaN for
+        # values that are present, which becomes a distance of 0 and
+        # a missing data indicator of 0, so the bounds of these cells
+        # always include 0
+        unknown = numpy.zeros((len(distances), primary_end), bool)
+
+        for comparator in cascaded:
+            field, compare, start, stop = comparator[:4]
+            least, greatest = comparator.distance_bounds
+
+            if hasattr(compare, 'missing'):
+                present = numpy.ones(len(distances), bool)
+            else:
+                present = numpy.fromiter((record_1[field] is not None and
+                                          record_2[field] is not None
+                                          for record_1, record_2
+                                          in zip(records_1, records_2)),
+                                         bool,
+                                         len(distances))
+
+            lower[:, start:stop] = numpy.nan
+            upper[:, start:stop] = numpy.nan
+            lower[present, start:stop] = min(least, 0)
+            upper[present, start:stop] = max(greatest, 0)
+            unknown[present, start:stop] = True
+
+        current_column = primary_end
+        unknown_derived = []
+        for interaction in self._interaction_indices:
+            missing = numpy.isnan(lower[:, interaction]).any(axis=1)
+            factors_lower = numpy.nan_to_num(lower[:, interaction])
+            factors_upper = numpy.nan_to_num(upper[:, interaction])
+
+            product_lower = factors_lower[:, 0]
+            product_upper = factors_upper[:, 0]
+            for i in range(1, len(interaction)):
+                products = [boundProduct(a, b)
+                            for a in (product_lower, product_upper)
+                            for b in (factors_lower[:, i],
+                                      factors_upper[:, i])]
+                product_lower = numpy.minimum.reduce(products)
+                product_upper = numpy.maximum.reduce(products)
+
+            lower[:, current_column] = numpy.where(missing,
+                                                   numpy.nan,
+                                                   product_lower)
+            upper[:, current_column] = numpy.where(missing,
+                                                   numpy.nan,
+                                                   product_upper)
+            unknown_derived.append(~missing &
+                                   unknown[:, interaction].any(axis=1))
+
+            current_column += 1
+
+        if unknown_derived:
+            unknown = numpy.hstack([unknown,
+                                    numpy.column_stack(unknown_derived)])
+
+        missing_data = numpy.isnan(lower[:, :current_column])
+        lower[:, :current_column][missing_data] = 0
+        upper[:, :current_column][missing_data] = 0
+
+        if self._missing_field_indices:
+            not_missing = 1 - missing_data[:, self._missing_field_indices]
+            lower[:, current_column:] = numpy.where(
+                unknown[:, self._missing_field_indices], 0, not_missing)
+            upper[:, current_column:] = not_missing
+
+        return lower, upper
+
+    def _comparatorCache(self, comparator):
+        # the caches are made as they are needed, and are not pickled,
+        # so each scoring worker fills its own
+        caches = self.__dict__.setdefault('_comparator_caches', {})
+        try:
+            return caches[comparator.name]
+        except KeyError:
+            cache = ComparatorCache(comparator.comparator,
+                                    comparator.cache_budget,
+                                    comparator.symmetric)
+            caches[comparator.name] = cache
+            return cache
+
+    @property
+    def comparator_cache_stats(self):
+        '''
+        For each variable with a comparator cache, how many
+        comparisons it answered from the cache, how many it had to
+        compute, and how many results it holds. The caches are per
+        process, so these only count the comparisons made in this
+        process.
+        '''
+        caches = self.__dict__.get('_comparator_caches', {})
+        return {name: cache.stats for name, cache in caches.items()}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_comparator_caches', None)
+        state.pop('_cascade_stats', None)
+        state.pop('_comparators', None)
+        return state
+
+    def _derivedDistances(self, primary_distances, profile=None):
+        if profile is not None:
+            start_time = time.perf_counter()
+
         distances = primary_distances
 
         current_column = self._derived_start
@@ -112,6 +402,12 @@ class DataModel(object):
             distances[:, current_column:] =\
                 1 - missing_data[:, self._missing_field_indices]
 
+        if profile is not None:
+            profile.record(DERIVED_DISTANCES,
+                           len(distances),
+                           0,
+                           time.perf_counter() - start_time)
+
         return distances
 
     def check(self, record):
@@ -123,6 +419,266 @@ class DataModel(object):
                                  "in a record" % field)
 
 
+# the name the derived distances, like interactions and missing data
+# indicators, are recorded under in a dedupe.core.FieldProfile
+DERIVED_DISTANCES = '(derived distances)'
+
+
+class FieldComparator(NamedTuple):
+    field: str
+    comparator: Callable
+    start: int
+    stop: int
+    batch: bool
+    name: str
+    cache_budget: Optional[int]
+    symmetric: bool
+    prepare: Optional[Callable]
+    feature_comparator: Optional[Callable]
+    cascade: bool
+    distance_bounds: Tuple[float, float]
+
+
+def boundProduct(a, b):
+    '''
+    The elementwise product of two arrays of distance bounds, where
+    zero times an infinite bound is zero, since the distances
+    themselves are finite.
+    '''
+    with numpy.errstate(invalid='ignore'):
+        return numpy.where((a == 0) | (b == 0), 0, a * b)
+
+
+def featureKey(name):
+    '''
+    The key of a variable's feature in a prepared record. It's a
+    tuple, so it can't be the same as any field name.
+    '''
+    return ('features', name)
+
+
+def fieldFeatures(records, comparator, features):
+    '''
+    The features of a field for each record, taken from the record if
+    it has been prepared, or else computed, once for each distinct
+    value. `features` holds the features computed so far, by value.
+    '''
+    key = featureKey(comparator.name)
+    field = comparator.field
+    prepare = comparator.prepare
+
+    column = []
+    for record in records:
+        try:
+            column.append(record[key])
+            continue
+        except KeyError:
+            pass
+
+        value = record[field]
+        if value is None:
+            column.append(None)
+            continue
+
+        try:
+            feature = features[value]
+        except KeyError:
+            feature = features[value] = prepare(value)
+        except TypeError:
+            feature = prepare(value)
+
+        column.append(feature)
+
+    return column
+
+
+class ComparatorCache(object):
+    '''
+    A least recently used cache of a comparator's results, keyed by
+    the pair of values compared, and holding at most about
+    `max_bytes` of values and results.
+
+    If the comparator is symmetric, the pair (a, b) and the pair
+    (b, a) share a single entry. Values that can't be hashed are
+    compared without the cache. Threads that score with the same data
+    model share its caches, so they are locked while they are read
+    or changed, but not while the comparator runs.
+    '''
+
+    # rough size of the bookkeeping for each entry, on top of the
+    # sizes of the values and the result
+    entry_overhead = 200
+
+    def __init__(self, compare, max_bytes, symmetric=False):
+        self.compare = compare
+        self.max_bytes = max_bytes
+        self.symmetric = symmetric
+
+        if hasattr(compare, 'missing'):
+            self.missing = compare.missing
+
+        self._results = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, value_1, value_2):
+        key = (value_1, value_2)
+        if self.symmetric:
+            try:
+                if value_2 < value_1:
+                    key = (value_2, value_1)
+            except TypeError:
+                pass
+
+        try:
+            with self._lock:
+                if key in self._results:
+                    self._results.move_to_end(key)
+                    self.hits += 1
+                    return self._results[key]
+                self.misses += 1
+        except TypeError:
+            return self.compare(value_1, value_2)
+
+        result = self.compare(value_1, value_2)
+
+        with self._lock:
+            if key not in self._results:
+                self._results[key] = result
+                self.bytes += self._size(key, result)
+            while self.bytes > self.max_bytes and self._results:
+                old_key, old_result = self._results.popitem(last=False)
+                self.bytes -= self._size(old_key, old_result)
+
+        return result
+
+    def _size(self, key, result):
+        return (sys.getsizeof(key[0]) +
+                sys.getsizeof(key[1]) +
+                sys.getsizeof(result) +
+                self.entry_overhead)
+
+    @property
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None,
+                'entries': len(self._results),
+                'bytes': self.bytes}
+
+
+def isBatch(field):
+    '''
+    Whether a field's comparator compares whole columns of values.
+    Comparators say so with a `batch` attribute, like the `missing`
+    attribute of comparators that can compare missing values.
+    '''
+    return bool(getattr(field, 'batch', False) or
+                getattr(field.comparator, 'batch', False))
+
+
+def fieldDistances(compare, values_1, values_2, width, batch=False):
+    '''
+    Compare two columns of field values, returning an array with a row
+    of `width` distances for each pair of values. Unless the
+    comparator can handle missing values, the distances for pairs with
+    a missing value are NaN.
+
+    A batch comparator is called once with two lists of values and
+    returns an array with a distance, or a row of distances, for each
+    pair of values. Any other comparator is called once per pair.
+    '''
+    num_values = len(values_1)
+    handles_missing = hasattr(compare, 'missing')
+
+    if batch:
+        if handles_missing:
+            return numpy.reshape(compare(values_1, values_2),
+                                 (num_values, width))
+
+        present = [i for i, (value_1, value_2)
+                   in enumerate(zip(values_1, values_2))
+                   if value_1 is not None and value_2 is not None]
+
+        if len(present) == num_values:
+            return numpy.reshape(compare(values_1, values_2),
+                                 (num_values, width))
+
+        distances = numpy.full((num_values, width), numpy.nan, 'f4')
+        if present:
+            distances[present] = numpy.reshape(
+                compare([values_1[i] for i in present],
+                        [values_2[i] for i in present]),
+                (len(present), width))
+
+        return distances
+
+    if width == 1:
+        missing_distance = numpy.nan
+    else:
+        missing_distance = [numpy.nan] * width
+
+    distances = [compare(value_1, value_2)
+                 if handles_missing or (value_1 is not None and
+                                        value_2 is not None)
+                 else missing_distance
+                 for value_1, value_2 in zip(values_1, values_2)]
+
+    return numpy.reshape(numpy.asarray(distances, 'f4'),
+                         (num_values, width))
+
+
+# how many pairs to look at when deciding whether to compare only the
+# distinct pairs of a column, and the largest fraction of those that
+# can be distinct
+UNIQUE_SAMPLE_SIZE = 2000
+UNIQUE_MAX_RATIO = 0.9
+
+
+def uniqueFieldDistances(compare, values_1, values_2, width, batch=False):
+    '''
+    Like fieldDistances, but only compares each distinct pair of values
+    once, and then copies the distances to every pair with the same
+    values. Comparators that compare one pair at a time are only worth
+    calling once per distinct pair, which, with blocking rules that
+    put records with the same values together, can be a lot fewer
+    calls. Batch comparators are assumed to be vectorized already, so
+    they get every pair.
+    '''
+    if batch:
+        return fieldDistances(compare, values_1, values_2, width, batch)
+
+    # finding the distinct pairs costs about as much as comparing
+    # cheap values, so first check that a sample of the pairs repeats
+    # often enough for it to pay off
+    sample = min(len(values_1), UNIQUE_SAMPLE_SIZE)
+    try:
+        n_distinct = len(set(zip(values_1[:sample], values_2[:sample])))
+    except TypeError:
+        # some values can't be hashed
+        return fieldDistances(compare, values_1, values_2, width, batch)
+
+    if n_distinct > sample * UNIQUE_MAX_RATIO:
+        return fieldDistances(compare, values_1, values_2, width, batch)
+
+    positions: Dict[Tuple, int] = {}
+    try:
+        # a new pair of values gets the next position
+        inverse = [positions.setdefault(pair, len(positions))
+                   for pair in zip(values_1, values_2)]
+    except TypeError:
+        # some values can't be hashed
+        return fieldDistances(compare, values_1, values_2, width, batch)
+
+    unique_1, unique_2 = zip(*positions)
+    distances = fieldDistances(compare, unique_1, unique_2, width, batch)
+
+    return distances[numpy.array(inverse, dtype=numpy.intp)]
+
+
 def typifyFields(fields):
     primary_fields = []
     data_model = []
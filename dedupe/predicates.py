@@ -144,6 +144,16 @@ class CanopyPredicate(object):
         self.canopy = {}
         self.index = None
 
+    def resolve(self, records, **kwargs):
+        '''
+        Find the canopy of every record now, in order, so that later
+        calls for them don't need the index
+        '''
+        for record in records:
+            column = record[self.field]
+            if column and column not in self._cache:
+                self._cache[column] = self(record)
+
     def reset(self):
         self._cache = {}
         self.canopy = {}
@@ -198,6 +208,14 @@ class SearchPredicate(object):
                             for record in records_2})
         self.index = None
 
+    def resolve(self, records, target=False, **kwargs):
+        '''
+        Search the index for every record now, so that later calls for
+        them don't need the index
+        '''
+        for record in records:
+            self(record, target=target)
+
     def reset(self):
         self._cache = {}
         self.index = None
@@ -1,7 +1,12 @@
-from typing import Callable, Sequence, Type, Any, Iterable
+import math
+from typing import (Callable, Sequence, Type, Any, Iterable, Optional, Dict,
+                    Tuple)
 
 from dedupe import predicates
 
+# bytes of values and results a comparator cache holds by default
+DEFAULT_CACHE_BUDGET = 64 * 1024 * 1024
+
 
 class Variable(object):
     def __len__(self):
@@ -49,6 +54,28 @@ class MissingDataType(Variable):
 
 
 class FieldType(Variable):
+    # whether the comparator takes two lists of values and compares
+    # them all at once, instead of taking one pair of values at a time
+    batch = False
+    # whether comparing (a, b) always gives the same result as (b, a)
+    symmetric = False
+    # a version of the comparator that takes two lists of present
+    # values and returns an array of their distances, used in place
+    # of the comparator when comparing many pairs at once
+    batch_comparator: Optional[Callable] = None
+    # the least and greatest distances the comparator can return, used
+    # to bound the scores of pairs whose cascaded fields haven't been
+    # compared yet
+    distance_bounds: Tuple[float, float] = (-math.inf, math.inf)
+
+    # A field type can also define a `prepare(value)` method, which
+    # computes a feature of a field value, like a token vector, that
+    # is expensive to compute but cheap to compare, and a
+    # `feature_comparator(feature_1, feature_2)` that compares those
+    # features. Then each record's feature is computed once, however
+    # many pairs the record is in, and compared with the
+    # feature_comparator instead of comparing the values with the
+    # comparator.
     _index_thresholds: Sequence[float] = []
     _index_predicates: Sequence[Type[predicates.IndexPredicate]] = []
     _predicate_functions: Sequence[Callable[[Any], Iterable[str]]] = ()
@@ -69,6 +96,16 @@ class FieldType(Variable):
                                            self._index_thresholds,
                                            self.field)
 
+        cache = definition.get('cache', False)
+        if cache is True:
+            self.cache_budget: Optional[int] = DEFAULT_CACHE_BUDGET
+        elif cache:
+            self.cache_budget = int(cache)
+        else:
+            self.cache_budget = None
+
+        self.cascade = definition.get('cascade', False)
+
         super(FieldType, self).__init__(definition)
 
 
@@ -85,12 +122,50 @@ class CustomType(FieldType):
                            "a 'comparator' function in the field "
                            "definition. ")
 
+        self.batch = definition.get('batch', False)
+
         if 'variable name' not in definition:
             self.name = "(%s: %s, %s)" % (self.field,
                                           self.type,
                                           self.comparator.__name__)
 
 
+def tfidfFeatures(cosine, tokens):
+    '''
+    The tf-idf vector of a list of tokens, weighted the way `cosine`,
+    a simplecosine similarity, weights them, and the norm of the vector
+    '''
+    doc_freq = cosine.doc_freq
+    default_score = cosine.default_score
+
+    vector: Dict[Any, float] = {}
+    for token in tokens:
+        vector[token] = vector.get(token, 0.0) + doc_freq.get(token, default_score)
+
+    norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+
+    return vector, norm
+
+
+def cosineFeatureSimilarity(features_1, features_2):
+    vector_1, norm_1 = features_1
+    vector_2, norm_2 = features_2
+
+    if norm_1 and norm_2:
+        if len(vector_2) < len(vector_1):
+            vector_1, vector_2 = vector_2, vector_1
+
+        numerator = 0.0
+        for token, weight in vector_1.items():
+            if token in vector_2:
+                numerator += weight * vector_2[token]
+
+        return numerator / (norm_1 * norm_2)
+
+    else:
+        return float('nan')
+
+
 def allSubclasses(cls):
     for q in cls.__subclasses__():
         yield q.type, q
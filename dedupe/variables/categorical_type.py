@@ -1,3 +1,5 @@
+import numpy
+
 from .base import FieldType, DerivedType
 from dedupe import predicates
 from categorical import CategoricalComparator
@@ -5,6 +7,8 @@ from categorical import CategoricalComparator
 
 class CategoricalType(FieldType):
     type = "Categorical"
+    symmetric = True
+    distance_bounds = (0.0, 1.0)
     _predicate_functions = [predicates.wholeFieldPredicate]
 
     def _categories(self, definition):
@@ -22,6 +26,7 @@ class CategoricalType(FieldType):
         categories = self._categories(definition)
 
         self.comparator = CategoricalComparator(categories)
+        self.batch_comparator = CategoricalBatchComparator(self.comparator)
 
         self.higher_vars = []
         for higher_var in self.comparator.dummy_names:
@@ -32,3 +37,42 @@ class CategoricalType(FieldType):
 
     def __len__(self):
         return len(self.higher_vars)
+
+
+class CategoricalBatchComparator(object):
+    '''
+    Compares two lists of categories at once, giving the same dummy
+    variables as a CategoricalComparator. The response vector of each
+    pair of categories is looked up in a table indexed by the codes of
+    the two categories.
+    '''
+    def __init__(self, comparator):
+        self.codes = {category: code
+                      for code, category in enumerate(comparator.levels)}
+        n_codes = len(self.codes)
+
+        self.responses = numpy.zeros((n_codes,
+                                      n_codes,
+                                      len(comparator.dummy_names)),
+                                     'f4')
+        for (category_1, category_2), response in comparator.categories.items():
+            self.responses[self.codes[category_1],
+                           self.codes[category_2]] = response
+
+        self.levels = comparator.levels
+
+    def _codes(self, categories):
+        try:
+            return numpy.fromiter((self.codes[category]
+                                   for category in categories),
+                                  numpy.intp,
+                                  len(categories))
+        except KeyError:
+            unmatched = set(categories) - self.levels
+            raise ValueError("value(s) %s not among declared "
+                             "set of categories: %s" %
+                             (unmatched, self.levels))
+
+    def __call__(self, categories_1, categories_2):
+        return self.responses[self._codes(categories_1),
+                              self._codes(categories_2)]
@@ -1,3 +1,5 @@
+import numpy
+
 from .base import FieldType
 from dedupe import predicates
 
@@ -5,6 +7,8 @@ from dedupe import predicates
 class ExactType(FieldType):
     _predicate_functions = [predicates.wholeFieldPredicate]
     type = "Exact"
+    symmetric = True
+    distance_bounds = (0.0, 1.0)
 
     @staticmethod
     def comparator(field_1, field_2):
@@ -12,3 +16,13 @@ class ExactType(FieldType):
             return 1
         else:
             return 0
+
+    @staticmethod
+    def batch_comparator(fields_1, fields_2):
+        # field values can be any hashable objects, like strings or
+        # tuples, which numpy can't compare elementwise, so this
+        # only saves the function call per pair
+        return numpy.fromiter((field_1 == field_2
+                               for field_1, field_2 in zip(fields_1, fields_2)),
+                              'f4',
+                              len(fields_1))
@@ -7,6 +7,7 @@ from typing import List, Callable
 
 class ExistsType(CategoricalType):
     type = "Exists"
+    distance_bounds = (0.0, 1.0)
     _predicate_functions: List[Callable] = []
 
     def __init__(self, definition):
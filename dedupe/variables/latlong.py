@@ -1,15 +1,35 @@
 from math import sqrt
 
+import numpy
+
 from .base import FieldType
 from dedupe import predicates
 from haversine import haversine
 
+# the mean radius of the earth in kilometers, the one haversine uses
+AVG_EARTH_RADIUS = 6371.0088
+
 
 class LatLongType(FieldType):
     type = "LatLong"
+    symmetric = True
+    distance_bounds = (0.0, numpy.inf)
 
     _predicate_functions = [predicates.latLongGridPredicate]
 
     @staticmethod
     def comparator(x, y):
         return sqrt(haversine(x, y))
+
+    @staticmethod
+    def batch_comparator(xs, ys):
+        lat_1, lng_1 = numpy.radians(numpy.asarray(xs, 'f8').reshape(-1, 2)).T
+        lat_2, lng_2 = numpy.radians(numpy.asarray(ys, 'f8').reshape(-1, 2)).T
+
+        d = (numpy.sin((lat_2 - lat_1) / 2) ** 2 +
+             numpy.cos(lat_1) * numpy.cos(lat_2) *
+             numpy.sin((lng_2 - lng_1) / 2) ** 2)
+
+        distances = 2 * AVG_EARTH_RADIUS * numpy.arcsin(numpy.sqrt(d))
+
+        return numpy.sqrt(distances)
@@ -8,6 +8,8 @@ class PriceType(FieldType):
                             predicates.wholeFieldPredicate,
                             predicates.roundTo1]
     type = "Price"
+    symmetric = True
+    distance_bounds = (0.0, numpy.inf)
 
     @staticmethod
     def comparator(price_1, price_2):
@@ -17,3 +19,15 @@ class PriceType(FieldType):
             return numpy.nan
         else:
             return abs(numpy.log10(price_1) - numpy.log10(price_2))
+
+    @staticmethod
+    def batch_comparator(prices_1, prices_2):
+        prices_1 = numpy.asarray(prices_1, 'f8')
+        prices_2 = numpy.asarray(prices_2, 'f8')
+
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            distances = numpy.abs(numpy.log10(prices_1) - numpy.log10(prices_2))
+
+        distances[(prices_1 <= 0) | (prices_2 <= 0)] = numpy.nan
+
+        return distances
@@ -1,10 +1,11 @@
-from .base import FieldType
+from .base import FieldType, tfidfFeatures, cosineFeatureSimilarity
 from dedupe import predicates
 from simplecosine.cosine import CosineSetSimilarity
 
 
 class SetType(FieldType):
     type = "Set"
+    distance_bounds = (0.0, 1.0)
 
     _predicate_functions = (predicates.wholeSetPredicate,
                             predicates.commonSetElementPredicate,
@@ -25,3 +26,8 @@ class SetType(FieldType):
             definition['corpus'] = []
 
         self.comparator = CosineSetSimilarity(definition['corpus'])
+
+    def prepare(self, value):
+        return tfidfFeatures(self.comparator, value)
+
+    feature_comparator = staticmethod(cosineFeatureSimilarity)
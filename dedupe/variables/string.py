@@ -1,4 +1,9 @@
-from .base import FieldType, indexPredicates
+import math
+
+from .base import (FieldType,
+                   indexPredicates,
+                   tfidfFeatures,
+                   cosineFeatureSimilarity)
 from dedupe import predicates
 
 from affinegap import normalizedAffineGapDistance as affineGap
@@ -45,6 +50,8 @@ class BaseStringType(FieldType):
 
 class ShortStringType(BaseStringType):
     type = "ShortString"
+    symmetric = True
+    distance_bounds = (0.0, math.inf)
 
     _predicate_functions = (base_predicates +
                             (predicates.commonFourGram,
@@ -63,6 +70,9 @@ class ShortStringType(BaseStringType):
 
         if definition.get('crf', False) is True:
             self.comparator = crfEd
+            # the learned edit costs are not the same in both directions
+            self.symmetric = False
+            self.distance_bounds = (0.0, 1.0)
         else:
             self.comparator = affineGap
 
@@ -78,6 +88,7 @@ class StringType(ShortStringType):
 
 class TextType(BaseStringType):
     type = "Text"
+    distance_bounds = (0.0, 1.0)
 
     _predicate_functions = base_predicates
 
@@ -92,3 +103,8 @@ class TextType(BaseStringType):
             definition['corpus'] = []
 
         self.comparator = CosineTextSimilarity(definition['corpus'])
+
+    def prepare(self, value):
+        return tfidfFeatures(self.comparator, value.split())
+
+    feature_comparator = staticmethod(cosineFeatureSimilarity)
@@ -1,9 +1,13 @@
 import dedupe
 import dedupe.api
+import rlr
 import unittest
 import itertools
+import os
+import tempfile
 import warnings
 from collections import OrderedDict
+from unittest import mock
 
 
 def icfi(x):
@@ -91,5 +95,288 @@ class ActiveMatch(unittest.TestCase):
                 w[-1].message) == "Didn't return any labeled record pairs"
 
 
+class GazetteerSearch(unittest.TestCase):
+    def setUp(self):
+        self.gazetteer = dedupe.Gazetteer([{'field': 'name', 'type': 'String'},
+                                           {'field': 'age', 'type': 'String'}],
+                                          num_cores=1)
+        self.gazetteer.classifier = rlr.RegularizedLogisticRegression()
+        self.gazetteer.classifier.weights = [-1.0, -1.0]
+        self.gazetteer.classifier.bias = 4.0
+
+        predicate = dedupe.predicates.SimplePredicate(dedupe.predicates.wholeFieldPredicate,
+                                                      'age')
+        self.gazetteer._fingerprinter = dedupe.blocking.Fingerprinter([predicate])
+        self.gazetteer.index(data_dict_2)
+
+    def test_search_async(self):
+        import asyncio
+
+        async def search():
+            return [result async for result
+                    in self.gazetteer.search_async(data_dict, n_matches=2)]
+
+        loop = asyncio.new_event_loop()
+        try:
+            results = loop.run_until_complete(search())
+        finally:
+            loop.close()
+
+        expected = self.gazetteer.search(data_dict, n_matches=2)
+        assert sorted(results) == sorted(expected)
+        assert len(results) == len(data_dict)
+
+
+class BlockingEngine(unittest.TestCase):
+    def setUp(self):
+        self.field_definition = [{'field': 'name', 'type': 'String'},
+                                 {'field': 'age', 'type': 'String'}]
+        self.predicate = dedupe.predicates.SimplePredicate(
+            dedupe.predicates.wholeFieldPredicate, 'age')
+
+    def matchers(self, matcher_class):
+        for blocking_engine in (None,
+                                dedupe.blocking.SortMerge(),
+                                dedupe.blocking.SymmetricJoin()):
+            for hash_keys in (False, True):
+                matcher = matcher_class(self.field_definition,
+                                        num_cores=1,
+                                        blocking_engine=blocking_engine,
+                                        hash_keys=hash_keys)
+                matcher.predicates = [self.predicate]
+                matcher._init_fingerprinter()
+                yield matcher
+
+    def test_dedupe_pairs(self):
+        sqlite, *others = (sorted(matcher.pairs(data_dict))
+                           for matcher in self.matchers(dedupe.Dedupe))
+
+        assert len(sqlite) == 4
+        for pairs in others:
+            assert pairs == sqlite
+
+        # records keep the order of the data, but the smaller id of a
+        # pair still comes first
+        reversed_data = OrderedDict(reversed(list(data_dict.items())))
+        for matcher in self.matchers(dedupe.Dedupe):
+            assert sorted(matcher.pairs(reversed_data)) == sqlite
+
+    def test_link_pairs(self):
+        sqlite, *others = (sorted(matcher.pairs(data_dict, data_dict_2))
+                           for matcher in self.matchers(dedupe.RecordLink))
+
+        assert len(sqlite) == 15
+        for pairs in others:
+            assert pairs == sqlite
+
+    def test_redundancy_free(self):
+        predicates = [self.predicate,
+                      dedupe.predicates.SimplePredicate(
+                          dedupe.predicates.firstTokenPredicate, 'name'),
+                      dedupe.predicates.SimplePredicate(
+                          dedupe.predicates.commonSetElementPredicate, 'name')]
+
+        for matcher_class, data in ((dedupe.Dedupe, (data_dict,)),
+                                    (dedupe.RecordLink, (data_dict, data_dict_2))):
+            pairs = []
+            for redundancy_free in (False, True):
+                matcher = matcher_class(self.field_definition,
+                                        num_cores=1,
+                                        redundancy_free=redundancy_free)
+                matcher.predicates = predicates
+                matcher._init_fingerprinter()
+                pairs.append([(a[0], b[0]) for a, b in matcher.pairs(*data)])
+
+            distinct, redundancy_free = pairs
+            assert len(set(redundancy_free)) == len(redundancy_free)
+            assert sorted(redundancy_free) == sorted(distinct)
+
+    def test_block_limit(self):
+        first_token = dedupe.predicates.SimplePredicate(
+            dedupe.predicates.firstTokenPredicate, 'name')
+
+        for sub_predicates, expected in (((), {(1, 6)}),
+                                         ((first_token,), {(0, 4), (1, 6)})):
+            for blocking_engine in (None, dedupe.blocking.SortMerge()):
+                for hash_keys in (False, True):
+                    block_limit = dedupe.blocking.BlockLimit(2, sub_predicates)
+                    deduper = dedupe.Dedupe(self.field_definition,
+                                            num_cores=1,
+                                            blocking_engine=blocking_engine,
+                                            hash_keys=hash_keys,
+                                            block_limit=block_limit)
+                    deduper.predicates = [self.predicate]
+                    deduper._init_fingerprinter()
+
+                    pairs = {(a[0], b[0]) for a, b in deduper.pairs(data_dict)}
+                    assert pairs == expected
+
+                    action, = block_limit.actions
+                    assert action['size'] == 3
+
+    def test_link_block_limit(self):
+        for blocking_engine in (None, dedupe.blocking.SortMerge()):
+            block_limit = dedupe.blocking.BlockLimit(4)
+            linker = dedupe.RecordLink(self.field_definition,
+                                       num_cores=1,
+                                       blocking_engine=blocking_engine,
+                                       block_limit=block_limit)
+            linker.predicates = [self.predicate]
+            linker._init_fingerprinter()
+
+            pairs = list(linker.pairs(data_dict, data_dict_2))
+
+            # the six records aged 51 are dropped, the four aged 50 kept
+            assert len(pairs) == 6
+            assert [action['size'] for action in block_limit.actions] == [6]
+
+    def test_blocking_report(self):
+        first_token = dedupe.predicates.SimplePredicate(
+            dedupe.predicates.firstTokenPredicate, 'name')
+
+        deduper = dedupe.Dedupe(self.field_definition, num_cores=1)
+        deduper.predicates = [self.predicate, first_token]
+        deduper._init_fingerprinter()
+
+        report = deduper.blocking_report(data_dict)
+        n_pairs = len(list(deduper.pairs(data_dict)))
+
+        age, name = report['predicates']
+        assert age['keys'] == 4
+        assert age['block_sizes'] == {1: 2, 2: 2}
+        assert age['largest_blocks'][0] == ('51', 3)
+        assert age['pairs'] == 4
+
+        # every record is a probe, so the distinct pairs are exact
+        assert report['pairs'] == age['pairs'] + name['pairs'] == 5
+        assert report['distinct_pairs'] == n_pairs == 4
+        assert report['records'] == [7]
+
+        linker = dedupe.RecordLink(self.field_definition, num_cores=1)
+        linker.predicates = [self.predicate]
+        linker._init_fingerprinter()
+
+        report = linker.blocking_report(data_dict, data_dict_2)
+        assert report['pairs'] == report['distinct_pairs'] == 15
+
+    def test_executor_pairs(self):
+        predicates = [dedupe.predicates.TfidfTextCanopyPredicate(0.6, 'name')]
+
+        pairs = []
+        for executor in (None, dedupe.core.ThreadExecutor(2)):
+            deduper = dedupe.Dedupe(self.field_definition,
+                                    num_cores=1,
+                                    executor=executor)
+            deduper.predicates = predicates
+            deduper._init_fingerprinter()
+            pairs.append(sorted(deduper.pairs(data_dict)))
+
+        serial, parallel = pairs
+        assert parallel == serial
+        assert len(serial) > 0
+
+    def test_changed_pairs(self):
+        def ids(pairs):
+            return sorted((a, b) for (a, _), (b, _) in pairs)
+
+        data = dict(data_dict)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'blocks.db')
+            for matcher in self.matchers(dedupe.Dedupe):
+                if os.path.exists(path):
+                    os.remove(path)
+
+                # the first time, every pair is new
+                assert ids(matcher.changed_pairs(data, path)) == \
+                    ids(matcher.pairs(data))
+
+                updated = dict(data)
+                del updated[4]
+                updated[2] = {'name': 'Gene', 'age': '15'}
+                updated[7] = {'name': 'Bob', 'age': '51'}
+                changed = {2, 7}
+
+                expected = [(a, b) for a, b in ids(matcher.pairs(updated))
+                            if a in changed or b in changed]
+                assert expected == [(0, 7), (2, 3), (5, 7)]
+
+                pairs = matcher.changed_pairs(updated, path,
+                                              changed=changed,
+                                              deleted=[4])
+                assert ids(pairs) == expected
+
+                # if the pairs aren't all read, the next call starts over
+                pairs = matcher.changed_pairs(updated, path,
+                                              changed=changed)
+                next(pairs)
+                pairs.close()
+                pairs = matcher.changed_pairs(updated, path, changed=())
+                assert ids(pairs) == ids(matcher.pairs(updated))
+                assert ids(matcher.changed_pairs(updated, path,
+                                                 changed=())) == []
+
+                # other predicates can't reuse the blocking map
+                matcher.predicates = [dedupe.predicates.SimplePredicate(
+                    dedupe.predicates.wholeFieldPredicate, 'name')]
+                matcher._init_fingerprinter()
+                pairs = matcher.changed_pairs(updated, path,
+                                              changed=changed)
+                assert ids(pairs) == ids(matcher.pairs(updated))
+
+
+class UpdatePartition(unittest.TestCase):
+    def setUp(self):
+        self.deduper = dedupe.Dedupe([{'field': 'name', 'type': 'String'},
+                                      {'field': 'age', 'type': 'String'}],
+                                     num_cores=1)
+        self.deduper.classifier = rlr.RegularizedLogisticRegression()
+        self.deduper.classifier.weights = [-1.0, -1.0]
+        self.deduper.classifier.bias = 4.0
+        self.deduper.predicates = [dedupe.predicates.SimplePredicate(
+            dedupe.predicates.wholeFieldPredicate, 'age')]
+        self.deduper._init_fingerprinter()
+
+        self.data = dict(data_dict)
+        self.new_data = {7: {'name': 'bob', 'age': '51'},
+                         8: {'name': 'Gene', 'age': '12'},
+                         9: {'name': 'Zed', 'age': '99'}}
+
+    def test_update_partition(self):
+        def ids(clusters):
+            return sorted(sorted(record_ids) for record_ids, _ in clusters)
+
+        clusters = self.deduper.partition(self.data)
+        all_data = dict(self.data)
+        all_data.update(self.new_data)
+        expected = self.deduper.partition(all_data)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'blocks.db')
+            list(self.deduper.changed_pairs(self.data, path))
+
+            score_dir = os.path.join(temp_dir, 'scores')
+            os.mkdir(score_dir)
+            with mock.patch.object(tempfile, 'tempdir', score_dir):
+                diffs = [self.deduper.update_partition(self.data,
+                                                       self.new_data,
+                                                       clusters),
+                         self.deduper.update_partition(self.data,
+                                                       self.new_data,
+                                                       clusters,
+                                                       path=path)]
+
+            # the scores are cleaned up
+            assert os.listdir(score_dir) == []
+
+            for diff in diffs:
+                assert ids(diff.clusters) == ids(expected)
+                assert ids(diff.unchanged) == [[1, 6], [3]]
+                assert [(ids(old), sorted(new))
+                        for old, (new, _) in diff.merged] == \
+                    [([[2]], [2, 8]), ([[0, 4, 5]], [0, 4, 5, 7])]
+                assert diff.split == []
+                assert ids(diff.new) == [[9]]
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,7 +1,14 @@
 import dedupe
 from collections import defaultdict
+import copy
+import itertools
+import os
+import random
+import tempfile
 import unittest
 
+import numpy
+
 from future.utils import viewitems, viewvalues
 
 
@@ -139,3 +146,448 @@ class TfIndexUnindex(unittest.TestCase):
 
 if __name__ == "__main__":
     unittest.main()
+
+
+class HashedKeysTest(unittest.TestCase):
+    def setUp(self):
+        self.data_d = {
+            100: {"name": "Bob", "age": "50"},
+            105: {"name": "Charlie", "age": "75"},
+            110: {"name": "Meredith", "age": "40"},
+            115: {"name": "Sue", "age": "10"},
+            120: {"name": "Jimbo", "age": "21"},
+            125: {"name": "Jimbo", "age": "21"},
+            130: {"name": "Willy", "age": "35"},
+            135: {"name": "Willy", "age": "35"},
+        }
+        self.predicates = [
+            dedupe.predicates.SimplePredicate(
+                dedupe.predicates.wholeFieldPredicate, 'name'),
+            dedupe.predicates.SimplePredicate(
+                dedupe.predicates.wholeFieldPredicate, 'age'),
+            dedupe.predicates.CompoundPredicate(
+                (dedupe.predicates.SimplePredicate(
+                    dedupe.predicates.firstTokenPredicate, 'name'),
+                 dedupe.predicates.SimplePredicate(
+                     dedupe.predicates.wholeFieldPredicate, 'age')))]
+
+    def blocks(self, blocker):
+        blocks = defaultdict(set)
+        for block_key, record_id in blocker(self.data_d.items()):
+            blocks[block_key].add(record_id)
+        return blocks
+
+    def test_hashed_keys(self):
+        blocks = self.blocks(dedupe.blocking.Fingerprinter(self.predicates))
+        hashed = self.blocks(dedupe.blocking.Fingerprinter(self.predicates,
+                                                           hash_keys=True))
+
+        assert all(isinstance(block_key, int) and
+                   -2 ** 63 <= block_key < 2 ** 63
+                   for block_key in hashed)
+        assert sorted(map(sorted, hashed.values())) ==\
+            sorted(map(sorted, blocks.values()))
+
+        # the same key from different predicates is a different block
+        assert dedupe.blocking.blockHash(
+            dedupe.blocking.predicateSalt(0), '21') !=\
+            dedupe.blocking.blockHash(dedupe.blocking.predicateSalt(1), '21')
+
+    def test_verify_keys(self):
+        blocker = dedupe.blocking.Fingerprinter(self.predicates,
+                                                verify_keys=True)
+        assert blocker.hash_keys
+
+        # pretend another key already has the hash of Jimbo's name
+        salt = dedupe.blocking.predicateSalt(0)
+        jimbo = dedupe.blocking.blockHash(salt, 'Jimbo')
+        blocker.hashed_keys[jimbo] = (0, 'Jimmy')
+
+        blocks = self.blocks(blocker)
+
+        assert blocker.collisions == 1
+        assert jimbo not in blocks
+        assert blocks[blocker.key_hashes[(0, 'Jimbo')]] == {120, 125}
+        assert blocks == self.blocks(blocker)
+        assert blocker.collisions == 1
+
+
+class ParallelFingerprintTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(7)
+        names = ['bob', 'bobby', 'robert', 'linda', 'lynda', 'gene',
+                 'tina', 'louise', 'teddy', 'mort']
+        self.records = [(i, {'name': ' '.join(random.sample(names, 2)),
+                             'age': str(random.randrange(10))})
+                        for i in range(200)]
+
+        self.predicates = [
+            dedupe.predicates.SimplePredicate(
+                dedupe.predicates.wholeFieldPredicate, 'age'),
+            dedupe.predicates.TfidfTextCanopyPredicate(0.6, 'name'),
+            dedupe.predicates.CompoundPredicate(
+                (dedupe.predicates.TfidfTextSearchPredicate(0.6, 'name'),
+                 dedupe.predicates.SimplePredicate(
+                     dedupe.predicates.wholeFieldPredicate, 'age')))]
+
+    def blocker(self, **kwargs):
+        predicates = copy.deepcopy(self.predicates)
+        blocker = dedupe.blocking.Fingerprinter(predicates, **kwargs)
+        blocker.index_all(dict(self.records))
+        return blocker
+
+    def test_parallel(self):
+        for kwargs in ({}, {'hash_keys': True}, {'verify_keys': True}):
+            for target in (False, True):
+                expected = list(self.blocker(**kwargs)(self.records,
+                                                       target=target))
+
+                executors = (dedupe.core.SerialExecutor(),
+                             dedupe.core.ThreadExecutor(2))
+                for executor in executors:
+                    with executor:
+                        blocked_ids = list(self.blocker(**kwargs).parallel(
+                            iter(self.records),
+                            executor,
+                            target=target,
+                            chunk_size=30))
+
+                    assert blocked_ids == expected
+
+    def test_processes(self):
+        with dedupe.core.ProcessExecutor(2) as executor:
+            blocked_ids = list(self.blocker(hash_keys=True).parallel(
+                self.records, executor, chunk_size=30))
+
+        assert blocked_ids == list(self.blocker(hash_keys=True)(self.records))
+
+
+class BlockLimitTest(unittest.TestCase):
+    def setUp(self):
+        self.records = [(0, {'name': 'the bob', 'city': 'chicago'}),
+                        (1, {'name': 'the bobby', 'city': 'chicago'}),
+                        (2, {'name': 'the linda', 'city': 'chicago'}),
+                        (3, {'name': 'the gene', 'city': 'evanston'}),
+                        (4, {'name': 'the tina', 'city': 'evanston'}),
+                        (5, {'name': 'the louise', 'city': 'skokie'})]
+        self.city = dedupe.predicates.SimplePredicate(
+            dedupe.predicates.wholeFieldPredicate, 'city')
+
+    def test_split(self):
+        block_limit = dedupe.blocking.BlockLimit(2, [self.city])
+        members = [(i, 0) for i in range(6)]
+
+        sub_blocks = block_limit.split('the:0', members, self.records)
+
+        # chicago is still too big, and skokie is a single record
+        assert list(sub_blocks.values()) == [[(3, 0), (4, 0)]]
+        assert block_limit.actions == [{'block_key': 'the:0',
+                                        'size': 6,
+                                        'sub_blocks': 1,
+                                        'dropped_sub_blocks': 1}]
+
+        hashed = block_limit.split(12345, members, self.records)
+        assert list(hashed.values()) == [[(3, 0), (4, 0)]]
+        assert all(isinstance(key, int) for key in hashed)
+
+    def test_limit_rows(self):
+        block_limit = dedupe.blocking.BlockLimit(3, [self.city])
+
+        rows = numpy.array([(1, 0, i) for i in range(6)] +
+                           [(2, 0, 0), (2, 0, 1)],
+                           dedupe.blocking.KEY_ROW)
+        kept, sub_rows = block_limit.limit_rows(rows, self.records)
+
+        assert kept['id'].tolist() == [0, 1]
+        assert sorted(sub_rows['id'].tolist()) == [0, 1, 2, 3, 4]
+        assert len(set(sub_rows['key'].tolist())) == 2
+
+    def test_index_predicates(self):
+        with self.assertRaises(ValueError):
+            dedupe.blocking.BlockLimit(
+                10, [dedupe.predicates.TfidfTextSearchPredicate(0.5, 'name')])
+
+
+class SortMergeTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(123)
+        self.blocked_ids_1 = [('block %d' % random.randrange(300),
+                               random.randrange(500))
+                              for _ in range(3000)]
+        self.blocked_ids_2 = [('block %d' % random.randrange(300),
+                               500 + random.randrange(500))
+                              for _ in range(3000)]
+
+    def blocks(self, blocked_ids):
+        blocks = defaultdict(set)
+        for block_key, record_id in blocked_ids:
+            blocks[block_key].add(record_id)
+        return blocks
+
+    def test_dedupe_pairs(self):
+        expected = set()
+        for record_ids in viewvalues(self.blocks(self.blocked_ids_1)):
+            expected.update(itertools.combinations(sorted(record_ids), 2))
+
+        pairs = list(dedupe.blocking.SortMerge().dedupe_pairs(
+            iter(self.blocked_ids_1)))
+
+        assert len(pairs) == len(expected)
+        assert set(pairs) == expected
+
+    def test_link_pairs(self):
+        blocks_1 = self.blocks(self.blocked_ids_1)
+        blocks_2 = self.blocks(self.blocked_ids_2)
+        expected = {(a, b)
+                    for block_key in blocks_1
+                    for a in blocks_1[block_key]
+                    for b in blocks_2.get(block_key, ())}
+
+        pairs = list(dedupe.blocking.SortMerge().link_pairs(
+            iter(self.blocked_ids_1),
+            iter(self.blocked_ids_2)))
+
+        assert len(pairs) == len(expected)
+        assert set(pairs) == expected
+
+    def test_key_rows(self):
+        rows, = dedupe.blocking.keyRows([('block 1', 3), (17, 4)], 0, 10)
+
+        # string keys are hashed the same way in every process
+        salt = dedupe.blocking.predicateSalt(0)
+        assert rows['key'].tolist() == \
+            [dedupe.blocking.blockHash(salt, 'block 1'), 17]
+        assert rows['id'].tolist() == [3, 4]
+
+    def test_sorted_runs(self):
+        keys = [random.randrange(50) for _ in range(1000)]
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            runs = dedupe.blocking.SortedRuns(100, temp_dir, 'test')
+            for i in range(0, len(keys), 30):
+                runs.add(numpy.array(keys[i:i + 30], 'i8'))
+            runs.finish()
+
+            # the runs that didn't fit are spilled to disk
+            assert len(runs.paths) == len(runs.runs) > 1
+
+            ranges = [key_range.tolist() for key_range in runs.ranges()]
+            runs.close()
+
+            assert os.listdir(temp_dir) == []
+
+        assert sum(ranges, []) == sorted(keys)
+        assert len(ranges) > 1
+
+        # no key is split across ranges
+        for range_1, range_2 in zip(ranges, ranges[1:]):
+            assert range_1[-1] < range_2[0]
+
+
+class SymmetricJoinTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(123)
+        # records are fingerprinted, and their keys arrive, in order
+        self.blocked_ids_1 = sorted((('block %d' % random.randrange(300),
+                                      random.randrange(500))
+                                     for _ in range(3000)),
+                                    key=lambda x: x[1])
+        self.blocked_ids_2 = sorted((('block %d' % random.randrange(300),
+                                      500 + random.randrange(500))
+                                     for _ in range(3000)),
+                                    key=lambda x: x[1])
+
+    def blocks(self, blocked_ids):
+        blocks = defaultdict(set)
+        for block_key, record_id in blocked_ids:
+            blocks[block_key].add(record_id)
+        return blocks
+
+    def test_dedupe_pairs(self):
+        expected = set()
+        for record_ids in viewvalues(self.blocks(self.blocked_ids_1)):
+            expected.update(itertools.combinations(sorted(record_ids), 2))
+
+        pairs = list(dedupe.blocking.SymmetricJoin().dedupe_pairs(
+            iter(self.blocked_ids_1)))
+
+        assert len(pairs) == len(expected)
+        assert set(pairs) == expected
+
+    def test_link_pairs(self):
+        blocks_1 = self.blocks(self.blocked_ids_1)
+        blocks_2 = self.blocks(self.blocked_ids_2)
+        expected = {(a, b)
+                    for block_key in blocks_1
+                    for a in blocks_1[block_key]
+                    for b in blocks_2.get(block_key, ())}
+
+        pairs = list(dedupe.blocking.SymmetricJoin().link_pairs(
+            iter(self.blocked_ids_1),
+            iter(self.blocked_ids_2)))
+
+        assert len(pairs) == len(expected)
+        assert set(pairs) == expected
+
+    def test_pipelined(self):
+        blocked_ids = iter(self.blocked_ids_1)
+        pairs = dedupe.blocking.SymmetricJoin().dedupe_pairs(blocked_ids)
+
+        next(pairs)
+
+        # the first pair comes long before the last record
+        assert len(list(blocked_ids)) > len(self.blocked_ids_1) // 2
+
+    def test_block_limit(self):
+        records = [(i, {'city': city})
+                   for i, city in enumerate(['chicago', 'chicago',
+                                             'evanston', 'chicago',
+                                             'evanston', 'chicago',
+                                             'skokie'])]
+        city = dedupe.predicates.SimplePredicate(
+            dedupe.predicates.wholeFieldPredicate, 'city')
+        blocked_ids = [('the', i) for i in range(len(records))]
+
+        block_limit = dedupe.blocking.BlockLimit(3, [city])
+        pairs = list(dedupe.blocking.SymmetricJoin().dedupe_pairs(
+            iter(blocked_ids), block_limit, records))
+
+        # the first three records are paired with each other, later
+        # records only with records from the same city, and chicago
+        # is full by the time the last chicago record arrives
+        assert pairs == [(0, 1), (0, 2), (1, 2),
+                         (0, 3), (1, 3),
+                         (2, 4)]
+        assert [action['block_key'] for action in block_limit.actions] == \
+            ['the', 'the|chicago:0']
+
+        block_limit = dedupe.blocking.BlockLimit(3)
+        pairs = list(dedupe.blocking.SymmetricJoin().dedupe_pairs(
+            iter(blocked_ids), block_limit, records))
+
+        assert pairs == [(0, 1), (0, 2), (1, 2)]
+
+
+class SQLiteStoreTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(123)
+        self.blocked_ids_1 = [('block %d' % random.randrange(300),
+                               random.randrange(500))
+                              for _ in range(3000)]
+        self.blocked_ids_2 = [('block %d' % random.randrange(300),
+                               500 + random.randrange(500))
+                              for _ in range(3000)]
+
+    def expected(self):
+        blocks = defaultdict(set)
+        for block_key, record_id in self.blocked_ids_1:
+            blocks[block_key].add(record_id)
+
+        expected = set()
+        for record_ids in viewvalues(blocks):
+            expected.update(itertools.combinations(sorted(record_ids), 2))
+        return expected
+
+    def test_dedupe_pairs(self):
+        expected = self.expected()
+        for redundancy_free in (False, True):
+            store = dedupe.blocking.SQLiteStore(
+                redundancy_free=redundancy_free)
+            pairs = list(store.dedupe_pairs(iter(self.blocked_ids_1)))
+
+            assert len(pairs) == len(expected)
+            assert set(pairs) == expected
+
+        hashed = [(dedupe.blocking.blockHash(b'', key), record_id)
+                  for key, record_id in self.blocked_ids_1]
+        pairs = list(dedupe.blocking.SQLiteStore().dedupe_pairs(hashed))
+        assert set(pairs) == expected
+
+    def test_link_pairs(self):
+        sort_merge = dedupe.blocking.SortMerge().link_pairs(
+            iter(self.blocked_ids_1), iter(self.blocked_ids_2))
+        store = dedupe.blocking.SQLiteStore().link_pairs(
+            iter(self.blocked_ids_1), iter(self.blocked_ids_2))
+
+        assert sorted(store) == sorted(sort_merge)
+
+    def test_directory(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            store = dedupe.blocking.SQLiteStore(directory=temp_dir)
+            pairs = store.dedupe_pairs(iter(self.blocked_ids_1))
+
+            # the database is kept in the directory until the last pair
+            assert len(os.listdir(temp_dir)) == 1
+            assert len(list(pairs)) == len(self.expected())
+            assert os.listdir(temp_dir) == []
+
+    def test_synchronous(self):
+        with dedupe.blocking.SQLiteStore().open() as store:
+            assert store.con.execute('PRAGMA synchronous').fetchone() == (0,)
+
+        # a database that is kept is only as durable as it needs to be
+        # to survive a crash in WAL mode
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'blocks.db')
+            with dedupe.blocking.SQLiteStore().open(path) as store:
+                assert store.con.execute('PRAGMA synchronous').fetchone() == (1,)
+
+    def test_failed_insert(self):
+        def blocked_ids():
+            yield 'a', 1
+            raise ValueError('bad record')
+
+        with dedupe.blocking.SQLiteStore().open() as store:
+            store.create('blocks')
+            with self.assertRaises(ValueError):
+                store.insert('blocks', blocked_ids())
+
+            # nothing from the failed insert is kept, and the store
+            # can still be inserted into
+            store.insert('blocks', [('a', 2), ('a', 3)])
+            assert list(store.join('blocks')) == [(2, 3)]
+
+    def test_table_operations(self):
+        with dedupe.blocking.SQLiteStore().open() as store:
+            store.create('blocks', id_type='text')
+            store.insert('blocks', [('a', 'x'), ('a', 'y'), ('a', 'x'),
+                                    ('b', 'y'), ('b', 'z')])
+            store.index('blocks')
+
+            assert list(store.join('blocks', ordered=True)) == \
+                [('x', 'y'), ('y', 'z')]
+
+            store.delete('blocks', ['y'])
+            assert list(store.join('blocks')) == []
+
+            assert store.oversized(['blocks'], 0) == ['a', 'b']
+            assert store.pop_block('blocks', 'a') == ['x']
+
+            assert store.metadata('predicates') is None
+            store.set_metadata('predicates', 'abc')
+            assert store.metadata('predicates') == 'abc'
+
+            store.drop('blocks')
+            store.create('blocks')
+            assert list(store.join('blocks')) == []
+
+        with self.assertRaises(ValueError):
+            list(store.join('blocks'))
+
+
+class NoPairsTest(unittest.TestCase):
+    def engines(self):
+        return (dedupe.blocking.SQLiteStore(),
+                dedupe.blocking.SortMerge(),
+                dedupe.blocking.SymmetricJoin())
+
+    def test_singleton_blocks(self):
+        # no blocks at all, or only blocks of one record
+        for blocked_ids in ([], [('a', 0), ('b', 1), ('c', 2)]):
+            for engine in self.engines():
+                assert list(engine.dedupe_pairs(iter(blocked_ids))) == []
+
+            for engine in self.engines():
+                pairs = engine.link_pairs(iter(blocked_ids),
+                                          iter([('d', 3), ('e', 4)]))
+                assert list(pairs) == []
@@ -1,8 +1,10 @@
 import unittest
 import random
+import itertools
 import sys
 
 import numpy
+import rlr
 
 import dedupe
 
@@ -121,6 +123,494 @@ class ScoreDuplicates(unittest.TestCase):
         numpy.testing.assert_allclose(scores['score'],
                                       self.desired_scored_pairs['score'], 2)
 
+    def test_score_duplicates_min_score(self):
+        scores = dedupe.core.scoreDuplicates(self.records,
+                                             self.data_model,
+                                             self.classifier,
+                                             2,
+                                             min_score=0.8)
+
+        desired = self.desired_scored_pairs[self.desired_scored_pairs['score'] > 0.8]
+
+        numpy.testing.assert_equal(numpy.sort(scores['pairs'], axis=0),
+                                   numpy.sort(desired['pairs'], axis=0))
+
+    def test_score_duplicates_profile(self):
+        record_pairs = list(self.records)
+
+        profile = dedupe.core.FieldProfile()
+        dedupe.core.scoreDuplicates(iter(record_pairs),
+                                    self.data_model,
+                                    self.classifier,
+                                    2,
+                                    profile=profile)
+
+        stats = profile.stats
+        assert set(stats) == {'(name: String)',
+                              dedupe.datamodel.DERIVED_DISTANCES}
+        assert stats['(name: String)']['pairs'] == 5
+        assert stats['(name: String)']['missing_rate'] == 0
+        assert set(stats['(name: String)']['seconds_per_pair']) == {50, 90, 99}
+
+        with dedupe.core.ThreadExecutor(2) as executor:
+            profile = dedupe.core.FieldProfile()
+            dedupe.core.scoreDuplicates(iter(record_pairs),
+                                        self.data_model,
+                                        self.classifier,
+                                        executor=executor,
+                                        profile=profile)
+        assert profile.stats['(name: String)']['pairs'] == 5
+
+        deduper = dedupe.Dedupe([{'field': 'name', 'type': 'String'}],
+                                num_cores=1,
+                                profile=True)
+        deduper.classifier = self.classifier
+        record_pairs[0][1][1]['name'] = None
+        deduper.score(iter(record_pairs))
+        assert deduper.field_stats['(name: String)']['missing_rate'] == 0.2
+
+    def test_score_gazette(self):
+        block = list(self.records)
+
+        scorer = dedupe.core.ScoreGazette(self.data_model, self.classifier)
+        all_scored_pairs = scorer(block)
+        assert len(all_scored_pairs) == 5
+
+        scorer = dedupe.core.ScoreGazette(self.data_model,
+                                          self.classifier,
+                                          min_score=0.8)
+        assert len(scorer(block)) == 3
+
+        scorer = dedupe.core.ScoreGazette(self.data_model,
+                                          self.classifier,
+                                          min_score=0.8,
+                                          n_matches=1)
+        scored_pairs = scorer(block)
+        assert len(scored_pairs) == 1
+        assert scored_pairs['score'][0] == max(all_scored_pairs['score'])
+
+    def test_score_indexed_duplicates(self):
+        record_pairs = list(self.records)
+        records = [record for pair in record_pairs for record in pair]
+        index_pairs = iter([(2 * i, 2 * i + 1)
+                            for i in range(len(record_pairs))])
+
+        scores = dedupe.core.scoreIndexedDuplicates(index_pairs,
+                                                    records,
+                                                    self.data_model,
+                                                    self.classifier,
+                                                    2)
+
+        # the scored pairs are pairs of indices into records
+        numpy.testing.assert_equal(scores['pairs'],
+                                   numpy.arange(len(records)).reshape(-1, 2))
+        assert scores['pairs'].dtype == numpy.int32
+
+        numpy.testing.assert_allclose(scores['score'],
+                                      self.desired_scored_pairs['score'], 2)
+
+        with self.assertRaises(dedupe.core.BlockingError):
+            dedupe.core.scoreIndexedDuplicates(iter([]),
+                                               records,
+                                               self.data_model,
+                                               self.classifier)
+
+
+class CascadeTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(123)
+
+        fields = [{'field': 'type', 'type': 'Exact', 'variable name': 'type'},
+                  {'field': 'name', 'type': 'String', 'variable name': 'name',
+                   'has missing': True},
+                  {'type': 'Interaction',
+                   'interaction variables': ['type', 'name']}]
+        cascaded_fields = [dict(field, cascade=True)
+                           if field.get('field') == 'name' else field
+                           for field in fields]
+
+        self.data_model = dedupe.datamodel.DataModel(fields)
+        self.cascaded_data_model = dedupe.datamodel.DataModel(cascaded_fields)
+
+        self.classifier = rlr.RegularizedLogisticRegression()
+        self.classifier.weights = [3.0, -1.0, -0.5, 0.5, 0.5]
+        self.classifier.bias = -1.0
+
+        names = ['marga', 'margret', 'maria', 'monica', 'mona', None]
+        records = [{'type': random.choice('ab'),
+                    'name': random.choice(names)}
+                   for _ in range(50)]
+        self.record_pairs = [((i, records[i]), (j, records[j]))
+                             for i, j in itertools.combinations(range(50), 2)]
+
+    def test_bounds(self):
+        pairs = [(pair[0][1], pair[1][1]) for pair in self.record_pairs]
+        distances = self.data_model.distances(pairs)
+
+        def keep(lower, upper):
+            assert (lower <= distances).all()
+            assert (distances <= upper).all()
+            return numpy.ones(len(lower), bool)
+
+        cascaded, kept = self.cascaded_data_model.cascadeDistances(pairs, keep)
+        assert kept.all()
+        numpy.testing.assert_array_equal(cascaded, distances)
+
+    def test_cascade(self):
+        import warnings
+
+        scores = dedupe.core.scoreRecordPairs(self.record_pairs,
+                                              self.data_model,
+                                              self.classifier,
+                                              min_score=0.5)
+
+        # the bounds are never made from uninitialized distances
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', RuntimeWarning)
+            cascaded_scores = dedupe.core.scoreRecordPairs(self.record_pairs,
+                                                           self.cascaded_data_model,
+                                                           self.classifier,
+                                                           min_score=0.5)
+
+        numpy.testing.assert_array_equal(cascaded_scores, scores)
+
+        stats = self.cascaded_data_model.cascade_stats
+        assert stats['pairs'] == len(self.record_pairs)
+        assert 0 < stats['pruned'] < stats['pairs']
+        assert self.data_model.cascade_stats['pairs'] == 0
+
+        # without a minimum score, nothing can be pruned
+        assert len(dedupe.core.scoreRecordPairs(self.record_pairs,
+                                                self.cascaded_data_model,
+                                                self.classifier)) == len(self.record_pairs)
+        assert self.cascaded_data_model.cascade_stats == stats
+
+
+def nameScorer():
+    '''
+    A data model and classifier that score names, with a classifier
+    of their own instead of the one matchers share
+    '''
+    data_model = dedupe.Dedupe([{'field': "name", 'type': 'String'}]).data_model
+    classifier = rlr.RegularizedLogisticRegression()
+    classifier.weights = [-1.0302742719650269]
+    classifier.bias = 4.76
+
+    return data_model, classifier
+
+
+class NameScoringTest(unittest.TestCase):
+    def setUp(self):
+        self.data_model, self.classifier = nameScorer()
+
+        names = ['Margret', 'Marga', 'Maria', 'Monica', 'Mira', 'Mona']
+        self.records = [(str(i), {'name': name})
+                        for i, name in enumerate(names)]
+        self.index_pairs = [(0, 1), (1, 2), (3, 4), (4, 5)]
+
+
+class ScoringPoolTest(NameScoringTest):
+    def test_score(self):
+        index_pairs = self.index_pairs
+        record_pairs = [(self.records[i], self.records[j])
+                        for i, j in index_pairs]
+
+        expected = dedupe.core.scoreIndexedDuplicates(iter(index_pairs),
+                                                      self.records,
+                                                      self.data_model,
+                                                      self.classifier)
+
+        with dedupe.core.ScoringPool(self.data_model,
+                                     self.classifier,
+                                     2) as pool:
+            # the pool is reused across calls
+            for _ in range(2):
+                scheduler = dedupe.core.ChunkScheduler(chunk_size=1)
+                scores = dedupe.core.scoreIndexedDuplicates(iter(index_pairs),
+                                                            self.records,
+                                                            self.data_model,
+                                                            self.classifier,
+                                                            scheduler=scheduler,
+                                                            executor=pool)
+
+                numpy.testing.assert_equal(scores['pairs'],
+                                           expected['pairs'])
+                numpy.testing.assert_allclose(scores['score'],
+                                              expected['score'])
+                assert scheduler.seconds_per_pair is not None
+
+            scores = dedupe.core.scoreDuplicates(iter(record_pairs),
+                                                 self.data_model,
+                                                 self.classifier,
+                                                 min_score=0.5,
+                                                 executor=pool)
+            assert scores['pairs'].tolist() == [['0', '1'],
+                                                ['1', '2'],
+                                                ['3', '4'],
+                                                ['4', '5']]
+
+            blocks = [record_pairs[:2], record_pairs[2:]]
+            scheduler = dedupe.core.ChunkScheduler(chunk_size=1)
+            scored_blocks = list(dedupe.core.scoreGazette(iter(blocks),
+                                                          self.data_model,
+                                                          self.classifier,
+                                                          n_matches=1,
+                                                          scheduler=scheduler,
+                                                          executor=pool))
+            assert [len(block) for block in scored_blocks] == [1, 1]
+            assert scheduler.pairs_per_block == 2
+
+
+class ExecutorTest(NameScoringTest):
+    def test_executors(self):
+        import concurrent.futures
+
+        expected = dedupe.core.scoreIndexedDuplicates(iter(self.index_pairs),
+                                                      self.records,
+                                                      self.data_model,
+                                                      self.classifier)
+
+        process_pool = concurrent.futures.ProcessPoolExecutor(2)
+        state = dedupe.core.WorkerState(self.data_model, self.classifier)
+        preloaded_pool = concurrent.futures.ProcessPoolExecutor(
+            2,
+            initializer=dedupe.core.preloadWorkerState,
+            initargs=state.initargs)
+        executors = [dedupe.core.SerialExecutor(),
+                     dedupe.core.ThreadExecutor(2),
+                     dedupe.core.FuturesExecutor(process_pool),
+                     dedupe.core.FuturesExecutor(preloaded_pool, state=state)]
+
+        for executor in executors:
+            with executor:
+                scores = dedupe.core.scoreIndexedDuplicates(iter(self.index_pairs),
+                                                            self.records,
+                                                            self.data_model,
+                                                            self.classifier,
+                                                            scheduler=dedupe.core.ChunkScheduler(chunk_size=1),
+                                                            executor=executor)
+
+            numpy.testing.assert_equal(scores['pairs'], expected['pairs'])
+            numpy.testing.assert_allclose(scores['score'], expected['score'])
+
+        process_pool.shutdown()
+        preloaded_pool.shutdown()
+
+        # only the token of a preloaded state is sent with each call
+        assert executors[-1].state(self.data_model, self.classifier) is state
+        assert state.__getstate__() == (state.token, None)
+
+    def test_score_gazette_async(self):
+        import asyncio
+
+        record_pairs = [(self.records[i], self.records[j])
+                        for i, j in self.index_pairs]
+        blocks = [record_pairs[:2], record_pairs[2:]]
+
+        expected = list(dedupe.core.scoreGazette(iter(blocks),
+                                                 self.data_model,
+                                                 self.classifier))
+
+        async def score(executor):
+            return [scored async for scored
+                    in dedupe.core.scoreGazetteAsync(iter(blocks),
+                                                     self.data_model,
+                                                     self.classifier,
+                                                     executor)]
+
+        loop = asyncio.new_event_loop()
+        try:
+            for executor in (None, dedupe.core.ThreadExecutor(2)):
+                scored_blocks = loop.run_until_complete(score(executor))
+                assert len(scored_blocks) == len(expected)
+                for scored, desired in zip(scored_blocks, expected):
+                    numpy.testing.assert_equal(scored, desired)
+        finally:
+            loop.close()
+
+    def test_read_blocks_async(self):
+        import asyncio
+
+        record_pairs = [(self.records[i], self.records[j])
+                        for i, j in self.index_pairs]
+        blocks = [[pair] for pair in record_pairs] * 10
+
+        expected = list(dedupe.core.scoreGazette(iter(blocks),
+                                                 self.data_model,
+                                                 self.classifier))
+
+        read = []
+
+        def make_blocks():
+            for block in blocks:
+                read.append(block)
+                yield block
+
+        async def score():
+            scheduler = dedupe.core.ChunkScheduler(chunk_size=1,
+                                                   adaptive=False)
+            scored_blocks = []
+            async for scored in dedupe.core.scoreGazetteAsync(
+                    dedupe.core.readBlocksAsync(make_blocks(), scheduler),
+                    self.data_model,
+                    self.classifier,
+                    scheduler=scheduler):
+                if not scored_blocks:
+                    # blocks are read as they're scored, not all first
+                    assert len(read) < len(blocks)
+                scored_blocks.append(scored)
+            return scored_blocks
+
+        loop = asyncio.new_event_loop()
+        try:
+            scored_blocks = loop.run_until_complete(score())
+        finally:
+            loop.close()
+
+        assert len(scored_blocks) == len(expected)
+        for scored, desired in zip(scored_blocks, expected):
+            numpy.testing.assert_equal(scored, desired)
+
+    def test_stop_early(self):
+        import asyncio
+        import time
+
+        record_pairs = [(self.records[i], self.records[j])
+                        for i, j in self.index_pairs]
+        blocks = [[pair] for pair in record_pairs]
+
+        async def first(executor):
+            async for scored in dedupe.core.scoreGazetteAsync(iter(blocks),
+                                                              self.data_model,
+                                                              self.classifier,
+                                                              executor):
+                return scored
+
+        loop = asyncio.new_event_loop()
+        executor = dedupe.core.ProcessExecutor(1)
+        try:
+            loop.run_until_complete(first(executor))
+
+            # a call that is cancelled while it runs must not break
+            # the calls that are submitted after it
+            executor.submit(time.sleep, 0.5).cancel()
+            assert executor.submit(abs, -1).result(timeout=10) == 1
+        finally:
+            loop.close()
+
+        executor.close()
+
+    def test_imap_stop_early(self):
+        import time
+
+        calls = []
+
+        def call(item):
+            calls.append(item)
+            time.sleep(0.1)
+            return item
+
+        executor = dedupe.core.ThreadExecutor(1)
+        results = executor.imap(call, range(10))
+        assert next(results) == 0
+        results.close()
+        executor.close()
+
+        # the call that was running finishes, the queued ones don't
+        assert calls == [0, 1]
+
+    def test_errors(self):
+        def fail(item):
+            raise ValueError(item)
+
+        executor = dedupe.core.SerialExecutor()
+        with self.assertRaises(ValueError):
+            list(executor.imap(fail, [1, 2]))
+
+    def test_worker_state(self):
+        import pickle
+
+        state = dedupe.core.WorkerState(self.data_model, self.classifier)
+        payload = pickle.dumps(state)
+
+        # unpickling the same state twice reuses the first copy
+        first = pickle.loads(payload)
+        second = pickle.loads(payload)
+        assert first.data_model is second.data_model
+        assert first.data_model is not self.data_model
+
+
+class ChunkSchedulerTest(unittest.TestCase):
+    def test_observe(self):
+        scheduler = dedupe.core.ChunkScheduler(target_duration=1.0,
+                                               min_chunk_size=10,
+                                               max_chunk_size=1000)
+
+        scheduler.observe(100, 1.0)
+        assert scheduler.chunk_size == 100
+
+        scheduler.observe(100, 0.0001)
+        first_resize = scheduler.chunk_size
+        assert 100 < first_resize < 1000
+
+        scheduler.observe(100, 0.0001)
+        assert first_resize < scheduler.chunk_size <= 1000
+
+        scheduler.observe(1, 1000)
+        assert scheduler.chunk_size == 10
+
+        scheduler = dedupe.core.ChunkScheduler(chunk_size=50, adaptive=False)
+        scheduler.observe(100, 1.0)
+        assert scheduler.chunk_size == 50
+        assert scheduler.settings['seconds_per_pair'] == 0.01
+
+    def test_blocks_per_task(self):
+        scheduler = dedupe.core.ChunkScheduler(chunk_size=100,
+                                               adaptive=False)
+        assert scheduler.blocks_per_task == 100
+
+        scheduler.observe_blocks(10, 50, 1.0)
+        assert scheduler.blocks_per_task == 20
+
+    def test_score_duplicates(self):
+        scheduler = dedupe.core.ChunkScheduler(chunk_size=2)
+
+        data_model, classifier = nameScorer()
+
+        records = iter([((str(i), {'name': 'Margret'}),
+                         (str(i + 1), {'name': 'Marga'}))
+                        for i in range(10)])
+
+        scores = dedupe.core.scoreDuplicates(records,
+                                             data_model,
+                                             classifier,
+                                             scheduler=scheduler)
+
+        assert len(scores) == 10
+        assert scheduler.seconds_per_pair is not None
+
+
+class ScoreSinkTest(unittest.TestCase):
+    def test_write(self):
+        import multiprocessing.dummy
+
+        sink = dedupe.core.ScoreSink(multiprocessing.dummy.Lock(),
+                                     multiprocessing.dummy.Value('q', 0))
+
+        dtype = numpy.dtype([('pairs', int, 2), ('score', 'f4')])
+        first = numpy.array([((1, 2), 0.5), ((1, 3), 0.25)], dtype=dtype)
+        second = numpy.array([((4, 5), 0.75)], dtype=dtype)
+
+        sink.write(first)
+        sink.write(second)
+
+        scored_pairs = sink.scored_pairs(dtype)
+        numpy.testing.assert_equal(scored_pairs,
+                                   numpy.concatenate([first, second]))
+
+        del scored_pairs
+        sink.remove()
+
 
 class FieldDistances(unittest.TestCase):
 
@@ -153,6 +643,206 @@ class FieldDistances(unittest.TestCase):
                                                              [0, 0, 0, 1, 0]]),
                                                 3)
 
+    def test_batch_comparator(self):
+        calls = []
+
+        def difference(values_1, values_2):
+            calls.append(len(values_1))
+            return numpy.abs(numpy.array(values_1) - numpy.array(values_2))
+
+        deduper = dedupe.Dedupe([{'field': 'name',
+                                  'type': 'Exact'},
+                                 {'field': 'age',
+                                  'type': 'Custom',
+                                  'comparator': difference,
+                                  'batch': True,
+                                  'has missing': True}])
+
+        record_pairs = (({'name': 'a', 'age': 1}, {'name': 'a', 'age': 3}),
+                        ({'name': 'a', 'age': None}, {'name': 'b', 'age': 3}),
+                        ({'name': 'b', 'age': 5}, {'name': 'b', 'age': 4}))
+
+        numpy.testing.assert_array_almost_equal(deduper.data_model.distances(record_pairs),
+                                                numpy.array([[1, 2, 1],
+                                                             [0, 0, 0],
+                                                             [1, 1, 1]]),
+                                                3)
+
+        # one call, for just the pairs without missing values
+        assert calls == [2]
+
+    def test_batch_kernels(self):
+        fields = [{'field': 'name', 'type': 'Exact'},
+                  {'field': 'price', 'type': 'Price'},
+                  {'field': 'location', 'type': 'LatLong'},
+                  {'field': 'type', 'type': 'Categorical',
+                   'categories': ['a', 'b', 'c']}]
+        data_model = dedupe.datamodel.DataModel(fields)
+
+        records = [{'name': 'a', 'price': 10, 'location': (42.3, -71.1),
+                    'type': 'a'},
+                   {'name': 'a', 'price': 0, 'location': (40.7, -74.0),
+                    'type': 'c'},
+                   {'name': 'b', 'price': 25.5, 'location': (42.3, -71.1),
+                    'type': 'b'},
+                   {'name': None, 'price': 3, 'location': None,
+                    'type': 'c'}]
+        record_pairs = list(itertools.combinations(records, 2))
+
+        expected = []
+        for record_1, record_2 in record_pairs:
+            row = []
+            for field in data_model.primary_fields:
+                value_1, value_2 = record_1[field.field], record_2[field.field]
+                if value_1 is None or value_2 is None:
+                    row.extend([numpy.nan] * len(field))
+                else:
+                    row.extend(numpy.ravel(field.comparator(value_1, value_2)))
+            expected.append(row)
+
+        expected = numpy.nan_to_num(numpy.array(expected, 'f4'))
+        numpy.testing.assert_allclose(data_model.distances(record_pairs),
+                                      expected,
+                                      rtol=1e-5)
+
+        categorical = data_model.primary_fields[3]
+        with self.assertRaises(ValueError):
+            categorical.batch_comparator(['a'], ['d'])
+
+    def test_comparator_cache(self):
+        fields = [{'field': 'name', 'type': 'ShortString'},
+                  {'field': 'type', 'type': 'Categorical',
+                   'categories': ['a', 'b']}]
+        cached_fields = [dict(field, cache=True) for field in fields]
+
+        record_pairs = (({'name': 'steven', 'type': 'a'},
+                         {'name': 'stephen', 'type': 'b'}),
+                        ({'name': 'stephen', 'type': 'b'},
+                         {'name': 'steven', 'type': 'a'}),
+                        ({'name': 'steven', 'type': 'a'},
+                         {'name': 'stephen', 'type': 'b'}))
+
+        data_model = dedupe.Dedupe(fields).data_model
+        # Categorical compares whole columns, which can't be cached
+        with self.assertWarns(UserWarning):
+            cached_data_model = dedupe.Dedupe(cached_fields).data_model
+
+        numpy.testing.assert_array_almost_equal(cached_data_model.distances(record_pairs),
+                                                data_model.distances(record_pairs))
+
+        stats = cached_data_model.comparator_cache_stats
+        # the third pair is the same as the first, so it's only
+        # compared once, and the second pair is the first pair
+        # backwards, which the cache has already seen
+        assert stats['(name: ShortString)']['hits'] == 1
+        assert stats['(name: ShortString)']['entries'] == 1
+
+        assert list(stats) == ['(name: ShortString)']
+        assert data_model.comparator_cache_stats == {}
+
+    def test_comparator_cache_budget(self):
+        cache = dedupe.datamodel.ComparatorCache(lambda x, y: x == y,
+                                                 max_bytes=1000)
+
+        for i in range(100):
+            cache(i, i)
+
+        assert 0 < cache.stats['entries'] < 100
+        assert cache.stats['bytes'] <= 1000
+
+        # unhashable values are compared, but not cached
+        assert cache([1], [1])
+        assert cache.stats['misses'] == 100
+
+    def test_comparator_cache_threads(self):
+        import concurrent.futures
+
+        cache = dedupe.datamodel.ComparatorCache(lambda x, y: x == y,
+                                                 max_bytes=5000)
+
+        def compare(start):
+            for i in range(start, start + 2000):
+                cache(i % 300, i % 300)
+
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            list(executor.map(compare, range(0, 8000, 1000)))
+
+        # threads sharing a cache keep its accounting right
+        stats = cache.stats
+        assert stats['hits'] + stats['misses'] == 16000
+        assert stats['bytes'] == sum(cache._size(key, result)
+                                     for key, result
+                                     in cache._results.items())
+        assert stats['bytes'] <= 5000
+
+    def test_unique_field_distances(self):
+        calls = []
+
+        def compare(x, y):
+            calls.append((x, y))
+            return abs(x - y)
+
+        values_1 = [1, 2, 1, None, 1]
+        values_2 = [3, 3, 3, 3, 3]
+
+        distances = dedupe.datamodel.uniqueFieldDistances(compare,
+                                                          values_1,
+                                                          values_2,
+                                                          1)
+
+        numpy.testing.assert_array_equal(distances,
+                                         [[2], [1], [2], [numpy.nan], [2]])
+        assert sorted(calls) == [(1, 3), (2, 3)]
+
+        # if the pairs hardly repeat, they are all compared
+        calls.clear()
+        values_1 = list(range(20)) + [0]
+        values_2 = [0] * 21
+        dedupe.datamodel.uniqueFieldDistances(compare, values_1, values_2, 1)
+        assert len(calls) == 21
+
+    def test_prepared_features(self):
+        corpus = ['the quick brown fox', 'the lazy dog', 'a brown dog']
+        fields = [{'field': 'name', 'type': 'Text', 'corpus': corpus},
+                  {'field': 'tags', 'type': 'Set',
+                   'corpus': [('a', 'b'), ('b', 'c'), ('c',)]}]
+        data_model = dedupe.datamodel.DataModel(fields)
+
+        records = [{'name': 'the quick brown fox', 'tags': ('a', 'b')},
+                   {'name': 'the brown dog', 'tags': ('b', 'c')},
+                   {'name': None, 'tags': ('c',)},
+                   {'name': 'lazy dog dog', 'tags': ('a', 'b')}]
+        record_pairs = [(records[0], records[1]),
+                        (records[1], records[3]),
+                        (records[0], records[2]),
+                        (records[3], records[0])]
+
+        text = dedupe.variables.string.CosineTextSimilarity(corpus)
+        tags = dedupe.variables.set.CosineSetSimilarity(fields[1]['corpus'])
+        expected = [[text(r_1['name'], r_2['name'])
+                     if r_1['name'] and r_2['name'] else 0,
+                     tags(r_1['tags'], r_2['tags'])]
+                    for r_1, r_2 in record_pairs]
+
+        assert data_model.has_features
+        distances = data_model.distances(record_pairs)
+        numpy.testing.assert_allclose(distances, expected)
+
+        prepared = [data_model.prepare(record) for record in records]
+        assert prepared[0]['name'] == records[0]['name']
+        assert prepared[2][('features', '(name: Text)')] is None
+        prepared_pairs = [(prepared[0], prepared[1]),
+                          (prepared[1], prepared[3]),
+                          (prepared[0], prepared[2]),
+                          (prepared[3], prepared[0])]
+        numpy.testing.assert_allclose(data_model.distances(prepared_pairs),
+                                      expected)
+
+        exact = dedupe.datamodel.DataModel([{'field': 'name',
+                                             'type': 'Exact'}])
+        assert not exact.has_features
+        assert exact.prepare(records[0]) is records[0]
+
     def test_comparator_interaction(self):
         deduper = dedupe.Dedupe([{'field': 'type',
                                   'variable name': 'type',
@@ -73,6 +73,20 @@ class DataModelTest(unittest.TestCase):
 
         assert data_model._missing_field_indices == []
 
+    def test_field_comparators(self):
+        import pickle
+
+        data_model = dedupe.datamodel.DataModel([{'field': 'a',
+                                                  'type': 'String'}])
+
+        # the comparators are built once, and not pickled
+        comparators = data_model._field_comparators
+        assert data_model._field_comparators is comparators
+        assert '_comparators' not in data_model.__getstate__()
+
+        unpickled = pickle.loads(pickle.dumps(data_model))
+        assert unpickled._field_comparators == comparators
+
 
 class ConnectedComponentsTest(unittest.TestCase):
     def test_components(self):
@@ -194,6 +208,18 @@ class ClusteringTest(unittest.TestCase):
                                                                     (b'4', b'5'))
         assert list(zip(*hierarchical(self.str_dupes, 0)))[0] == ((b'1', b'2', b'3', b'4', b'5'),)
 
+    def test_hierarchical_executor(self):
+        hierarchical = dedupe.clustering.cluster
+        expected = list(hierarchical(self.dupes, 0.5))
+
+        for executor in (dedupe.core.SerialExecutor(),
+                         dedupe.core.ThreadExecutor(2)):
+            with executor:
+                assert self.clusterEquals(list(hierarchical(self.dupes,
+                                                            0.5,
+                                                            executor=executor)),
+                                          expected)
+
     def test_greedy_matching(self):
         greedyMatch = dedupe.clustering.greedyMatching
 
@@ -227,6 +253,28 @@ class ClusteringTest(unittest.TestCase):
         assert [tuple((tuple(pair), score) for pair, score in each.tolist())
                 for each in gazetteMatch(blocked_dupes, n_matches=2)] == target
 
+    def test_cluster_diff(self):
+        old_clusters = [((1, 2), (0.9, 0.9)),
+                        ((3, 4, 5), (0.8, 0.8, 0.8)),
+                        ((6, 7), (0.7, 0.7)),
+                        ((8,), (1.0,))]
+        # 9 and 10 are new, and cluster 3, 4, 5 split into two
+        new_clusters = [((1, 2, 9), (0.9, 0.9, 0.9)),
+                        ((3, 4), (0.8, 0.8)),
+                        ((5,), (1.0,)),
+                        ((8,), (1.0,)),
+                        ((10,), (1.0,))]
+
+        diff = dedupe.clustering.clusterDiff(old_clusters,
+                                             {0, 1, 3},
+                                             new_clusters)
+
+        assert diff.clusters == old_clusters[2:3] + new_clusters
+        assert diff.unchanged == [old_clusters[2], old_clusters[3]]
+        assert diff.merged == [([old_clusters[0]], new_clusters[0])]
+        assert diff.split == [(old_clusters[1], new_clusters[1:3])]
+        assert diff.new == [new_clusters[4]]
+
 
 class PredicatesTest(unittest.TestCase):
     def test_predicates_correctness(self):
@@ -1,4 +1,7 @@
 import unittest
+
+import numpy
+
 from dedupe.variables.price import PriceType
 
 
@@ -6,3 +9,11 @@ class TestPrice(unittest.TestCase):
     def test_comparator(self):
         assert PriceType.comparator(1, 10) == 1
         assert PriceType.comparator(10, 1) == 1
+
+    def test_batch_comparator(self):
+        prices_1 = [1, 10, 0, 5, -3]
+        prices_2 = [10, 1, 7, 5, 2]
+        distances = PriceType.batch_comparator(prices_1, prices_2)
+        expected = [PriceType.comparator(price_1, price_2)
+                    for price_1, price_2 in zip(prices_1, prices_2)]
+        numpy.testing.assert_allclose(distances, expected)